@@ -5,16 +5,33 @@ Ultimately, it does 4 things:
     2. Determines which type of disassembly to conduct (new or existing)
     3. Launches a disassembly Strategy
     4. Launches each default Parser listed in the 'parsers' directory
+
+An existing disassembly can be changed incrementally: a range of it is
+disassembled again, recursively, and only the records, strings, xrefs and
+stats of that range are replaced.
 '''
 
-from disassembler_libs import binhandler, disassembly
-from disassembler_libs.dbmanager import DBManager
-from disassembler_libs import logger
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from disassembler_libs import bindiff, binhandler, disassembly
+from disassembler_libs.dbmanager import DBManager, generate_db_manager
+from disassembler_libs import logger, metrics
+from disassembler_libs.executor import make_executor
+from disassembler_libs.string import String
+from strategies.auto import Auto
 from strategies.linear import Linear
 from strategies.recursive import Recursive
 from predisassemblers import predisassembler
+from parsers.blockhashparser import (find_function_hashes,
+                                     load_function_hashes)
+from parsers.callgraphparser import build_call_graph
+from parsers.fingerprintparser import build_fingerprints
+from parsers.stringparser import find_record_strings
+from parsers.xrefparser import XrefFinder
 import parsers
+import collections
 import sys
+import time
 import ntpath
 
 
@@ -37,6 +54,21 @@ class UnknownDisassembler(Exception):
         Exception.__init__(self, message)
 
 
+class NoDisassemblyInfo(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+class UnknownRecord(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+class InvalidRange(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
 class Disassembler:
 
     ##################################
@@ -50,18 +82,22 @@ class Disassembler:
         self.db_man = DBManager(host, port)
         self.project_name = project_name
         self.bin_path = binpath
-        self.binary_name = ntpath.basename(binpath)
+        self.binary_name = None
         self.disassembly_name = disassembly_name
         self.handler = None
         self.config = config
         self.disassembly = None
+        self.executor = None
 
         self.log = logger.getLogger(__name__, self.config)
 
+        if binpath is None and not self.db_man.project_exists(project_name):
+            raise NoProjectInfo('Project %s doesn\'t exist' % project_name)
         self.db_man.load_project(self.project_name)
 
         # If we're given a binary path then this is a new disassembly
         if binpath is not None:
+            self.binary_name = ntpath.basename(binpath)
             self.handler = binhandler.BinHandler(binpath=binpath)
             self.disassembly = self.create_disassembly(self.handler)
             good_insert = self.db_man.add_disassembly(self.disassembly)
@@ -76,15 +112,15 @@ class Disassembler:
                                                 'disassembly by that '
                                                 'name already exists!'))
 
-        # Otherwise, this is an existing disassembly
+        # Otherwise, this is an existing disassembly, which is read back
+        # from the database rather than the binary
         else:
-            if not self.db_man.project_exists(self.project_name):
-                raise NoProjectInfo('Project %s doesn\'t exist' % project_name)
-            h = binhandler.BinHandler(db=self.db_man,
-                                      project_name=self.project_name)
-            self.handler = h
-
-            self.disassembly = self.create_disassembly(self.handler)
+            if not self.db_man.dissassembly_exists(disassembly_name):
+                raise NoDisassemblyInfo('Disassembly %s doesn\'t exist'
+                                        % disassembly_name)
+            self.db_man.load_disassembly(disassembly_name)
+            self.disassembly = self.db_man.get_disassembly()
+            self.binary_name = self.disassembly.binary_name
 
     def create_disassembly(self, handler):
         return disassembly.Disassembly(self.disassembly_name,
@@ -101,6 +137,63 @@ class Disassembler:
     ##################################
 
     def disassemble_file(self):
+        self._run(self._disassemble_file)
+
+    def _run(self, work, *args):
+        """Runs some work on a new executor, recording the run's metrics.
+
+        :work: The method to run
+        :args: The arguments to call it with
+        :returns: None
+
+        """
+        # One executor, and so at most one pool of workers, for the whole run
+        self.executor = make_executor(self.config)
+        metrics.reset()
+        started = time.time()
+        error = None
+        try:
+            with metrics.span('run'):
+                work(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.executor.close()
+            if self.executor.profiler is not None:
+                out_dir = self.executor.profiler.write_report()
+                self.log.info('Wrote profiles to %s' % out_dir)
+            self.record_run(started, error)
+
+    def record_run(self, started, error=None):
+        """Writes the metrics of a run where the config asks for them.
+
+        :started: When the run started, in seconds since the epoch
+        :error: The exception that ended the run, if it failed
+        :returns: The record of the run
+
+        """
+        run = {'project': self.project_name,
+               'disassembly': self.disassembly_name,
+               'binary': self.binary_name,
+               'strategy': self.config.get('Disassembler', 'strategy'),
+               'executor': type(self.executor).__name__,
+               'num_workers': self.executor.num_workers,
+               'started': started,
+               'finished': time.time(),
+               'status': 'ok' if error is None else 'failed',
+               'error': None if error is None else str(error),
+               'metrics': metrics.snapshot()}
+
+        metrics_dir = self.config.get('Debugging', 'metrics_dir')
+        if metrics_dir != '':
+            path = metrics.write_run(metrics_dir, run)
+            self.log.info('Wrote metrics to %s' % path)
+        if self.config.getboolean('Debugging', 'metrics_to_db'):
+            self.db_man.add_run(run)
+        return run
+
+    def _disassemble_file(self):
         sections = self.handler.get_sections()
 
         predis = predisassembler.make_predisassembler(self.config,
@@ -109,10 +202,18 @@ class Disassembler:
                                                        self.handler)
         entry_points = [self.handler.get_entry_point()]
         try:
-            ret = predis.run()
+            with self.executor.phase('predisassemble'):
+                ret = predis.run()
             if ret != None:
+                # Every seed is handed to the strategy at once so that
+                # parallel strategies have work for every worker up front
+                seen = set(entry_points)
                 for x in ret:
-                    entry_points.append(x)
+                    if x not in seen:
+                        seen.add(x)
+                        entry_points.append(x)
+                self.log.info('Seeding disassembly with %d entry points'
+                              % len(entry_points))
         except Exception as e:
             self.log.error("Predisassembler returned %s" % str(e))
             import traceback
@@ -126,36 +227,251 @@ class Disassembler:
             strat = Linear(self.project_name, self.disassembly_name,
                            self.config, sections,
                            self.handler.get_arch(), self.handler.get_mode(),
-                           entry_points)
+                           entry_points, self.executor)
         elif strat_name == 'recursive':
             strat = Recursive(self.project_name, self.disassembly_name,
                               self.config, sections,
                               self.handler.get_arch(), self.handler.get_mode(),
-                              entry_points)
+                              entry_points, self.executor)
+        elif strat_name == 'auto':
+            strat = Auto(self.project_name, self.disassembly_name,
+                         self.config, sections,
+                         self.handler.get_arch(), self.handler.get_mode(),
+                         entry_points, self.executor)
         else:
             raise UnknownDisassembler()
 
         # PARSER TESTING - COMMENT THIS LINE
         strat.disassemble()
 
+        # Labels found before disassembling can only be added now that
+        # the strategy has added the sections they belong to
+        try:
+            with self.executor.phase('persist_predisassembly'):
+                predis.persist()
+        except Exception as e:
+            self.log.error("Predisassembler failed to persist %s" % str(e))
+            import traceback
+            traceback.print_exc()
+
         # do some extra parsing
         disable_parse = self.config.getboolean('Debugging', 'disable_parsers')
         if not disable_parse:
             self.do_parsers()
 
-    def disassemble_string(self, string_val):
-        self.log.error('Not Implemented!')
-        pass
+        # Readers page through the disassembly by row, so index it up front
+        # rather than on the first request from the UI
+        with self.executor.phase('row_index'):
+            for sec in sections:
+                self.db_man.build_row_index(sec.name)
+
+    def disassemble_string(self, record_ids):
+        """Converts data to text, starting from some records.
+
+        Each record's run of data - everything between the instructions
+        either side of it - is disassembled again recursively from the
+        record, so code it flows into is converted too.
+
+        :record_ids: A list of the _id's of disassembler records, as
+                     ObjectIds or their hex strings
+        :returns: None
+
+        """
+        ranges = {}
+        for rec_id in record_ids:
+            try:
+                found = self.db_man.get_record_addr(ObjectId(rec_id))
+            except InvalidId:
+                found = None
+            if found is None:
+                raise UnknownRecord('No record with _id %s' % rec_id)
+
+            sec_name, addr = found
+            start, end = self.db_man.get_data_run_bounds(sec_name, addr)
+            if not start <= addr < end:
+                self.log.info('Record %s is already text' % rec_id)
+                continue
+            key = (sec_name, start, end)
+            if key not in ranges:
+                ranges[key] = []
+            ranges[key].append(addr)
+
+        self._run(self._disassemble_ranges,
+                  [key + (seeds,) for key, seeds in sorted(ranges.items())])
+
+    def disassemble_range(self, start_addr, end_addr):
+        """Disassembles an address range again, recursively from its start.
+
+        Instructions already in the range are kept where the new code
+        doesn't run over them.
+
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive)
+        :returns: None
+
+        """
+        sec = self.db_man.get_section_containing_addr(start_addr)
+        if (start_addr >= end_addr or sec is None or
+                end_addr > sec.base_addr + sec.size):
+            raise InvalidRange('0x%x-0x%x isn\'t a range within a section'
+                               % (start_addr, end_addr))
+        self._run(self._disassemble_ranges,
+                  [(sec.name, start_addr, end_addr, [start_addr])])
+
+    def _disassemble_ranges(self, ranges):
+        """Disassembles ranges again and replaces everything they held.
+
+        :ranges: A list of (sec_name, start_addr, end_addr, seeds) tuples
+                 of absolute addresses
+        :returns: None
+
+        """
+        sections = list(self.db_man.get_sections())
+        strat = Recursive(self.project_name, self.disassembly_name,
+                          self.config, sections, self.disassembly.architecture,
+                          self.disassembly.mode, [], self.executor)
+        min_length = self.config.getint('StringParser', 'min_string_length')
+
+        for sec_name, start_addr, end_addr, seeds in ranges:
+            sec = [x for x in sections if x.name == sec_name][0]
+            start_addr, end_addr = self.db_man.get_record_bounds(
+                sec_name, start_addr, end_addr)
+            start = start_addr - sec.base_addr
+            end = end_addr - sec.base_addr
+            self.log.info('Disassembling %s 0x%x-0x%x again'
+                          % (sec_name, start_addr, end_addr))
+
+            # Code that was already found is kept unless the new code
+            # overlaps it
+            seeds = [x - sec.base_addr for x in seeds]
+            for inst in self.db_man.get_records_in_addr_range(
+                    sec_name, start_addr, end_addr, ['addr']):
+                if inst.is_text:
+                    seeds.append(inst.r_addr - sec.base_addr)
+
+            with self.executor.phase('decode'):
+                insts = list(strat.iter_range(sec, start, end, seeds))
+
+            # As with the StringParser, only data sections hold strings
+            strings = []
+            if not sec.is_executable():
+                insts, strings = find_record_strings(insts, min_length)
+            strings = [String(x.name, x.addr, sec_name) for x in strings]
+
+            # Operands are given their xrefs before they're written
+            with self.executor.phase('xrefs'):
+                finder = XrefFinder(sections, self.disassembly.architecture,
+                                    self.disassembly.mode,
+                                    self.db_man.get_strings() + strings)
+                xrefs = []
+                for inst in insts:
+                    for op, xref in finder.find(sec_name, inst):
+                        op['xref'] = xref.ref_loc
+                        xrefs.append(xref)
+
+            with self.executor.phase('replace'):
+                self.db_man.replace_range(sec_name, start, end, insts)
+                self.db_man.remove_strings_in_addr_range(sec_name, start, end)
+                self.db_man.batch_add_labels(strings)
+                self.db_man.remove_xrefs_in_addr_range(sec_name, start_addr,
+                                                       end_addr)
+                self.db_man.batch_upsert_locations([x.ref_loc for x in xrefs])
+                self.db_man.batch_add_xrefs(xrefs)
+
+            with self.executor.phase('row_index'):
+                self.db_man.build_row_index(sec_name)
+
+        # Calls, blocks and functions may have come or gone with the code,
+        # so whatever was made from them is made again if it was there
+        touched = set(x[0] for x in ranges)
+        if not any(x.is_executable() for x in sections if x.name in touched):
+            return
+        if self.db_man.has_call_graph():
+            with self.executor.phase('call_graph'):
+                self.db_man.set_call_graph(build_call_graph(self.config,
+                                                            self.db_man))
+        if self.db_man.has_function_hashes():
+            with self.executor.phase('block_hashes'):
+                self.db_man.set_function_hashes(
+                    find_function_hashes(self.config, self.db_man))
+        if self.db_man.has_fingerprints():
+            with self.executor.phase('fingerprints'):
+                self.db_man.set_fingerprints(
+                    build_fingerprints(self.config, self.db_man),
+                    self.config.getint('FingerprintParser', 'bands'))
 
     def _get_dis_strategy(self):
         return self.config.get('Disassembler', 'strategy')
 
+    ##################################
+    # Diffing
+    ##################################
+
+    def diff_disassembly(self, other_name):
+        """Diffs this disassembly against another of the same project.
+
+        This disassembly is taken to be the older one, so functions only
+        found in the other were added and those only found in this one
+        were removed. The result is stored in the database.
+
+        :other_name: The name of the other disassembly
+        :returns: None
+
+        """
+        if not self.db_man.dissassembly_exists(other_name):
+            raise NoDisassemblyInfo('Disassembly %s doesn\'t exist'
+                                    % other_name)
+        self._run(self._diff_disassembly, other_name)
+
+    def _diff_disassembly(self, other_name):
+        """Matches up the functions of two disassemblies and stores them.
+
+        :other_name: The name of the other disassembly
+        :returns: None
+
+        """
+        names = [self.disassembly_name, other_name]
+
+        # Hashes made while parsing are reused, and the two sides are
+        # hashed in parallel where they weren't
+        with self.executor.phase('block_hashes'):
+            for name in names:
+                self.executor.submit(load_function_hashes, self.config,
+                                     self.project_name, name,
+                                     idempotent=True)
+            hashes = self.executor.wait()
+
+        graphs = []
+        with self.executor.phase('call_graph'):
+            for name in names:
+                db_man = generate_db_manager(self.config, self.project_name,
+                                             name)
+                graph = db_man.get_call_graph()
+                if graph is None:
+                    graph = build_call_graph(self.config, db_man)
+                    db_man.set_call_graph(graph)
+                graphs.append(graph)
+
+        with self.executor.phase('diff'):
+            entries = bindiff.diff(hashes[0] or [], graphs[0],
+                                   hashes[1] or [], graphs[1])
+        with self.executor.phase('store_diff'):
+            self.db_man.set_diff(other_name, entries)
+
+        counts = collections.Counter(x.status for x in entries)
+        self.log.info('Diffed %s against %s: %s'
+                      % (self.disassembly_name, other_name,
+                         ', '.join('%d %s' % (counts[x], x)
+                                   for x in bindiff.DIFF_STATUSES)))
+
     ##################################
     # Parsers
     ##################################
 
     def get_parser_modules(self):
-        modules = {}
+        # Later parsers build on what earlier ones found, so keep the
+        # order of parsers.__all__
+        modules = collections.OrderedDict()
         for module in parsers.__all__:
             __import__('parsers.' + module)
             modules['parsers.' + module] = sys.modules['parsers.' + module]
@@ -167,10 +483,12 @@ class Disassembler:
         for mod in modules:
             parsers.append(modules[mod].make_parser(self.config,
                                                     self.project_name,
-                                                    self.disassembly_name))
+                                                    self.disassembly_name,
+                                                    self.executor))
         return parsers
 
     def do_parsers(self):
         parsers = self.get_parsers()
         for parser in parsers:
-            parser.run()
+            with self.executor.phase(type(parser).__name__):
+                parser.run()
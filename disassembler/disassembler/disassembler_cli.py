@@ -4,7 +4,8 @@ in the desired mode as indicated by the arguments it receives.
 
 Usage:
 ./disassembler_cli.py [-p project_name] [-d disassembly_name]
-                      [[-f file_name] | [-s id1 {id2 id3 ...}]]
+                      [[-f file_name] | [-s id1 {id2 id3 ...}] |
+                       [-r start end] | [-D other_disassembly_name]]
     -p : the name of the project that the disassembly belongs to
     -d : the name of the disassembly itself (this may be different
          from the name of the binary)
@@ -16,11 +17,18 @@ Usage:
     -s : a sequence of database _id fields that should be converted
          from their current format into a disassembled format. This
          should be used for data => text conversions in the disassembly.
+         Disassembly starts at each record and follows control flow
+         recursively through the run of data the record is in.
+         NOTE: This should only be used for existing disassemblies.
+    -r : an absolute address range, start (inclusive) and end (exclusive),
+         to disassemble again recursively from its start. Code already
+         found in the range is kept where the new code doesn't overlap it.
+         NOTE: This should only be used for existing disassemblies.
+    -D : the name of another disassembly of the project to diff this one
+         against. This disassembly is taken to be the older of the two.
+         Functions are matched by the hashes of their basic blocks and the
+         result is stored in the database.
          NOTE: This should only be used for existing disassemblies.
-         TODO: Decide how this will actually work. Do we want _id args?
-               Should we have another flag for 'continue to do disassemble
-               from a given point and follow things recursively'?
-               Big gray area here that we need to deal with eventually.
 Example:
     *   This will create a new disassembly, test_dis, for the project
         test_project. If test_project doesn't exist, then it will be created.
@@ -29,15 +37,20 @@ Example:
     *   This will take an existing disassembly and convert the contents
         of the given database _id's to their equivalent disassemblies.
            ./disassembler_cli.py -p test_project -d test_dis -s 54847e4a1d41c8a51391e58c 54847e4a1d41c8a51391e58f
+    *   This will disassemble 0x400500 up to 0x400580 of that disassembly
+        again, replacing whatever was there.
+           ./disassembler_cli.py -p test_project -d test_dis -r 0x400500 0x400580
+    *   This will diff test_dis against test_dis_v2, a later build of the
+        same binary.
+           ./disassembler_cli.py -p test_project -d test_dis -D test_dis_v2
 '''
 
 import sys
 import argparse
 import ConfigParser
-from cProfile import Profile
-from pstats import Stats
 import disassembler
 from disassembler_libs import logger
+from disassembler_libs.executor import TaskError, TaskTimeout
 
 
 def parse_args():
@@ -52,8 +65,16 @@ def parse_args():
     group.add_argument('-f', '--file', dest='filename',
                        help='disassemble a file')
     group.add_argument('-s', '--string', dest='string_val', nargs='+',
-                       help=('convert data->text for an existing project.'
+                       help=('convert data->text for an existing project. '
                              'requires list of record _id\'s as args'))
+    group.add_argument('-r', '--range', dest='addr_range', nargs=2,
+                       type=lambda x: int(x, 0), metavar=('START', 'END'),
+                       help=('disassemble an address range of an existing '
+                             'project again'))
+    group.add_argument('-D', '--diff', dest='diff_name',
+                       metavar='OTHER_DISASSEMBLY',
+                       help=('diff an existing disassembly against another '
+                             'of the same project'))
 
     return parser.parse_args()
 
@@ -72,11 +93,36 @@ def run(config, args):
                                     binpath=args.filename)
     if args.filename is not None:
         log.info('Starting to disassemble file')
-        dis.disassemble_file()
+        try:
+            dis.disassemble_file()
+        except (TaskError, TaskTimeout) as e:
+            # The remaining workers have already been stopped
+            log.error('Disassembly failed: %s' % str(e))
+            sys.exit(1)
         log.info('Done disassembling file')
 
-    elif args.string_val is not None:
-        dis.start_disassemble_string(host, port, args.string_val)
+    elif args.string_val is not None or args.addr_range is not None:
+        log.info('Starting to disassemble again')
+        try:
+            if args.string_val is not None:
+                dis.disassemble_string(args.string_val)
+            else:
+                dis.disassemble_range(*args.addr_range)
+        except (disassembler.UnknownRecord, disassembler.InvalidRange,
+                TaskError, TaskTimeout) as e:
+            log.error('Disassembly failed: %s' % str(e))
+            sys.exit(1)
+        log.info('Done disassembling again')
+
+    elif args.diff_name is not None:
+        log.info('Starting to diff against %s' % args.diff_name)
+        try:
+            dis.diff_disassembly(args.diff_name)
+        except (disassembler.NoDisassemblyInfo, TaskError,
+                TaskTimeout) as e:
+            log.error('Diff failed: %s' % str(e))
+            sys.exit(1)
+        log.info('Done diffing')
 
     else:
         log.error('Command line error')
@@ -88,23 +134,10 @@ def get_started():
     config = ConfigParser.SafeConfigParser()
     config.read('haevn.conf')
 
-    profiler_on = config.getboolean('Debugging', 'profiler_on')
-
-    if profiler_on:
-        profile = Profile()
-        profile.enable()
-
+    # Profiling ([Debugging] profiler_on) is done by the Disassembler's
+    # executor, so that the work done in pool workers is seen too
     args = parse_args()
-
-    try:
-        run(config, args)
-    finally:
-        if profiler_on:
-            profile.disable()
-            stats = Stats(profile)
-            with open('profile.stats', 'wb') as statsfile:
-                stats.stream = statsfile
-                stats.sort_stats('cumulative').print_stats()
+    run(config, args)
 
 if __name__ == '__main__':
     get_started()
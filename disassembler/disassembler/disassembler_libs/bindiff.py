@@ -0,0 +1,350 @@
+'''
+Diffing of two disassemblies by hashes of their basic blocks.
+
+Each instruction is normalized so that nothing depending on where the code
+was loaded is left - addresses become 'addr', or the callee's name where a
+direct call goes to a named function - and each basic block is hashed from
+its normalized instructions. A function's hash is the hash of its sorted
+block hashes, and its shape the same over the blocks' mnemonics only, so a
+function whose constants or registers changed keeps its shape.
+
+Functions are then matched with hash joins, which take linear time:
+    1. Functions with a hash found only once on each side
+    2. Functions with the same real name on each side
+    3. Functions with a shape found only once on each side
+and the matches are spread along the two call graphs, matching the unmatched
+callers and callees of each matched pair the same way. Whatever is left was
+removed from the first disassembly or added to the second.
+'''
+
+import collections
+import hashlib
+
+# The result for a function
+DIFF_MATCH = 'match'          # In both, unchanged
+DIFF_CHANGED = 'changed'      # In both, but some blocks differ
+DIFF_REMOVED = 'removed'      # Only in the first disassembly
+DIFF_ADDED = 'added'          # Only in the second disassembly
+
+DIFF_STATUSES = [DIFF_MATCH, DIFF_CHANGED, DIFF_REMOVED, DIFF_ADDED]
+
+# How a pair of functions was matched
+VIA_HASH = 'hash'
+VIA_NAME = 'name'
+VIA_SHAPE = 'shape'
+VIA_CALLS = 'calls'
+
+# Stands in for any address in a normalized instruction
+ADDR = 'addr'
+
+# Registers holding the address of the instruction itself
+PC_REGS = set(['rip', 'eip', 'ip', 'pc'])
+
+
+def is_auto_name(name):
+    """Checks whether a function name was made up from its address.
+
+    :name: The function's name
+    :returns: True if it says nothing about the function
+
+    """
+    return name.startswith('sub_')
+
+
+def get_hash(parts):
+    """Hashes a list of strings.
+
+    :parts: The strings, in the order that matters
+    :returns: A 16 digit hex string
+
+    """
+    return hashlib.md5(u'\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_operand(op, is_addr):
+    """Writes an operand without anything that depends on addresses.
+
+    :op: The operand, as processed by the Heuristics
+    :is_addr: A function telling whether a number is an address in the
+              disassembly
+    :returns: A string
+
+    """
+    kind = op.get('type')
+    if kind == 'reg':
+        return op['reg']
+    elif kind == 'imm':
+        val = op['imm']['val']
+        if op.get('xref') is not None or is_addr(val):
+            return ADDR
+        return '0x%x' % (val & 0xffffffffffffffff)
+    elif kind == 'mem':
+        base = op.get('base') or ''
+        index = op.get('index') or ''
+        disp = op.get('rel', {}).get('val', 0)
+        if (op.get('xref') is not None or base in PC_REGS or
+                (base == '' and index == '' and is_addr(disp))):
+            disp = ADDR
+        else:
+            disp = '0x%x' % (disp & 0xffffffffffffffff)
+        if index != '':
+            index = '%s*%d' % (index, op.get('scale', {}).get('val', 1))
+        return '[%s]' % '+'.join(x for x in (base, index, disp) if x != '')
+    return kind or '?'
+
+
+def normalize(mnemonic, operands, is_addr, target=None):
+    """Writes an instruction without anything that depends on addresses.
+
+    :mnemonic: The instruction's mnemonic
+    :operands: Its operands, as processed by the Heuristics
+    :is_addr: A function telling whether a number is an address in the
+              disassembly
+    :target: What a direct call or jump goes to - a function name or
+             ADDR - which stands in for its immediate
+    :returns: A string
+
+    """
+    ops = []
+    for op in operands or []:
+        if target is not None and op.get('type') == 'imm':
+            ops.append(target)
+        else:
+            ops.append(normalize_operand(op, is_addr))
+    return ' '.join([mnemonic] + ops)
+
+
+class FunctionHash(object):
+    """The block hashes of a function"""
+    def __init__(self, name, start_addr, block_addrs, block_hashes,
+                 block_shapes):
+        """Initializes a FunctionHash object.
+
+        :name: Name of the function
+        :start_addr: Absolute start address of the function
+        :block_addrs: Absolute start address of each basic block
+        :block_hashes: Hash of each block's normalized instructions
+        :block_shapes: Hash of each block's mnemonics
+
+        """
+        self.name = name
+        self.start_addr = start_addr
+        self.block_addrs = block_addrs
+        self.block_hashes = block_hashes
+        self.block_shapes = block_shapes
+        self.hash = get_hash(sorted(block_hashes))
+        self.shape = get_hash(sorted(block_shapes))
+
+    def __len__(self):
+        return len(self.block_addrs)
+
+    def __str__(self):
+        """Returns a string representation of this function hash.
+
+        :returns: A string rep
+
+        """
+        return '%s@0x%08x %s (%d blocks)' % (self.name, self.start_addr,
+                                              self.hash, len(self))
+
+
+class DiffEntry(object):
+    """The result of diffing one function"""
+    def __init__(self, status, via, a_name, a_addr, b_name, b_addr,
+                 similarity, a_blocks, b_blocks):
+        """Initializes a DiffEntry object.
+
+        :status: One of DIFF_STATUSES
+        :via: How the function was matched, or None if it wasn't
+        :a_name: Name of the function in the first disassembly, or None
+        :a_addr: Its absolute start address, or None
+        :b_name: Name of the function in the second disassembly, or None
+        :b_addr: Its absolute start address, or None
+        :similarity: The fraction of blocks in common, from 0 to 1
+        :a_blocks: Addresses of the first function's unmatched blocks
+        :b_blocks: Addresses of the second function's unmatched blocks
+
+        """
+        self.status = status
+        self.via = via
+        self.a_name = a_name
+        self.a_addr = a_addr
+        self.b_name = b_name
+        self.b_addr = b_addr
+        self.similarity = similarity
+        self.a_blocks = a_blocks
+        self.b_blocks = b_blocks
+
+    def __str__(self):
+        """Returns a string representation of this entry.
+
+        :returns: A string rep
+
+        """
+        a = '-' if self.a_name is None else self.a_name
+        b = '-' if self.b_name is None else self.b_name
+        return '%-7s %s -> %s (%.2f)' % (self.status, a, b, self.similarity)
+
+
+def join_unique(keys_a, keys_b, cands_a, cands_b):
+    """Pairs up candidates whose key is found once on each side.
+
+    :keys_a: The key of every function of the first side
+    :keys_b: The key of every function of the second side
+    :cands_a: The indexes of the first side's candidates
+    :cands_b: The indexes of the second side's candidates
+    :returns: A list of (index_a, index_b) tuples
+
+    """
+    groups_a = collections.defaultdict(list)
+    for i in cands_a:
+        if keys_a[i] is not None:
+            groups_a[keys_a[i]].append(i)
+    groups_b = collections.defaultdict(list)
+    for i in cands_b:
+        if keys_b[i] is not None:
+            groups_b[keys_b[i]].append(i)
+    return [(found[0], groups_b[key][0])
+            for key, found in groups_a.iteritems()
+            if len(found) == 1 and len(groups_b.get(key, [])) == 1]
+
+
+def get_neighbours(funcs, graph):
+    """Lists the callees and callers of every function.
+
+    :funcs: A list of FunctionHash objects
+    :graph: The CallGraph of their disassembly, or None
+    :returns: A (callees, callers) tuple of lists of lists of indexes
+              into funcs
+
+    """
+    callees = [[] for x in funcs]
+    callers = [[] for x in funcs]
+    if graph is None:
+        return callees, callers
+
+    by_start = dict((x.start_addr, i) for i, x in enumerate(funcs))
+    index = [by_start.get(int(x)) for x in graph.starts]
+    for node in xrange(len(graph)):
+        i = index[node]
+        if i is None:
+            continue
+        for other in graph.indices[graph.indptr[node]:
+                                   graph.indptr[node + 1]]:
+            j = index[other]
+            if j is not None and j != i:
+                callees[i].append(j)
+                callers[j].append(i)
+    return callees, callers
+
+
+def compare_blocks(a, b):
+    """Matches up the blocks of two functions by hash.
+
+    :a: A FunctionHash from the first disassembly
+    :b: A FunctionHash from the second disassembly
+    :returns: A (similarity, a_blocks, b_blocks) tuple of the fraction of
+              blocks in common and the addresses of the unmatched blocks
+
+    """
+    left = collections.Counter(b.block_hashes)
+    a_blocks = []
+    for addr, block in zip(a.block_addrs, a.block_hashes):
+        if left[block] > 0:
+            left[block] -= 1
+        else:
+            a_blocks.append(addr)
+    b_blocks = []
+    for addr, block in reversed(zip(b.block_addrs, b.block_hashes)):
+        if left[block] > 0:
+            left[block] -= 1
+            b_blocks.append(addr)
+    b_blocks.reverse()
+
+    total = len(a) + len(b)
+    common = len(a) - len(a_blocks)
+    similarity = 2.0 * common / total if total > 0 else 1.0
+    return similarity, a_blocks, b_blocks
+
+
+def diff(funcs_a, graph_a, funcs_b, graph_b):
+    """Diffs the functions of two disassemblies.
+
+    :funcs_a: A list of FunctionHash objects of the first disassembly
+    :graph_a: The CallGraph of the first disassembly, or None
+    :funcs_b: A list of FunctionHash objects of the second disassembly
+    :graph_b: The CallGraph of the second disassembly, or None
+    :returns: A list of DiffEntry objects, one for each matched pair and
+              each unmatched function
+
+    """
+    hashes_a = [x.hash for x in funcs_a]
+    hashes_b = [x.hash for x in funcs_b]
+    shapes_a = [x.shape for x in funcs_a]
+    shapes_b = [x.shape for x in funcs_b]
+    names_a = [None if is_auto_name(x.name) else x.name for x in funcs_a]
+    names_b = [None if is_auto_name(x.name) else x.name for x in funcs_b]
+
+    pairs = {}
+    matched_b = set()
+    queue = collections.deque()
+
+    def add_pairs(found, via):
+        for i, j in found:
+            if i not in pairs and j not in matched_b:
+                pairs[i] = (j, via)
+                matched_b.add(j)
+                queue.append((i, j))
+
+    def unmatched(cands_a, cands_b):
+        return ([x for x in cands_a if x not in pairs],
+                [x for x in cands_b if x not in matched_b])
+
+    for keys_a, keys_b, via in [(hashes_a, hashes_b, VIA_HASH),
+                                (names_a, names_b, VIA_NAME),
+                                (shapes_a, shapes_b, VIA_SHAPE)]:
+        cands_a, cands_b = unmatched(xrange(len(funcs_a)),
+                                     xrange(len(funcs_b)))
+        add_pairs(join_unique(keys_a, keys_b, cands_a, cands_b), via)
+
+    # Spread the matches along the call graphs. Each pair is looked at
+    # once, so this is linear in the number of calls
+    callees_a, callers_a = get_neighbours(funcs_a, graph_a)
+    callees_b, callers_b = get_neighbours(funcs_b, graph_b)
+    while len(queue) > 0:
+        i, j = queue.popleft()
+        for near_a, near_b in [(callees_a[i], callees_b[j]),
+                               (callers_a[i], callers_b[j])]:
+            cands_a, cands_b = unmatched(near_a, near_b)
+            if len(cands_a) == 0 or len(cands_b) == 0:
+                continue
+            for keys_a, keys_b in [(hashes_a, hashes_b),
+                                   (shapes_a, shapes_b)]:
+                add_pairs(join_unique(keys_a, keys_b, cands_a, cands_b),
+                          VIA_CALLS)
+                cands_a, cands_b = unmatched(cands_a, cands_b)
+            # A lone function left on each side is taken to be the same
+            # one, changed
+            if len(set(cands_a)) == 1 and len(set(cands_b)) == 1:
+                add_pairs([(cands_a[0], cands_b[0])], VIA_CALLS)
+
+    entries = []
+    for i, (j, via) in sorted(pairs.iteritems()):
+        a = funcs_a[i]
+        b = funcs_b[j]
+        similarity, a_blocks, b_blocks = compare_blocks(a, b)
+        status = DIFF_MATCH if a.hash == b.hash else DIFF_CHANGED
+        entries.append(DiffEntry(status, via, a.name, a.start_addr, b.name,
+                                 b.start_addr, similarity, a_blocks,
+                                 b_blocks))
+    for i, a in enumerate(funcs_a):
+        if i not in pairs:
+            entries.append(DiffEntry(DIFF_REMOVED, None, a.name,
+                                     a.start_addr, None, None, 0.0,
+                                     list(a.block_addrs), []))
+    for j, b in enumerate(funcs_b):
+        if j not in matched_b:
+            entries.append(DiffEntry(DIFF_ADDED, None, None, None, b.name,
+                                     b.start_addr, 0.0, [],
+                                     list(b.block_addrs)))
+    return entries
@@ -7,6 +7,7 @@ TODO: break this into subclasses for full OOP design
 
 import capstone
 import hashlib
+from collections import namedtuple
 from disassembler_libs import logger
 
 from section import Section
@@ -14,6 +15,17 @@ from attributes import Attributes
 
 from elftools.elf.elffile import ELFFile
 from elftools.elf.descriptions import describe_sh_flags
+from elftools.elf.sections import SymbolTableSection
+
+# A format-independent view of a symbol. kind is one of 'func', 'obj'
+# or 'loc' and addr is absolute.
+Symbol = namedtuple('Symbol', 'name addr size kind')
+
+ELF_SYMBOL_KINDS = {'STT_FUNC': 'func',
+                    'STT_GNU_IFUNC': 'func',
+                    'STT_OBJECT': 'obj',
+                    'STT_COMMON': 'obj',
+                    'STT_NOTYPE': 'loc'}
 
 
 class BinHandler:
@@ -29,6 +41,7 @@ class BinHandler:
         self.file_format = None
         self.bin_file = None
         self.parser = None
+        self.symbols = None
 
         self.log = logger.getLogger(__name__)
 
@@ -215,6 +228,73 @@ class BinHandler:
         else:
             return None
 
+    def get_pointer_size(self):
+        """Returns the size of a pointer in this binary
+
+        :returns: The size of a pointer in bytes
+
+        """
+        if self.file_format == 'ELF':
+            return self.parser.elfclass / 8
+        else:
+            return None
+
+    def is_little_endian(self):
+        """Returns true if the binary stores data little endian
+
+        :returns: True if little endian, otherwise False
+
+        """
+        if self.file_format == 'ELF':
+            return self.parser.little_endian
+        else:
+            return None
+
+    def get_symbols(self):
+        """Fetches every defined symbol in the binary's symbol tables.
+
+        The tables are only parsed once - later calls return the same list.
+
+        :returns: A list of Symbol tuples sorted by address
+
+        """
+        if self.symbols is None:
+            if self.file_format == 'ELF':
+                self.symbols = self._get_symbols_elf()
+            else:
+                self.symbols = []
+        return self.symbols
+
+    def _get_symbols_elf(self):
+        """Reads the .symtab and .dynsym symbols of an elf binary
+
+        :returns: A list of Symbol tuples sorted by address
+
+        """
+        thumb = self.get_arch() == capstone.CS_ARCH_ARM
+        seen = set()
+        symbols = []
+        for sec in self.parser.iter_sections():
+            if not isinstance(sec, SymbolTableSection):
+                continue
+            for sym in sec.iter_symbols():
+                kind = ELF_SYMBOL_KINDS.get(sym['st_info']['type'])
+                addr = sym['st_value']
+                # Skip imports, unnamed symbols and arm mapping symbols
+                if (kind is None or addr == 0 or
+                        sym['st_shndx'] == 'SHN_UNDEF' or
+                        sym.name == '' or sym.name.startswith('$')):
+                    continue
+                if thumb and kind == 'func':
+                    addr &= ~1
+                if (sym.name, addr) in seen:
+                    continue
+                seen.add((sym.name, addr))
+                symbols.append(Symbol(sym.name, addr, sym['st_size'], kind))
+
+        symbols.sort(key=lambda x: x.addr)
+        return symbols
+
     def get_debug_info(self):
         """If available, fetches the debug information for this binary
 
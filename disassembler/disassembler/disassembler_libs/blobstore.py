@@ -0,0 +1,158 @@
+'''
+A chunked, content-addressed store for large binary payloads such as
+the raw bytes of a section.
+
+A blob is split into fixed size chunks, each stored once in the 'blobs'
+collection under the SHA-1 of its contents, so a payload never runs into
+mongo's document size limit and identical chunks (the same section in two
+builds of a binary, runs of zero padding, ...) are only stored once. The
+document that owns a blob keeps a small manifest listing its chunks, which
+lets any byte range be read back by fetching only the chunks it overlaps.
+'''
+
+import hashlib
+import os
+from bson.binary import Binary
+
+# Same as GridFS - small enough that a chunk plus overhead fits a document
+CHUNK_SIZE = 255 * 1024
+
+# The BlobStore of each (process, host, port), for BlobRefs that were
+# pickled over without one - so every section doesn't open its own client
+_shared_stores = {}
+
+
+class BlobStore(object):
+    """Reads and writes chunked blobs in the blobs collection."""
+
+    def __init__(self, db):
+        """Initializes a BlobStore.
+
+        :db: The haevn database to store blobs in
+
+        """
+        self.col = db.blobs
+
+    def put(self, data):
+        """Stores a blob, skipping any chunks that are already stored.
+
+        :data: A string of raw bytes
+        :returns: The blob's manifest - a dict to keep with the owner
+                  of the blob and hand back to read()
+
+        """
+        chunk_ids = []
+        bulk = self.col.initialize_unordered_bulk_op()
+        for i in xrange(0, len(data), CHUNK_SIZE):
+            chunk = data[i:i + CHUNK_SIZE]
+            chunk_id = hashlib.sha1(chunk).hexdigest()
+            chunk_ids.append(chunk_id)
+            bulk.find({'_id': chunk_id}).upsert().update_one(
+                {'$setOnInsert': {'data': Binary(chunk),
+                                  'size': len(chunk)}})
+
+        if len(chunk_ids) > 0:
+            bulk.execute()
+
+        return {'sha1': hashlib.sha1(data).hexdigest(),
+                'size': len(data),
+                'chunk_size': CHUNK_SIZE,
+                'chunks': chunk_ids}
+
+    def read(self, manifest, start=0, end=None):
+        """Reads a range of bytes out of a blob.
+
+        :manifest: The manifest returned by put()
+        :start: Offset of the first byte to read (inclusive)
+        :end: Offset of the last byte to read (exclusive), or None
+              to read to the end of the blob
+        :returns: A string of raw bytes
+
+        """
+        size = manifest['size']
+        chunk_size = manifest['chunk_size']
+        end = size if end is None else min(end, size)
+        start = max(start, 0)
+        if start >= end:
+            return ''
+
+        first = start / chunk_size
+        last = (end - 1) / chunk_size
+        wanted = manifest['chunks'][first:last + 1]
+
+        found = {}
+        for rec in self.col.find({'_id': {'$in': list(set(wanted))}}):
+            found[rec['_id']] = str(rec['data'])
+
+        data = ''.join(found[x] for x in wanted)
+        offset = first * chunk_size
+        return data[start - offset:end - offset]
+
+
+def get_shared_store(host, port):
+    """Returns this process's BlobStore for a database, connecting once.
+
+    Clients aren't shared across processes, since a forked child can't use
+    its parent's connections.
+
+    :host: The host of the database
+    :port: The port of the database
+    :returns: A BlobStore
+
+    """
+    key = (os.getpid(), host, port)
+    if key not in _shared_stores:
+        # Imported here since the dbmanager depends on this module
+        from dbmanager import DBManager
+        _shared_stores[key] = BlobStore(DBManager(host, port).db)
+    return _shared_stores[key]
+
+
+class BlobRef(object):
+    """A lazy handle on a stored blob.
+
+    A BlobRef only holds connection details and a manifest, so it is cheap
+    to pickle over to other processes. It reads through the BlobStore it
+    was made with, and one that was pickled over reads through its
+    process's shared store.
+
+    """
+
+    def __init__(self, host, port, manifest, store=None):
+        """Initializes a BlobRef.
+
+        :host: The host of the database holding the blob
+        :port: The port of the database holding the blob
+        :manifest: The blob's manifest
+        :store: The BlobStore to read through, if there is one already
+
+        """
+        self.host = host
+        self.port = port
+        self.manifest = manifest
+        self.store = store
+
+    def __getstate__(self):
+        """Leaves the database connection behind when pickling."""
+        state = self.__dict__.copy()
+        state['store'] = None
+        return state
+
+    def __len__(self):
+        return self.manifest['size']
+
+    def _get_store(self):
+        if self.store is None:
+            self.store = get_shared_store(self.host, self.port)
+        return self.store
+
+    def read(self, start=0, end=None):
+        """Reads a range of bytes out of the blob.
+
+        :start: Offset of the first byte to read (inclusive)
+        :end: Offset of the last byte to read (exclusive), or None
+              to read to the end of the blob
+        :returns: A string of raw bytes
+
+        """
+        return self._get_store().read(self.manifest, start, end)
@@ -0,0 +1,55 @@
+'''
+An n-gram inverted index over the raw bytes of sections.
+
+Every run of GRAM_SIZE bytes in a section is packed into an integer - its
+gram - and the index maps each gram to the sections it occurs in. A byte
+pattern can only occur in a section holding every gram of the pattern, so
+looking up the pattern's grams narrows a search over many binaries down to
+a few candidate sections, which are then scanned to verify the matches.
+'''
+
+import numpy as np
+from bytepattern import as_array
+
+GRAM_SIZE = 4
+
+
+def find_grams(data):
+    """Finds the distinct grams in a blob of bytes.
+
+    :data: A byte string, buffer or uint8 array
+    :returns: A sorted numpy array of the grams, as int64
+
+    """
+    arr = data if isinstance(data, np.ndarray) else as_array(data)
+    count = len(arr) - GRAM_SIZE + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    grams = np.zeros(count, dtype=np.int64)
+    for i in xrange(GRAM_SIZE):
+        grams = (grams << 8) | arr[i:i + count]
+    return np.unique(grams)
+
+
+def get_pattern_grams(pattern):
+    """Finds the grams a byte pattern must contain to match.
+
+    Only runs of GRAM_SIZE bytes without any wildcard or masked bits give
+    a gram, so a pattern of short pieces may not have any.
+
+    :pattern: A (values, mask) tuple from parse_pattern
+    :returns: A sorted list of grams
+
+    """
+    values, mask = pattern
+    grams = set()
+    for i in xrange(len(values) - GRAM_SIZE + 1):
+        if mask[i:i + GRAM_SIZE] != '\xff' * GRAM_SIZE:
+            continue
+        gram = 0
+        for c in values[i:i + GRAM_SIZE]:
+            gram = (gram << 8) | ord(c)
+        grams.add(gram)
+    return sorted(grams)
+
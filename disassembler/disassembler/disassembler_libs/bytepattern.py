@@ -0,0 +1,99 @@
+'''
+Vectorized matching of byte patterns against raw section data.
+
+Patterns are written as hex bytes separated by spaces, where '??' matches
+any byte, e.g. '55 48 89 e5' or 'fd 7b ?? a9'. A parsed pattern is a
+(values, mask) pair of equal length byte strings - a byte at position i
+matches when (byte & mask[i]) == values[i].
+'''
+
+import numpy as np
+
+
+def parse_pattern(pattern, mask=None):
+    """Parses a hex pattern string into a (values, mask) pair.
+
+    :pattern: A string such as '48 8b ?? 24'
+    :mask: An optional hex string of the same length overriding the
+           per-byte masks, for patterns that only care about some bits
+    :returns: A (values, mask) tuple of byte strings
+
+    """
+    values = []
+    masks = []
+    for tok in pattern.split():
+        if tok == '??':
+            values.append(0)
+            masks.append(0)
+        else:
+            values.append(int(tok, 16))
+            masks.append(0xff)
+
+    if mask is not None:
+        masks = [int(tok, 16) for tok in mask.split()]
+        values = [v & m for v, m in zip(values, masks)]
+
+    return (''.join(chr(v) for v in values), ''.join(chr(m) for m in masks))
+
+
+def as_array(data):
+    """Returns a zero-copy uint8 view of a byte string or buffer.
+
+    :data: A str, bytearray or memoryview
+    :returns: A numpy array of uint8
+
+    """
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def find_pattern(data, pattern, alignment=1):
+    """Finds every offset in data where a parsed pattern matches.
+
+    Each pattern byte is compared against a shifted view of the whole
+    buffer at once, so the cost is one vector operation per pattern byte
+    rather than one Python iteration per offset.
+
+    :data: A byte string, buffer or uint8 array to search
+    :pattern: A (values, mask) tuple from parse_pattern
+    :alignment: Only report offsets that are a multiple of this
+    :returns: A numpy array of matching offsets
+
+    """
+    arr = data if isinstance(data, np.ndarray) else as_array(data)
+    values, mask = pattern
+    length = len(values)
+    count = len(arr) - length + 1
+    if count <= 0 or length == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    hits = np.ones(count, dtype=bool)
+    for i in xrange(length):
+        m = ord(mask[i])
+        if m == 0:
+            continue
+        window = arr[i:i + count]
+        if m == 0xff:
+            hits &= window == ord(values[i])
+        else:
+            hits &= (window & m) == ord(values[i])
+
+    offsets = np.flatnonzero(hits)
+    if alignment > 1:
+        offsets = offsets[offsets % alignment == 0]
+    return offsets.astype(np.int64)
+
+
+def find_patterns(data, patterns, alignment=1):
+    """Finds every offset where any of a list of parsed patterns matches.
+
+    :data: A byte string, buffer or uint8 array to search
+    :patterns: A list of (values, mask) tuples from parse_pattern
+    :alignment: Only report offsets that are a multiple of this
+    :returns: A sorted numpy array of unique matching offsets
+
+    """
+    arr = data if isinstance(data, np.ndarray) else as_array(data)
+    found = [find_pattern(arr, p, alignment) for p in patterns]
+    if len(found) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(found))
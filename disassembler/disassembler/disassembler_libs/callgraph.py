@@ -0,0 +1,368 @@
+'''
+A call graph over the functions of a disassembly.
+
+Functions are the nodes, numbered in order of their start address, and the
+calls between them are kept as CSR (compressed sparse row) arrays - the
+callees of node i are indices[indptr[i]:indptr[i + 1]]. The same arrays are
+kept for the reversed graph so callers are as cheap to look up as callees.
+
+For transitive queries the graph is condensed into its strongly connected
+components and the set of components reachable from each one is stored as a
+row of bits. "Everything main can reach" is then a single row and
+"everything that can reach strcpy@plt" a single column of that matrix.
+'''
+
+import numpy as np
+
+# Arrays that make up a stored call graph, and their types
+ARRAY_TYPES = [('starts', np.int64),
+               ('ends', np.int64),
+               ('indptr', np.int64),
+               ('indices', np.int64),
+               ('comps', np.int64),
+               ('reach', np.uint8)]
+
+
+def to_csr(src, dst, n):
+    """Builds CSR arrays from a list of edges.
+
+    :src: A numpy array of the node each edge leaves
+    :dst: A numpy array of the node each edge enters
+    :n: The number of nodes
+    :returns: An (indptr, indices) tuple of numpy arrays
+
+    """
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int64)
+
+
+def find_components(indptr, indices):
+    """Finds the strongly connected components of a graph.
+
+    This is Tarjan's algorithm, made iterative so deep call chains don't
+    run into the recursion limit. Components are numbered in the order
+    they are completed, which puts every component after all of the
+    components it can reach.
+
+    :indptr: The graph's CSR row pointers
+    :indices: The graph's CSR column indices
+    :returns: A numpy array holding the component of each node
+
+    """
+    n = len(indptr) - 1
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comps = np.zeros(n, dtype=np.int64)
+    stack = []
+    num_comps = 0
+    counter = 0
+
+    for root in xrange(n):
+        if index[root] != -1:
+            continue
+        # Each frame is a node and the position of its next edge
+        work = [(root, indptr[root])]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+
+        while len(work) > 0:
+            node, edge = work[-1]
+            if edge < indptr[node + 1]:
+                work[-1] = (node, edge + 1)
+                succ = indices[edge]
+                if index[succ] == -1:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack[succ] = True
+                    work.append((succ, indptr[succ]))
+                elif on_stack[succ]:
+                    low[node] = min(low[node], index[succ])
+                continue
+
+            work.pop()
+            if len(work) > 0:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    comps[member] = num_comps
+                    if member == node:
+                        break
+                num_comps += 1
+    return comps
+
+
+def find_closure(indptr, indices, comps):
+    """Works out which components each component can reach.
+
+    :indptr: The graph's CSR row pointers
+    :indices: The graph's CSR column indices
+    :comps: The component of each node, as made by find_components
+    :returns: A (components x components) numpy array of packed bits -
+              bit j of row i is set if component i can reach component j
+              by one or more calls
+
+    """
+    num_comps = int(comps.max()) + 1 if len(comps) > 0 else 0
+    src = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    src = comps[src]
+    dst = comps[indices]
+
+    # Component edges, grouped by the component they leave
+    c_indptr, c_indices = to_csr(src, dst, num_comps)
+    reach = np.zeros((num_comps, (num_comps + 7) // 8), dtype=np.uint8)
+
+    # Components are numbered after everything they reach, so each row
+    # only needs rows that are already finished
+    for comp in xrange(num_comps):
+        row = reach[comp]
+        for succ in np.unique(c_indices[c_indptr[comp]:c_indptr[comp + 1]]):
+            # A component only reaches itself through a cycle, which is
+            # an edge inside it
+            if succ != comp:
+                row |= reach[succ]
+            row[succ >> 3] |= 0x80 >> (succ & 7)
+    return reach
+
+
+class CallGraph(object):
+    """The functions of a disassembly and the calls between them."""
+
+    def __init__(self, names, starts, ends, indptr, indices, comps=None,
+                 reach=None):
+        """Initializes a CallGraph.
+
+        :names: A list of the name of each function
+        :starts: A numpy array of each function's absolute start address,
+                 in ascending order
+        :ends: A numpy array of each function's absolute end address
+               (inclusive)
+        :indptr: The CSR row pointers of the calls
+        :indices: The CSR column indices of the calls
+        :comps: The component of each function, or None to work it out
+        :reach: The reachability rows of the components, or None to
+                answer transitive queries by walking the graph instead
+
+        """
+        self.names = names
+        self.starts = starts
+        self.ends = ends
+        self.indptr = indptr
+        self.indices = indices
+        self.comps = comps
+        if self.comps is None:
+            self.comps = find_components(indptr, indices)
+        self.reach = reach
+
+        src = np.repeat(np.arange(len(names)), np.diff(indptr))
+        self.r_indptr, self.r_indices = to_csr(indices, src, len(names))
+
+        self.by_name = {}
+        for i, name in enumerate(names):
+            self.by_name.setdefault(name, i)
+
+    @staticmethod
+    def build(funcs, sites, targets, closure_limit=None):
+        """Builds a call graph from functions and call sites.
+
+        Each call belongs to the function holding its site and calls the
+        function holding its target. Calls that aren't inside a function
+        at either end are left out.
+
+        :funcs: A list of (name, start, end) tuples of absolute addresses
+        :sites: A numpy array of the absolute address of each call
+        :targets: A numpy array of the absolute address each call calls
+        :closure_limit: The most components to build reachability rows
+                        for, or None for no limit
+        :returns: A CallGraph
+
+        """
+        # One function per start, preferring a real name to a sub_ one
+        funcs = sorted(funcs, key=lambda x: (x[1], x[0].startswith('sub_')))
+        names = []
+        starts = []
+        ends = []
+        for name, start, end in funcs:
+            if len(starts) > 0 and starts[-1] == start:
+                continue
+            names.append(name)
+            starts.append(start)
+            ends.append(end)
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.array(ends, dtype=np.int64)
+
+        src = find_containing(starts, ends, sites)
+        dst = find_containing(starts, ends, targets)
+        keep = (src >= 0) & (dst >= 0)
+        edges = np.unique(src[keep] * max(len(names), 1) + dst[keep])
+        src = edges // max(len(names), 1)
+        dst = edges % max(len(names), 1)
+
+        indptr, indices = to_csr(src, dst, len(names))
+        comps = find_components(indptr, indices)
+        reach = None
+        num_comps = int(comps.max()) + 1 if len(comps) > 0 else 0
+        if closure_limit is None or num_comps <= closure_limit:
+            reach = find_closure(indptr, indices, comps)
+        return CallGraph(names, starts, ends, indptr, indices, comps, reach)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_num_calls(self):
+        """Returns the number of distinct caller-callee pairs.
+
+        :returns: Number of edges
+
+        """
+        return len(self.indices)
+
+    def find(self, func):
+        """Finds the node of a function.
+
+        :func: A function name, or an absolute address inside it
+        :returns: The node's index, or None if there is no such function
+
+        """
+        if isinstance(func, basestring):
+            return self.by_name.get(func)
+        i = find_containing(self.starts, self.ends,
+                            np.array([func], dtype=np.int64))[0]
+        return int(i) if i >= 0 else None
+
+    def callees(self, func, transitive=False):
+        """Returns the functions a function calls.
+
+        :func: A function name, or an absolute address inside it
+        :transitive: Whether to include everything reachable through
+                     more than one call
+        :returns: A list of function names, ordered by address
+
+        """
+        return self._query(func, transitive, self.indptr, self.indices,
+                           False)
+
+    def callers(self, func, transitive=False):
+        """Returns the functions that call a function.
+
+        :func: A function name, or an absolute address inside it
+        :transitive: Whether to include everything that reaches it
+                     through more than one call
+        :returns: A list of function names, ordered by address
+
+        """
+        return self._query(func, transitive, self.r_indptr, self.r_indices,
+                           True)
+
+    def _query(self, func, transitive, indptr, indices, reverse):
+        """Looks up the neighbours of a function in one direction.
+
+        :func: A function name, or an absolute address inside it
+        :transitive: Whether to follow more than one call
+        :indptr: The CSR row pointers of the direction to follow
+        :indices: The CSR column indices of the direction to follow
+        :reverse: Whether the direction is callee to caller
+        :returns: A list of function names, ordered by address
+
+        """
+        node = self.find(func)
+        if node is None:
+            return []
+        if not transitive:
+            found = indices[indptr[node]:indptr[node + 1]]
+        elif self.reach is None:
+            found = np.flatnonzero(walk(indptr, indices, node))
+        else:
+            comp = self.comps[node]
+            if reverse:
+                bits = (self.reach[:, comp >> 3] >> (7 - (comp & 7))) & 1
+            else:
+                bits = np.unpackbits(self.reach[comp])[:len(self.reach)]
+            found = np.flatnonzero(bits[self.comps])
+        return [self.names[x] for x in found]
+
+    def to_blobs(self):
+        """Returns the contents of this graph as raw bytes, for storing.
+
+        :returns: A dict of 'names' and each name in ARRAY_TYPES to a
+                  string of raw bytes
+
+        """
+        blobs = {'names': '\0'.join(x.encode('utf-8') for x in self.names)}
+        arrays = {'starts': self.starts, 'ends': self.ends,
+                  'indptr': self.indptr, 'indices': self.indices,
+                  'comps': self.comps, 'reach': self.reach}
+        for name, dtype in ARRAY_TYPES:
+            if arrays[name] is not None:
+                blobs[name] = arrays[name].astype(dtype).tostring()
+        return blobs
+
+    @staticmethod
+    def from_blobs(blobs):
+        """Rebuilds a graph from what to_blobs() returned.
+
+        :blobs: A dict of field name to a string of raw bytes
+        :returns: A CallGraph
+
+        """
+        names = []
+        if len(blobs['names']) > 0:
+            names = [x.decode('utf-8') for x in blobs['names'].split('\0')]
+        arrays = {}
+        for name, dtype in ARRAY_TYPES:
+            if name in blobs:
+                arrays[name] = np.frombuffer(blobs[name], dtype=dtype).copy()
+
+        reach = arrays.get('reach')
+        if reach is not None:
+            comps = arrays['comps']
+            num_comps = int(comps.max()) + 1 if len(comps) > 0 else 0
+            reach = reach.reshape((num_comps, (num_comps + 7) // 8))
+        return CallGraph(names, arrays['starts'], arrays['ends'],
+                         arrays['indptr'], arrays['indices'],
+                         arrays['comps'], reach)
+
+
+def find_containing(starts, ends, addrs):
+    """Finds the function holding each of a list of addresses.
+
+    :starts: A sorted numpy array of function start addresses
+    :ends: A numpy array of function end addresses (inclusive)
+    :addrs: A numpy array of addresses to look up
+    :returns: A numpy array of function indexes, -1 where no function
+              holds the address
+
+    """
+    found = np.searchsorted(starts, addrs, side='right') - 1
+    valid = found >= 0
+    valid[valid] = addrs[valid] <= ends[found[valid]]
+    return np.where(valid, found, -1)
+
+
+def walk(indptr, indices, node):
+    """Finds every node reachable from a node by one or more edges.
+
+    :indptr: The graph's CSR row pointers
+    :indices: The graph's CSR column indices
+    :node: The node to start from
+    :returns: A numpy bool array, set for each node reached
+
+    """
+    seen = np.zeros(len(indptr) - 1, dtype=bool)
+    frontier = indices[indptr[node]:indptr[node + 1]]
+    while len(frontier) > 0:
+        frontier = np.unique(frontier[~seen[frontier]])
+        seen[frontier] = True
+        if len(frontier) == 0:
+            break
+        frontier = np.concatenate([indices[indptr[x]:indptr[x + 1]]
+                                   for x in frontier])
+    return seen
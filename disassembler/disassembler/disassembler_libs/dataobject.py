@@ -0,0 +1,23 @@
+'''
+An object representing a data object (such as a global
+variable or a table) in a disassembled binary.
+'''
+
+from label import Label
+
+
+class DataObject(Label):
+    """An internal representation of a data object"""
+    def __init__(self, name, r_addr, size, sec_name):
+        """Initializes a data object.
+
+        :name: Name of the object for labelling purposes
+        :r_addr: Relative address of the start of the object
+        :size: Size of the object in bytes
+        :sec_name: Name of the section this object belongs to
+
+        """
+        Label.__init__(self, name, 'obj')
+        self.r_addr = r_addr
+        self.size = size
+        self.sec_name = sec_name
@@ -10,17 +10,36 @@ structure as necessary. Reference docs/db.txt for db schema.
 import pymongo
 import functools
 import sys
+import time
 from bson.binary import Binary
-from disassembler_libs import logger
+from disassembler_libs import (byteindex, instindex, logger, metrics,
+                               minhash, stats)
+from blobstore import BlobStore, BlobRef
+from bytepattern import find_pattern, parse_pattern
 from attributes import Attributes
 from string import String
 from location import Location
 from section import Section
 from function import Function
+from dataobject import DataObject
 from instruction import Instruction
+from disassembly import Disassembly
+from xref import Xref
+from callgraph import CallGraph
+from bindiff import DiffEntry, FunctionHash, DIFF_STATUSES
+from entropy import EntropyMap
+from gadget import Gadget
+from fingerprint import Fingerprint
 
 HAEVN_DB_NAME = 'meteor'
 
+# Number of rows between two checkpoints in the row_index collection. Row
+# lookups never have to walk more than this many records past a checkpoint.
+ROW_INDEX_INTERVAL = 256
+
+# The fields needed to render a line of disassembly - everything but my_bytes
+VIEW_FIELDS = ['addr', 'sec_name', 'is_text', 'mnemonic', 'operands', 'disp']
+
 
 class DBManager():
     """An object that interfaces with the database so you don't have to.
@@ -45,6 +64,9 @@ class DBManager():
         self.proj_id = None
         self.dis_id = None
         self.log = logger.getLogger(__name__)
+        # The address after the last data record written to each section,
+        # to count runs of data across batches
+        self.data_run_ends = {}
 
     ##################################
     # Utilities
@@ -283,8 +305,30 @@ class DBManager():
     # Instruction
     #
 
+    def _ensure_disassembler_indexes(self):
+        """Makes sure the disassembler collection can be range queried.
+
+        Every reader query is scoped to a single section of a single
+        disassembly and ordered by address, so one compound index serves
+        address windows, paging and row lookups alike.
+
+        :returns: None
+
+        """
+        dis_col = self.db.disassembler
+        dis_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                              ('sec_name', pymongo.ASCENDING),
+                              ('addr', pymongo.ASCENDING)], cache_for=300)
+        # Multikey - this is the inverted index of instindex
+        dis_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                              ('search_keys', pymongo.ASCENDING),
+                              ('addr', pymongo.ASCENDING)], cache_for=300)
+
     def _process_operands(self, operands):
-        """Replaces all xref fields with corresponding Location _id
+        """Replaces all xref fields with the absolute address they refer to
+
+        The address is all a reader needs to look up the labels and xrefs
+        of the location.
 
         :operands: Operands for an instruction
         :returns: A list of operands with all 'xref' fields replaced
@@ -292,14 +336,46 @@ class DBManager():
         """
         ops = []
         for op in operands:
-            # The xref field holds a Location object - add it
-            if 'xref' in op:
-                loc_rec = self._upsert_location(op['xref']),
-                op['xref'] = loc_rec['_id']
+            # The xref field holds a Location object
+            if isinstance(op.get('xref'), Location):
+                loc = op['xref']
+                op = dict(op)
+                op['xref'] = loc.r_addr + self._get_sec_base_addr(
+                    self.dis_id, loc.sec_name)
             ops.append(op)
 
         return ops
 
+    def _get_instruction_dict(self, sec_name, inst):
+        """Builds the disassembler record of an Instruction object.
+
+        :sec_name: Name of the section the instruction belongs to
+        :inst: The Instruction object, addressed relative to its section
+        :returns: A dict to insert into the disassembler collection
+
+        """
+        inst_dict = {'project_id': self.proj_id,
+                     'dis_id': self.dis_id,
+                     'addr': inst.r_addr + self._get_sec_base_addr(self.dis_id, sec_name),
+                     #'r_addr': inst.r_addr,
+                     'is_text': inst.is_text,
+                     'my_bytes': inst.my_bytes,
+                     #'sec_id': self._get_sec_id(self.dis_id, sec_name),
+                     'sec_name': sec_name,
+                     'mnemonic': inst.mnemonic}
+
+        if inst.is_text:
+            ops = self._process_operands(inst.operands)
+            inst_dict['operands'] = ops
+            target = getattr(inst, 'target', None)
+            if target is not None:
+                target += inst_dict['addr'] - inst.r_addr
+            inst_dict['search_keys'] = instindex.get_search_keys(
+                inst.mnemonic, ops, target)
+        else:
+            inst_dict['disp'] = inst.disp
+        return inst_dict
+
     def batch_add_instructions(self, sec_name, insts):
         """Adds all Instruction objects in the list to the db.
 
@@ -310,30 +386,138 @@ class DBManager():
 
         """
         dis_col = self.db.disassembler
-        dis_col.ensure_index([('addr', pymongo.ASCENDING)], cache_for=300)
-        query = []
-        for inst in insts:
-            inst_dict = {'project_id': self.proj_id,
-                         'dis_id': self.dis_id,
-                         'addr': inst.r_addr + self._get_sec_base_addr(self.dis_id, sec_name),
-                         #'r_addr': inst.r_addr,
-                         'is_text': inst.is_text,
-                         'my_bytes': inst.my_bytes,
-                         #'sec_id': self._get_sec_id(self.dis_id, sec_name),
-                         'sec_name': sec_name,
-                         'mnemonic': inst.mnemonic}
-
-            if inst.is_text:
-                ops = self._process_operands(inst.operands)
-                inst_dict['operands'] = ops
-            else:
-                inst_dict['disp'] = inst.disp
-
-            query.append(inst_dict)
+        self._ensure_disassembler_indexes()
+        self.invalidate_row_index(sec_name)
+        query = [self._get_instruction_dict(sec_name, x) for x in insts]
 
+        start = time.time()
         ids = dis_col.insert(query)
+        metrics.observe('db/flush_ms', (time.time() - start) * 1000)
         if len(ids) != len(insts):
             raise Exception("could not batch insert")
+        metrics.incr('db/instructions_written', len(ids))
+        metrics.incr('db/documents_written', len(ids))
+
+        counts, end = stats.count_records(query,
+                                          self.data_run_ends.get(sec_name))
+        self.data_run_ends[sec_name] = end
+        self.update_stats(sec_name, counts)
+
+    def batch_update_operands(self, sec_name, insts):
+        """Rewrites the operands of instructions already in the db.
+
+        Does a single bulk operation for improved query time.
+
+        :sec_name: Name of the section these insts belong to
+        :insts: A list of Instruction objects, addressed relative to the
+                section, whose operands have changed
+        :returns: None
+
+        """
+        if len(insts) == 0:
+            return
+        base_addr = self._get_sec_base_addr(self.dis_id, sec_name)
+        bulk = self.db.disassembler.initialize_unordered_bulk_op()
+        for inst in insts:
+            query = self._get_sec_query(sec_name, base_addr + inst.r_addr)
+            ops = self._process_operands(inst.operands)
+            # Operands only ever gain xrefs, which only add target keys
+            keys = [instindex.make_key(instindex.KEY_TARGET, x['xref'])
+                    for x in ops if x.get('xref') is not None]
+            bulk.find(query).update_one(
+                {'$set': {'operands': ops},
+                 '$addToSet': {'search_keys': {'$each': keys}}})
+        bulk.execute()
+        metrics.incr('db/documents_written', len(insts))
+
+    def replace_range(self, sec_name, start_addr, end_addr, insts):
+        """Replaces every instruction in an address range with new ones.
+
+        :sec_name: Name of the section
+        :start_addr: Starting relative address (inclusive)
+        :end_addr: Ending relative address (exclusive)
+        :insts: A list of Instruction objects covering the range, in
+                address order
+        :returns: None
+
+        """
+        self.replace_ranges(sec_name, [(start_addr, end_addr, insts)])
+
+    def replace_ranges(self, sec_name, replacements):
+        """Replaces the instructions in any number of address ranges.
+
+        Every old record is removed and every new one inserted in a single
+        ordered bulk operation - one round trip, applied in order by the
+        server - so a range is only ever empty for as long as that takes.
+        A record belongs to a range if it starts in it. The section's stats
+        are adjusted by the difference between the old and new records.
+
+        :sec_name: Name of the section
+        :replacements: A list of (start_addr, end_addr, insts) tuples - a
+                       relative address range (start inclusive, end
+                       exclusive) and a list of Instruction objects to put
+                       in it, in address order. Ranges may not overlap.
+        :returns: None
+
+        """
+        if len(replacements) == 0:
+            return
+        dis_col = self.db.disassembler
+        self._ensure_disassembler_indexes()
+        base_addr = self._get_sec_base_addr(self.dis_id, sec_name)
+        replacements = sorted(replacements, key=lambda x: x[0])
+
+        # Read everything from the first range to the last, along with the
+        # records either side, which decide whether data at the ends joins
+        # a run of data outside
+        span_start = base_addr + replacements[0][0]
+        span_end = base_addr + max(x[1] for x in replacements)
+        stat_fields = {'_id': 0, 'addr': 1, 'is_text': 1, 'my_bytes': 1,
+                       'mnemonic': 1}
+        query = self._get_sec_query(sec_name, {'$gte': span_start,
+                                               '$lt': span_end})
+        span = list(dis_col.find(query, stat_fields).sort('addr',
+                                                           pymongo.ASCENDING))
+        query = self._get_sec_query(sec_name, {'$lt': span_start})
+        before = list(dis_col.find(query, stat_fields).sort(
+            'addr', pymongo.DESCENDING).limit(1))
+        query = self._get_sec_query(sec_name, {'$gte': span_end})
+        after = list(dis_col.find(query, stat_fields).sort(
+            'addr', pymongo.ASCENDING).limit(1))
+
+        bulk = dis_col.initialize_ordered_bulk_op()
+        new_span = []
+        num_new = 0
+        pos = 0
+        for start_addr, end_addr, insts in replacements:
+            start_addr += base_addr
+            end_addr += base_addr
+            bulk.find(self._get_sec_query(sec_name,
+                                          {'$gte': start_addr,
+                                           '$lt': end_addr})).remove()
+            new = [self._get_instruction_dict(sec_name, x) for x in insts]
+            for inst_dict in new:
+                bulk.insert(inst_dict)
+            num_new += len(new)
+
+            # Keep what's between the ranges, swap out what's in them
+            while pos < len(span) and span[pos]['addr'] < start_addr:
+                new_span.append(span[pos])
+                pos += 1
+            while pos < len(span) and span[pos]['addr'] < end_addr:
+                pos += 1
+            new_span += new
+        new_span += span[pos:]
+
+        start = time.time()
+        bulk.execute()
+        metrics.observe('db/flush_ms', (time.time() - start) * 1000)
+        metrics.incr('db/instructions_written', num_new)
+        metrics.incr('db/documents_written', num_new)
+
+        self.invalidate_row_index(sec_name)
+        self.update_stats(sec_name, stats.count_replacement(span, new_span,
+                                                            before, after))
 
     def add_instruction(self, sec_name, inst, update=False):
         """Adds an Instruction object to the db.
@@ -347,31 +531,15 @@ class DBManager():
 
         """
         dis_col = self.db.disassembler
-        dis_col.ensure_index([('addr', pymongo.ASCENDING)], cache_for=300)
-        inst_dict = {'project_id': self.proj_id,
-                     'dis_id': self.dis_id,
-                     'addr': inst.r_addr + self._get_sec_base_addr(self.dis_id, sec_name),
-                     #'r_addr': inst.r_addr,
-                     'is_text': inst.is_text,
-                     'my_bytes': inst.my_bytes,
-                     #'sec_id': self._get_sec_id(self.dis_id, sec_name),
-                     'sec_name': sec_name,
-                     'mnemonic': inst.mnemonic}
-
-        if inst.is_text:
-            ops = self._process_operands(inst.operands)
-            inst_dict['operands'] = ops
-        else:
-            inst_dict['disp'] = inst.disp
+        self._ensure_disassembler_indexes()
+        inst_dict = self._get_instruction_dict(sec_name, inst)
 
         if update:
-            query = {'project_id': self.proj_id,
-                     'dis_id': self.dis_id,
-                     'sec_id': inst_dict['sec_id'],
-                     'r_addr': inst.r_addr}
+            query = self._get_sec_query(sec_name, inst_dict['addr'])
             return dis_col.update(query, {'$set': inst_dict}, upsert=False)
         else:
             dis_col.insert(inst_dict)
+            self.update_stats(sec_name, stats.count_records([inst_dict])[0])
 
     #
     # Labels
@@ -388,42 +556,166 @@ class DBManager():
         self._add_function(func)
 
     def _add_function(self, func, upsert=False, query=None):
-        lab_dict = {'r_start_addr': func.r_start_addr,
-                    'r_end_addr': func.r_end_addr,
-                    'sec_id': self._get_sec_id(self.dis_id,
-                                               func.sec_name),
-                    'l_vars': func.l_vars}
-        return self._add_label(func, lab_dict, upsert, query)
+        return self._add_label(func, self._get_function_dict(func),
+                               upsert, query)
+
+    def _get_function_dict(self, func):
+        return {'r_start_addr': func.r_start_addr,
+                'r_end_addr': func.r_end_addr,
+                'sec_id': self._get_sec_id(self.dis_id, func.sec_name),
+                'sec_name': func.sec_name,
+                'l_vars': func.l_vars}
+
+    def batch_upsert_functions(self, funcs):
+        """Adds all Function objects in the list that aren't already labelled.
+
+        Does a single bulk operation for improved query time. A function
+        is matched on its section and start address, and an existing label
+        is left untouched, so heuristically found functions never clobber
+        names or bounds that came from a better source.
+
+        :funcs: A list of Function objects to add
+        :returns: None
+
+        """
+        if len(funcs) == 0:
+            return
+        lab_col = self.db.labels
+        lab_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                              ('type', pymongo.ASCENDING),
+                              ('sec_id', pymongo.ASCENDING),
+                              ('r_start_addr', pymongo.ASCENDING)],
+                             cache_for=300)
+        bulk = lab_col.initialize_unordered_bulk_op()
+        for func in funcs:
+            lab_dict = self._get_function_dict(func)
+            lab_dict.update({'project_id': self.proj_id,
+                             'dis_id': self.dis_id,
+                             'type': func.type,
+                             'name': func.name})
+            query = {'project_id': self.proj_id,
+                     'dis_id': self.dis_id,
+                     'type': func.type,
+                     'sec_id': lab_dict['sec_id'],
+                     'r_start_addr': func.r_start_addr}
+            bulk.find(query).upsert().update({'$setOnInsert': lab_dict})
+        bulk.execute()
+        metrics.incr('db/documents_written', len(funcs))
 
     def add_string(self, string):
         self._add_string(string)
 
     def _add_string(self, string, upsert=False, query=None):
-        lab_dict = {'r_addr': string.r_addr,
-                    'sec_id':
-                    self._get_sec_id(self.dis_id,
-                                     string.sec_name)}
-        return self._add_label(string, lab_dict, upsert, query)
+        ret = self._add_label(string, self._get_string_dict(string),
+                              upsert, query)
+        if not upsert:
+            self.update_stats(string.sec_name, {'strings': 1})
+        return ret
+
+    def _get_string_dict(self, string):
+        return {'r_addr': string.r_addr,
+                'sec_id': self._get_sec_id(self.dis_id, string.sec_name),
+                'sec_name': string.sec_name}
 
     def add_section(self, sec):
         self._add_section(sec)
 
     def _add_section(self, sec, upsert=False, query=None):
+        # The data itself goes into the blob store - the label only keeps
+        # the manifest, so section queries never drag the bytes along
         lab_dict = {'base_addr': sec.base_addr,
-                    'data': Binary(sec.data),
+                    'blob': BlobStore(self.db).put(sec.data),
                     'size': sec.size,
                     'attribs': str(sec.attribs)}
-        return self._add_label(sec, lab_dict, upsert, query)
+        ret = self._add_label(sec, lab_dict, upsert, query)
+        key = 'sections.%s.size' % stats.escape_key(sec.name)
+        self.db.stats.update({'project_id': self.proj_id,
+                              'dis_id': self.dis_id},
+                             {'$set': {key: sec.size}}, upsert=True)
+        return ret
 
     def add_location(self, loc):
         self._add_location(loc)
 
     def _add_location(self, loc, upsert=False, query=None):
-        lab_dict = {'r_addr': loc.r_addr,
-                    'sec_id':
-                    self._get_sec_id(self.dis_id,
-                                     loc.sec_name)}
-        return self._add_label(loc, lab_dict, upsert, query)
+        return self._add_label(loc, self._get_location_dict(loc),
+                               upsert, query)
+
+    def _get_location_dict(self, loc):
+        return {'r_addr': loc.r_addr,
+                'sec_id': self._get_sec_id(self.dis_id, loc.sec_name),
+                'sec_name': loc.sec_name}
+
+    def add_object(self, obj):
+        self._add_object(obj)
+
+    def _add_object(self, obj, upsert=False, query=None):
+        return self._add_label(obj, self._get_object_dict(obj),
+                               upsert, query)
+
+    def _get_object_dict(self, obj):
+        return {'r_addr': obj.r_addr,
+                'size': obj.size,
+                'sec_id': self._get_sec_id(self.dis_id, obj.sec_name),
+                'sec_name': obj.sec_name}
+
+    def batch_add_labels(self, labels):
+        """Adds all function, string, location and object labels in the list.
+
+        Does a bulk insert for improved query time.
+
+        :labels: A list of Label objects (of any of the above types)
+        :returns: None
+
+        """
+        builders = {'func': self._get_function_dict,
+                    'str': self._get_string_dict,
+                    'loc': self._get_location_dict,
+                    'obj': self._get_object_dict}
+        query = []
+        for label in labels:
+            lab_dict = builders[label.type](label)
+            lab_dict.update({'project_id': self.proj_id,
+                             'dis_id': self.dis_id,
+                             'type': label.type,
+                             'name': label.name})
+            query.append(lab_dict)
+
+        if len(query) > 0:
+            self.db.labels.insert(query)
+            metrics.incr('db/documents_written', len(query))
+
+        for label in labels:
+            if label.type == 'str':
+                self.update_stats(label.sec_name, {'strings': 1})
+
+    def batch_upsert_locations(self, locs):
+        """Adds all Location objects in the list that aren't already labelled.
+
+        Does a single bulk operation for improved query time. A location
+        is matched on its section and address, so any number of xrefs to
+        the same place share one label.
+
+        :locs: A list of Location objects to add
+        :returns: None
+
+        """
+        if len(locs) == 0:
+            return
+        bulk = self.db.labels.initialize_unordered_bulk_op()
+        for loc in locs:
+            lab_dict = self._get_location_dict(loc)
+            lab_dict.update({'project_id': self.proj_id,
+                             'dis_id': self.dis_id,
+                             'type': loc.type,
+                             'name': loc.name})
+            query = {'dis_id': self.dis_id,
+                     'type': loc.type,
+                     'sec_name': loc.sec_name,
+                     'r_addr': loc.r_addr}
+            bulk.find(query).upsert().update({'$setOnInsert': lab_dict})
+        bulk.execute()
+        metrics.incr('db/documents_written', len(locs))
 
     def upsert_function(self, func):
         self._upsert_function(func)
@@ -514,9 +806,37 @@ class DBManager():
 
         return True
 
+    #
+    # Runs
+    #
+    def add_run(self, run):
+        """Records the metrics of a disassembly run.
+
+        :run: A dict describing the run, as made by Disassembler
+        :returns: The id of the new record
+
+        """
+        run_dict = dict(run)
+        run_dict['project_id'] = self.proj_id
+        run_dict['dis_id'] = self.dis_id
+        return self.db.runs.insert(run_dict)
+
     #
     # Xrefs
     #
+    def _ensure_xref_indexes(self):
+        """Makes sure xrefs can be range queried from either end.
+
+        :returns: None
+
+        """
+        xref_col = self.db.xrefs
+        xref_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                               ('to_addr', pymongo.ASCENDING)], cache_for=300)
+        xref_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                               ('from_addr', pymongo.ASCENDING)],
+                              cache_for=300)
+
     def add_xref(self, xref):
         """
         Adds an Xref object to the database.
@@ -525,18 +845,322 @@ class DBManager():
         :returns: None
 
         """
-        # If it already exists then return False
         xref_col = self.db.xrefs
-        xref_dict = {'project_id': self.proj_id,
-                     'dis_id': self.dis_id,
-                     'base_addr': xref.base_addr,
-                     'base_sec_id': self._get_sec_id(self.dis_id,
-                                                     xref.base_sec_name),
-                     'ref_addr': xref.base_addr,
-                     'ref_sec_id': self._get_sec_id(self.dis_id,
-                                                    xref.ref_loc.sec_name)}
+        self._ensure_xref_indexes()
+        xref_col.insert(self._get_xref_dict(xref))
+        self.update_stats(xref.base_sec_name, {'xrefs': 1})
+
+    def _get_xref_dict(self, xref):
+        loc = xref.ref_loc
+        return {'project_id': self.proj_id,
+                'dis_id': self.dis_id,
+                'kind': xref.kind,
+                'from_addr': xref.base_addr + self._get_sec_base_addr(
+                    self.dis_id, xref.base_sec_name),
+                'from_sec_name': xref.base_sec_name,
+                'to_addr': loc.r_addr + self._get_sec_base_addr(self.dis_id,
+                                                                loc.sec_name),
+                'to_sec_name': loc.sec_name}
+
+    def batch_add_xrefs(self, xrefs):
+        """Adds all Xref objects in the list to the db.
+
+        Does a bulk insert for improved query time.
+
+        :xrefs: A list of Xref objects to add
+        :returns: None
+
+        """
+        query = [self._get_xref_dict(xref) for xref in xrefs]
+        if len(query) > 0:
+            self._ensure_xref_indexes()
+            self.db.xrefs.insert(query)
+            metrics.incr('db/documents_written', len(query))
+
+        per_sec = {}
+        for xref in xrefs:
+            per_sec[xref.base_sec_name] = per_sec.get(xref.base_sec_name,
+                                                      0) + 1
+        for sec_name, count in per_sec.iteritems():
+            self.update_stats(sec_name, {'xrefs': count})
+
+    #
+    # Byte index
+    #
+    def _ensure_byte_gram_indexes(self):
+        """Makes sure the grams of a project can be looked up.
+
+        :returns: None
+
+        """
+        self.db.byte_grams.ensure_index([('project_id', pymongo.ASCENDING),
+                                         ('gram', pymongo.ASCENDING)],
+                                        unique=True, cache_for=300)
+
+    def index_section_bytes(self, sec):
+        """Adds the grams of a section's data to the project's byte index.
+
+        :sec: A Section object
+        :returns: None
 
-        xref_col.insert(xref_dict)
+        """
+        grams = byteindex.find_grams(sec.data)
+        if len(grams) == 0:
+            return
+
+        self._ensure_byte_gram_indexes()
+        entry = {'dis_id': self.dis_id, 'sec_name': sec.name}
+        bulk = self.db.byte_grams.initialize_unordered_bulk_op()
+        for gram in grams.tolist():
+            bulk.find({'project_id': self.proj_id,
+                       'gram': gram}).upsert().update_one(
+                {'$addToSet': {'secs': entry}})
+        bulk.execute()
+        metrics.incr('db/documents_written', len(grams))
+
+    #
+    # Entropy maps
+    #
+    def set_entropy_map(self, sec_name, emap):
+        """Stores the entropy map of a section, replacing any other.
+
+        The map's arrays go to the blob store, so its record only keeps
+        their manifests and a few numbers.
+
+        :sec_name: Name of the section
+        :emap: An EntropyMap object
+        :returns: None
+
+        """
+        store = BlobStore(self.db)
+        manifests = dict((name, store.put(data))
+                         for name, data in emap.to_blobs().iteritems())
+        self.db.entropy_maps.update({'project_id': self.proj_id,
+                                     'dis_id': self.dis_id,
+                                     'sec_name': sec_name},
+                                    {'$set': {'block_size': emap.block_size,
+                                              'blocks': len(emap),
+                                              'blobs': manifests}},
+                                    upsert=True)
+
+    #
+    # Gadgets
+    #
+    def _ensure_gadget_indexes(self):
+        """Makes sure gadgets can be looked up by text and by mnemonic.
+
+        :returns: None
+
+        """
+        gadget_col = self.db.gadgets
+        gadget_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                                 ('text', pymongo.ASCENDING)],
+                                unique=True, cache_for=300)
+        gadget_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                                 ('mnemonics', pymongo.ASCENDING)],
+                                cache_for=300)
+
+    def batch_add_gadgets(self, gadgets):
+        """Adds all Gadget objects in the list to the db.
+
+        A gadget already stored for this disassembly, from another
+        section, just gains the new addresses.
+
+        :gadgets: A list of Gadget objects
+        :returns: None
+
+        """
+        if len(gadgets) == 0:
+            return
+        self._ensure_gadget_indexes()
+        bulk = self.db.gadgets.initialize_unordered_bulk_op()
+        for gadget in gadgets:
+            bulk.find({'dis_id': self.dis_id,
+                       'text': gadget.text}).upsert().update_one(
+                {'$setOnInsert': {'project_id': self.proj_id,
+                                  'mnemonics': gadget.mnemonics,
+                                  'insts': len(gadget),
+                                  'kind': gadget.kind},
+                 '$push': {'addrs': {'$each': gadget.addrs}}})
+        bulk.execute()
+        metrics.incr('db/documents_written', len(gadgets))
+
+    def remove_gadgets(self):
+        """Removes every gadget of this disassembly.
+
+        :returns: None
+
+        """
+        self.db.gadgets.remove({'dis_id': self.dis_id})
+
+    #
+    # Fingerprints
+    #
+    def _ensure_fingerprint_indexes(self):
+        """Makes sure fingerprints can be looked up by LSH bucket.
+
+        :returns: None
+
+        """
+        fp_col = self.db.fingerprints
+        fp_col.ensure_index([('project_id', pymongo.ASCENDING),
+                             ('bands', pymongo.ASCENDING)], cache_for=300)
+        fp_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                             ('start_addr', pymongo.ASCENDING)],
+                            cache_for=300)
+
+    def set_fingerprints(self, fingerprints, bands):
+        """Stores the fingerprints of this disassembly, replacing any others.
+
+        :fingerprints: A list of Fingerprint objects
+        :bands: The number of LSH bands to cut each signature into
+        :returns: None
+
+        """
+        self._ensure_fingerprint_indexes()
+        fp_col = self.db.fingerprints
+        fp_col.remove({'dis_id': self.dis_id})
+        query = [{'project_id': self.proj_id,
+                  'dis_id': self.dis_id,
+                  'name': x.name,
+                  'start_addr': x.start_addr,
+                  'insts': x.insts,
+                  'signature': Binary(minhash.to_bytes(x.signature)),
+                  'bands': minhash.get_bands(x.signature, bands)}
+                 for x in fingerprints]
+        if len(query) > 0:
+            fp_col.insert(query)
+            metrics.incr('db/documents_written', len(query))
+
+    #
+    # Function hashes and diffs
+    #
+    def _ensure_diff_indexes(self):
+        """Makes sure function hashes and diff results can be looked up.
+
+        :returns: None
+
+        """
+        self.db.function_hashes.ensure_index([('dis_id', pymongo.ASCENDING),
+                                              ('start_addr',
+                                               pymongo.ASCENDING)],
+                                             cache_for=300)
+        self.db.diffs.ensure_index([('dis_id', pymongo.ASCENDING),
+                                    ('other_dis_id', pymongo.ASCENDING)],
+                                   unique=True, cache_for=300)
+        self.db.diff_functions.ensure_index([('diff_id', pymongo.ASCENDING),
+                                             ('status', pymongo.ASCENDING)],
+                                            cache_for=300)
+
+    def set_function_hashes(self, hashes):
+        """Stores the function hashes of this disassembly, replacing others.
+
+        :hashes: A list of FunctionHash objects
+        :returns: None
+
+        """
+        self._ensure_diff_indexes()
+        hash_col = self.db.function_hashes
+        hash_col.remove({'dis_id': self.dis_id})
+        query = [{'project_id': self.proj_id,
+                  'dis_id': self.dis_id,
+                  'name': x.name,
+                  'start_addr': x.start_addr,
+                  'hash': x.hash,
+                  'shape': x.shape,
+                  'block_addrs': x.block_addrs,
+                  'block_hashes': x.block_hashes,
+                  'block_shapes': x.block_shapes}
+                 for x in hashes]
+        if len(query) > 0:
+            hash_col.insert(query)
+            metrics.incr('db/documents_written', len(query))
+
+    def set_diff(self, other_dis_name, entries):
+        """Stores the diff of this disassembly against another.
+
+        Any earlier diff of the two is replaced.
+
+        :other_dis_name: Name of the other disassembly of the project
+        :entries: A list of DiffEntry objects
+        :returns: The _id of the diff's record
+
+        """
+        self._ensure_diff_indexes()
+        other_dis_id = self._get_dis_id(self.proj_id, other_dis_name)
+        counts = dict((x, 0) for x in DIFF_STATUSES)
+        for entry in entries:
+            counts[entry.status] += 1
+
+        key = {'project_id': self.proj_id,
+               'dis_id': self.dis_id,
+               'other_dis_id': other_dis_id}
+        self.db.diffs.update(key, {'$set': {'counts': counts,
+                                            'created': time.time()}},
+                             upsert=True)
+        diff_id = self.db.diffs.find_one(key, {'_id': 1})['_id']
+
+        func_col = self.db.diff_functions
+        func_col.remove({'diff_id': diff_id})
+        query = [{'diff_id': diff_id,
+                  'status': x.status,
+                  'via': x.via,
+                  'a_name': x.a_name,
+                  'a_addr': x.a_addr,
+                  'b_name': x.b_name,
+                  'b_addr': x.b_addr,
+                  'similarity': x.similarity,
+                  'a_blocks': x.a_blocks,
+                  'b_blocks': x.b_blocks}
+                 for x in entries]
+        if len(query) > 0:
+            func_col.insert(query)
+            metrics.incr('db/documents_written', len(query))
+        return diff_id
+
+    #
+    # Call graphs
+    #
+    def set_call_graph(self, graph):
+        """Stores the call graph of this disassembly, replacing any other.
+
+        The graph's arrays go to the blob store, so its record only keeps
+        their manifests and a few counts.
+
+        :graph: A CallGraph object
+        :returns: None
+
+        """
+        store = BlobStore(self.db)
+        manifests = dict((name, store.put(data))
+                         for name, data in graph.to_blobs().iteritems())
+        self.db.callgraphs.update({'project_id': self.proj_id,
+                                   'dis_id': self.dis_id},
+                                  {'$set': {'functions': len(graph),
+                                            'calls': graph.get_num_calls(),
+                                            'reachability':
+                                                graph.reach is not None,
+                                            'blobs': manifests}},
+                                  upsert=True)
+
+    #
+    # Stats
+    #
+    def update_stats(self, sec_name, counts, sign=1):
+        """Adds to the summary statistics of a section.
+
+        :sec_name: Name of the section
+        :counts: A dict of counts to add (see stats.count_records)
+        :sign: 1 to add the counts, -1 to take them away
+        :returns: None
+
+        """
+        inc = stats.make_inc(sec_name, counts, sign)
+        if len(inc) == 0:
+            return
+        self.db.stats.update({'project_id': self.proj_id,
+                              'dis_id': self.dis_id},
+                             {'$inc': inc}, upsert=True)
 
     ##################################
     # Querying
@@ -565,38 +1189,454 @@ class DBManager():
         rec = self.get_disassembly_record(self.dis_id)
         return rec['mode']
 
+    def get_disassembly(self):
+        """Fetches the current disassembly.
+
+        :returns: A Disassembly object
+
+        """
+        rec = self.get_disassembly_record(self.dis_id)
+        return Disassembly(rec['dis_name'], rec['binary_name'],
+                           rec['binary_format'], rec['architecture'],
+                           rec['mode'], rec['md5'], rec['size'],
+                           rec['entry_point'])
+
     def get_instructions(self, sec_name):
         """A portability hack.
         """
         for x in self.get_disassembler_records(sec_name):
             yield x
 
-    def get_disassembler_records(self, sec_name):
+    def get_disassembler_records(self, sec_name, fields=None):
         """Yields all instruction objects in the given section
 
         :sec_name: Name of the section to retrieve instructions for.
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
         :returns: Instruction objects
         """
+        query = self._get_sec_query(sec_name)
+        cursor = self.db.disassembler.find(query,
+                                           self._get_projection(fields))
+        cursor = cursor.sort('addr', pymongo.ASCENDING).batch_size(1000)
+        for each in cursor:
+            yield self._record_to_instruction(each)
+
+    def _get_sec_query(self, sec_name, addr_query=None):
+        """Builds a disassembler query scoped to one section of this dis.
+
+        :sec_name: Name of the section
+        :addr_query: Optional condition on the addr field
+        :returns: A query dict
 
         """
-        query = {'sec_id': self._get_sec_id(self.dis_id, sec_name)}
-        for each in self.db.disassembler.find(query).sort('r_addr', 1):
-            yield each
+        query = {'dis_id': self.dis_id, 'sec_name': sec_name}
+        if addr_query is not None:
+            query['addr'] = addr_query
+        return query
+
+    def _get_projection(self, fields):
+        """Turns a list of field names into a pymongo projection.
+
+        addr and is_text are always fetched since an Instruction
+        can't be built without them.
+
+        :fields: A list of field names or None for every field
+        :returns: A projection dict or None
+
         """
+        if fields is None:
+            return None
+        projection = dict((f, 1) for f in fields)
+        projection.update({'addr': 1, 'is_text': 1})
+        return projection
+
+    def _get_batch_size(self, count):
+        """Picks a cursor batch size for a query returning count records.
+
+        Windowed reads know exactly how many records they want, so fetch
+        them in a single round trip where possible.
+
+        :count: The number of records the caller wants
+        :returns: A batch size for the cursor
+
+        """
+        return max(1, min(count + 1, 1000))
+
+    def _record_to_instruction(self, rec):
+        """Turns a disassembler record into an Instruction object.
+
+        Fields that were left out of a projection come back as None.
+
+        :rec: A disassembler record
+        :returns: An Instruction object
+
+        """
+        if rec['is_text']:
+            return Instruction(rec['addr'], True, rec.get('my_bytes'),
+                               rec.get('mnemonic'),
+                               operands=rec.get('operands'))
+        else:
+            return Instruction(rec['addr'], False, rec.get('my_bytes'),
+                               rec.get('mnemonic'), disp=rec.get('disp'))
+
+    def get_records_in_addr_range(self, sec_name, start_addr, end_addr,
+                                  fields=None):
+        """Yields the instructions whose addresses fall in a window.
+
+        :sec_name: Name of the section
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive)
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
+        :returns: Instruction objects in address order
+
+        """
+        query = self._get_sec_query(sec_name, {'$gte': start_addr,
+                                               '$lt': end_addr})
+        cursor = self.db.disassembler.find(query,
+                                           self._get_projection(fields))
+        cursor = cursor.sort('addr', pymongo.ASCENDING).batch_size(1000)
+        for each in cursor:
+            yield self._record_to_instruction(each)
+
+    def find_instructions(self, terms, fields=None, limit=0):
+        """Finds the instructions that match every one of a list of terms.
+
+        Each term is a search key (see instindex). The key held by the
+        fewest instructions is looked up in the index and the rest are
+        checked on just the instructions it gives.
+
+        :terms: A list of (kind, value) tuples, kind being one of
+                instindex.KEY_KINDS, e.g. [('mnemonic', 'call'),
+                ('target', 0x401000)]
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
+        :limit: The most instructions to return, or 0 for all of them
+        :returns: A list of (sec_name, Instruction) tuples in address
+                  order
+
+        """
+        keys = sorted(set(instindex.make_key(k, v) for k, v in terms))
+        if len(keys) == 0:
+            return []
+
+        self._ensure_disassembler_indexes()
+        dis_col = self.db.disassembler
+        counts = sorted((dis_col.find({'dis_id': self.dis_id,
+                                       'search_keys': x}).count(), x)
+                        for x in keys)
+        if counts[0][0] == 0:
+            return []
+
+        rest = [x for count, x in counts[1:]]
+        query = {'dis_id': self.dis_id, 'search_keys': counts[0][1]}
+        if len(rest) > 0:
+            query = {'$and': [query, {'search_keys': {'$all': rest}}]}
+
+        projection = self._get_projection(fields)
+        if projection is not None:
+            projection['sec_name'] = 1
+        cursor = dis_col.find(query, projection).sort('addr',
+                                                      pymongo.ASCENDING)
+        cursor = cursor.limit(limit).batch_size(1000)
+        return [(x['sec_name'], self._record_to_instruction(x))
+                for x in cursor]
+
+    def get_record_addr(self, record_id):
+        """Finds where a disassembler record is.
+
+        :record_id: The _id of the record
+        :returns: A (sec_name, addr) tuple with the absolute address of the
+                  record, or None if there is no such record
+
+        """
+        rec = self.db.disassembler.find_one({'_id': record_id,
+                                             'dis_id': self.dis_id},
+                                            {'sec_name': 1, 'addr': 1})
+        if rec is None:
+            return None
+        return rec['sec_name'], rec['addr']
+
+    def get_record_bounds(self, sec_name, start_addr, end_addr):
+        """Widens an address range to take in every record it overlaps.
+
+        :sec_name: Name of the section
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive)
+        :returns: A (start_addr, end_addr) tuple of absolute addresses
+
+        """
+        start_addr = self._get_inst_addr_containing(sec_name, start_addr)
+        query = self._get_sec_query(sec_name, {'$lt': end_addr})
+        cursor = self.db.disassembler.find(query, {'addr': 1, 'my_bytes': 1})
+        for rec in cursor.sort('addr', pymongo.DESCENDING).limit(1):
+            end_addr = max(end_addr, rec['addr'] + len(rec['my_bytes']))
+        return start_addr, end_addr
+
+    def get_data_run_bounds(self, sec_name, addr):
+        """Finds the run of data records around an address.
+
+        :sec_name: Name of the section
+        :addr: An absolute address
+        :returns: A (start_addr, end_addr) tuple of absolute addresses
+                  between the instructions either side of addr, or the
+                  ends of the section where there are none
+
+        """
+        sec = self.get_section(sec_name)
+        start_addr = sec.base_addr
+        end_addr = sec.base_addr + sec.size
+
+        query = self._get_sec_query(sec_name, {'$lte': addr})
+        query['is_text'] = True
+        cursor = self.db.disassembler.find(query, {'addr': 1, 'my_bytes': 1})
+        for rec in cursor.sort('addr', pymongo.DESCENDING).limit(1):
+            start_addr = rec['addr'] + len(rec['my_bytes'])
+
+        query = self._get_sec_query(sec_name, {'$gt': addr})
+        query['is_text'] = True
+        cursor = self.db.disassembler.find(query, {'addr': 1})
+        for rec in cursor.sort('addr', pymongo.ASCENDING).limit(1):
+            end_addr = rec['addr']
+        return start_addr, end_addr
+
+    def get_next_page(self, sec_name, cursor_addr, count, fields=None,
+                      inclusive=False):
+        """Fetches the page of instructions following cursor_addr.
+
+        :sec_name: Name of the section
+        :cursor_addr: Absolute address of the last record already shown,
+                      or None to start at the top of the section
+        :count: Number of instructions in the page
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
+        :inclusive: If the record at cursor_addr starts the page
+        :returns: A list of Instruction objects in address order
+
+        """
+        # A limit of 0 means no limit to mongo
+        if count <= 0:
+            return []
+        addr_query = None
+        if cursor_addr is not None:
+            addr_query = {'$gte' if inclusive else '$gt': cursor_addr}
+        query = self._get_sec_query(sec_name, addr_query)
+        cursor = self.db.disassembler.find(query,
+                                           self._get_projection(fields))
+        cursor = cursor.sort('addr', pymongo.ASCENDING).limit(count)
+        cursor = cursor.batch_size(self._get_batch_size(count))
+        return [self._record_to_instruction(x) for x in cursor]
+
+    def get_prev_page(self, sec_name, cursor_addr, count, fields=None):
+        """Fetches the page of instructions preceding cursor_addr.
+
+        :sec_name: Name of the section
+        :cursor_addr: Absolute address of the first record already shown,
+                      or None to end at the bottom of the section
+        :count: Number of instructions in the page
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
+        :returns: A list of Instruction objects in address order
+
+        """
+        # A limit of 0 means no limit to mongo
+        if count <= 0:
+            return []
+        addr_query = None
+        if cursor_addr is not None:
+            addr_query = {'$lt': cursor_addr}
+        query = self._get_sec_query(sec_name, addr_query)
+        cursor = self.db.disassembler.find(query,
+                                           self._get_projection(fields))
+        cursor = cursor.sort('addr', pymongo.DESCENDING).limit(count)
+        cursor = cursor.batch_size(self._get_batch_size(count))
+        page = [self._record_to_instruction(x) for x in cursor]
+        page.reverse()
+        return page
+
+    def get_window_at_addr(self, sec_name, addr, before, after, fields=None):
+        """Jumps to an address and fetches the instructions around it.
+
+        The instruction containing addr is the first record of the
+        'after' half of the window.
+
+        :sec_name: Name of the section
+        :addr: The absolute address to jump to
+        :before: Number of instructions to show before addr
+        :after: Number of instructions to show from addr onwards
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
+        :returns: A (row, instructions) tuple where row is the row number
+                  of the first instruction in the window
+
+        """
+        start = self._get_inst_addr_containing(sec_name, addr)
+        page = self.get_prev_page(sec_name, start, before, fields)
+        page += self.get_next_page(sec_name, start, after, fields,
+                                   inclusive=True)
+        if len(page) == 0:
+            return 0, page
+        return self.get_row_for_addr(sec_name, page[0].r_addr), page
+
+    def get_rows(self, sec_name, row, count, fields=None):
+        """Fetches count instructions starting at a row number.
+
+        :sec_name: Name of the section
+        :row: The zero-based row of the first instruction in the window
+        :count: Number of instructions to fetch
+        :fields: Optional list of record fields to fetch (see VIEW_FIELDS)
+        :returns: A list of Instruction objects in address order
+
+        """
+        addr = self.get_addr_for_row(sec_name, row)
+        if addr is None:
+            return []
+        return self.get_next_page(sec_name, addr, count, fields,
+                                  inclusive=True)
+
+    def get_row_count(self, sec_name):
+        """Count the number of rows (instructions) in the given section
+
+        :sec_name: Name of the section
+        :returns: Number of rows in the section
+
+        """
+        return self.db.disassembler.count(self._get_sec_query(sec_name))
+
+    def _get_inst_addr_containing(self, sec_name, addr):
+        """Returns the start address of the record at or before addr.
+
+        :sec_name: Name of the section
+        :addr: An absolute address
+        :returns: The address of the record addr falls in (or addr itself
+                  if there is nothing before it)
+
+        """
+        query = self._get_sec_query(sec_name, {'$lte': addr})
+        cursor = self.db.disassembler.find(query, {'addr': 1})
+        for rec in cursor.sort('addr', pymongo.DESCENDING).limit(1):
+            return rec['addr']
+        return addr
+
+    #
+    # Row index
+    #
+    '''
+    The row index maps row numbers (the position of a record within its
+    section when sorted by address) to addresses and back. Rather than
+    storing every row, it stores a checkpoint every ROW_INDEX_INTERVAL rows,
+    so both directions are an indexed lookup of the nearest checkpoint
+    followed by a walk of at most ROW_INDEX_INTERVAL index entries.
+
+    The index is rebuilt lazily the first time it is needed after any
+    change to a section's records.
+
+    '''
+
+    def _ensure_row_index_indexes(self):
+        """Makes sure checkpoints can be found by address or by row.
+
+        :returns: None
+
+        """
+        row_col = self.db.row_index
+        row_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                              ('sec_name', pymongo.ASCENDING),
+                              ('addr', pymongo.ASCENDING)], cache_for=300)
+        row_col.ensure_index([('dis_id', pymongo.ASCENDING),
+                              ('sec_name', pymongo.ASCENDING),
+                              ('row', pymongo.ASCENDING)], cache_for=300)
+
+    def build_row_index(self, sec_name):
+        """(Re)builds the row index checkpoints for a section.
+
+        Only the addr field is streamed back, so this is a single cheap
+        pass over the section's address index.
+
+        :sec_name: Name of the section
+        :returns: None
+
+        """
+        self._ensure_disassembler_indexes()
+        self._ensure_row_index_indexes()
+        self.invalidate_row_index(sec_name)
+
+        query = self._get_sec_query(sec_name)
+        cursor = self.db.disassembler.find(query, {'_id': 0, 'addr': 1})
+        cursor = cursor.sort('addr', pymongo.ASCENDING).batch_size(5000)
+
+        checkpoints = []
+        for row, rec in enumerate(cursor):
+            if row % ROW_INDEX_INTERVAL == 0:
+                checkpoints.append({'project_id': self.proj_id,
+                                    'dis_id': self.dis_id,
+                                    'sec_name': sec_name,
+                                    'row': row,
+                                    'addr': rec['addr']})
+
+        if len(checkpoints) > 0:
+            self.db.row_index.insert(checkpoints)
+
+    def invalidate_row_index(self, sec_name):
+        """Throws away the row index of a section after it changed.
+
+        :sec_name: Name of the section
+        :returns: None
+
+        """
+        self.db.row_index.remove({'dis_id': self.dis_id,
+                                  'sec_name': sec_name})
+
+    def _get_row_checkpoint(self, sec_name, field, val):
+        """Finds the closest checkpoint at or before val, building if needed.
+
+        :sec_name: Name of the section
+        :field: Either 'addr' or 'row'
+        :val: The addr or row to look for
+        :returns: A checkpoint record or None for an empty section
+
+        """
+        query = {'dis_id': self.dis_id, 'sec_name': sec_name}
+        row_col = self.db.row_index
+        if row_col.find_one(query, {'_id': 1}) is None:
+            self.build_row_index(sec_name)
+
+        query[field] = {'$lte': val}
+        cursor = row_col.find(query).sort(field, pymongo.DESCENDING)
+        for rec in cursor.limit(1):
+            return rec
+        return None
+
+    def get_row_for_addr(self, sec_name, addr):
+        """Returns the row number that the record containing addr is in.
+
+        :sec_name: Name of the section
+        :addr: An absolute address
+        :returns: A zero-based row number
+
+        """
+        addr = self._get_inst_addr_containing(sec_name, addr)
+        checkpoint = self._get_row_checkpoint(sec_name, 'addr', addr)
+        if checkpoint is None:
+            return 0
+        query = self._get_sec_query(sec_name, {'$gte': checkpoint['addr'],
+                                               '$lt': addr})
+        return checkpoint['row'] + self.db.disassembler.count(query)
+
+    def get_addr_for_row(self, sec_name, row):
+        """Returns the address of the record at a row number.
+
+        :sec_name: Name of the section
+        :row: A zero-based row number
+        :returns: An absolute address or None if row is past the end
+
+        """
+        checkpoint = self._get_row_checkpoint(sec_name, 'row', row)
+        if checkpoint is None:
+            return None
+        query = self._get_sec_query(sec_name, {'$gte': checkpoint['addr']})
+        cursor = self.db.disassembler.find(query, {'addr': 1})
+        cursor = cursor.sort('addr', pymongo.ASCENDING)
+        cursor = cursor.skip(row - checkpoint['row']).limit(1)
+        for rec in cursor:
+            return rec['addr']
+        return None
 
-        #query = {'sec_id': self._get_sec_id(self.dis_id, sec_name)}
-        query = {'sec_name': sec_name}
-        for each in self.db.disassembler.find(query).sort('addr',
-                                                          pymongo.ASCENDING):
-            is_text = each['is_text']
-            if is_text:
-                yield Instruction(each['addr'], each['is_text'],
-                                  each['my_bytes'], each['mnemonic'],
-                                  operands=each['operands'])
-            else:
-                yield Instruction(each['addr'], each['is_text'],
-                                  each['my_bytes'], each['mnemonic'],
-                                  disp=each['disp'])
     #
     # Labels
     #
@@ -608,20 +1648,355 @@ class DBManager():
         :returns: Number of instructions in the section
 
         """
-        query = {'sec_id': self._get_sec_id(self.dis_id, sec_name)}
-        return self.db.disassembler.count(query)
+        return self.get_row_count(sec_name)
+
+    def get_stats(self):
+        """Fetches the summary statistics of this disassembly.
+
+        :returns: A dict with 'sections' and 'totals' (see stats.read_stats)
+
+        """
+        return stats.read_stats(self.db.stats.find_one({'dis_id':
+                                                        self.dis_id}))
+
+    def get_xrefs_to(self, start_addr, end_addr=None, kind=None):
+        """Fetches the xrefs to an address, or into an address range.
+
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive), or None for only
+                   the xrefs to start_addr
+        :kind: Optionally, one of XREF_KINDS to limit the xrefs to
+        :returns: A list of Xref objects ordered by the address referred to
+
+        """
+        return self._get_xrefs('to_addr', start_addr, end_addr, kind)
+
+    def get_xrefs_from(self, start_addr, end_addr=None, kind=None):
+        """Fetches the xrefs made from an address, or from an address range.
+
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive), or None for only
+                   the xrefs made by the instruction at start_addr
+        :kind: Optionally, one of XREF_KINDS to limit the xrefs to
+        :returns: A list of Xref objects ordered by the referencing address
+
+        """
+        return self._get_xrefs('from_addr', start_addr, end_addr, kind)
+
+    def _get_xrefs(self, field, start_addr, end_addr, kind):
+        """Range queries the xrefs on one of their addresses.
+
+        :field: Either 'to_addr' or 'from_addr'
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive), or None
+        :kind: One of XREF_KINDS, or None for any
+        :returns: A list of Xref objects ordered by field
+
+        """
+        self._ensure_xref_indexes()
+        if end_addr is None:
+            end_addr = start_addr + 1
+        query = {'dis_id': self.dis_id,
+                 field: {'$gte': start_addr, '$lt': end_addr}}
+        if kind is not None:
+            query['kind'] = kind
+        cursor = self.db.xrefs.find(query).sort(field, pymongo.ASCENDING)
+        return [self._record_to_xref(x) for x in cursor.batch_size(1000)]
+
+    def search_bytes(self, pattern, all_disassemblies=False):
+        """Finds every occurrence of a byte pattern in the section data.
+
+        The byte index narrows the search down to the sections holding
+        every gram of the pattern, and only those sections are scanned.
+        A pattern without GRAM_SIZE bytes in a row free of wildcards
+        can't use the index, so every section is scanned for it.
+
+        :pattern: A string of hex bytes where '??' matches any byte,
+                  e.g. 'de ad ?? ef'
+        :all_disassemblies: Whether to search every disassembly in the
+                            project rather than only this one
+        :returns: A list of (dis_name, sec_name, addr) tuples, where addr
+                  is the absolute address of a match
+
+        """
+        parsed = parse_pattern(pattern)
+        dis_ids = [self.dis_id]
+        if all_disassemblies:
+            dis_ids = self._get_project_dis_ids(self.proj_id)
+
+        candidates = None
+        grams = byteindex.get_pattern_grams(parsed)
+        if len(grams) > 0:
+            self._ensure_byte_gram_indexes()
+            recs = list(self.db.byte_grams.find({'project_id': self.proj_id,
+                                                 'gram': {'$in': grams}}))
+            if len(recs) < len(grams):
+                return []
+            for rec in recs:
+                secs = set((x['dis_id'], x['sec_name']) for x in rec['secs'])
+                candidates = secs if candidates is None else candidates & secs
+
+        store = BlobStore(self.db)
+        matches = []
+        for dis_id in dis_ids:
+            dis_name = self.get_disassembly_record(dis_id)['dis_name']
+            for rec in self.db.labels.find({'dis_id': dis_id, 'type': 'sec'}):
+                if (candidates is not None and
+                        (dis_id, rec['name']) not in candidates):
+                    continue
+                data = store.read(rec['blob'])
+                for offset in find_pattern(data, parsed).tolist():
+                    matches.append((dis_name, rec['name'],
+                                    rec['base_addr'] + offset))
+        return sorted(matches)
+
+    def find_gadgets(self, mnemonics=None, pattern=None, kind=None,
+                     max_insts=None, limit=0):
+        """Finds the gadgets matching every one of the given conditions.
+
+        :mnemonics: A list of mnemonics the gadget must all use
+        :pattern: A regular expression the gadget's text must match, e.g.
+                  '^pop rdi ; ret$' - anchored ones make use of the index
+        :kind: One of GADGET_KINDS
+        :max_insts: The most instructions the gadget may have
+        :limit: The most gadgets to return, or 0 for all of them
+        :returns: A list of Gadget objects, shortest first
+
+        """
+        self._ensure_gadget_indexes()
+        query = {'dis_id': self.dis_id}
+        if mnemonics is not None:
+            query['mnemonics'] = {'$all': list(mnemonics)}
+        if pattern is not None:
+            query['text'] = {'$regex': pattern}
+        if kind is not None:
+            query['kind'] = kind
+        if max_insts is not None:
+            query['insts'] = {'$lte': max_insts}
+
+        cursor = self.db.gadgets.find(query).sort([('insts',
+                                                    pymongo.ASCENDING),
+                                                   ('text',
+                                                    pymongo.ASCENDING)])
+        return [Gadget(x['text'], x['mnemonics'], x['kind'],
+                       sorted(x['addrs']))
+                for x in cursor.limit(limit).batch_size(1000)]
+
+    def find_similar_functions(self, func, threshold=0.5, limit=20,
+                               all_disassemblies=True):
+        """Finds the functions most like one function of this disassembly.
+
+        Only the functions sharing an LSH bucket with it are compared, so
+        a few pairs with a similarity just over the threshold may be
+        missed.
+
+        :func: A function name, or the absolute start address of one
+        :threshold: The lowest estimated similarity to return, from 0 to 1
+        :limit: The most functions to return
+        :all_disassemblies: Whether to look through every disassembly in
+                            the project rather than only this one
+        :returns: A list of (dis_name, Fingerprint, similarity) tuples,
+                  most similar first
+
+        """
+        self._ensure_fingerprint_indexes()
+        fp_col = self.db.fingerprints
+        field = 'name' if isinstance(func, basestring) else 'start_addr'
+        rec = fp_col.find_one({'dis_id': self.dis_id, field: func})
+        if rec is None:
+            return []
+
+        query = {'project_id': self.proj_id,
+                 'bands': {'$in': rec['bands']},
+                 '_id': {'$ne': rec['_id']}}
+        if not all_disassemblies:
+            query['dis_id'] = self.dis_id
+
+        signature = self._record_to_fingerprint(rec).signature
+        dis_names = {}
+        found = []
+        for other in fp_col.find(query).batch_size(1000):
+            fingerprint = self._record_to_fingerprint(other)
+            similarity = minhash.get_similarity(signature,
+                                                fingerprint.signature)
+            if similarity < threshold:
+                continue
+            if other['dis_id'] not in dis_names:
+                dis_names[other['dis_id']] = self.get_disassembly_record(
+                    other['dis_id'])['dis_name']
+            found.append((dis_names[other['dis_id']], fingerprint,
+                          similarity))
+        found.sort(key=lambda x: (-x[2], x[0], x[1].start_addr))
+        return found[:limit]
+
+    def _record_to_fingerprint(self, rec):
+        """Turns a fingerprints record into a Fingerprint object.
+
+        :rec: The fingerprints record
+        :returns: A Fingerprint object
+
+        """
+        return Fingerprint(rec['name'], rec['start_addr'], rec['insts'],
+                           minhash.from_bytes(str(rec['signature'])))
+
+    def get_function_hashes(self):
+        """Fetches the function hashes of this disassembly.
+
+        :returns: A list of FunctionHash objects in address order, or None
+                  if none have been made
+
+        """
+        cursor = self.db.function_hashes.find({'dis_id': self.dis_id})
+        cursor = cursor.sort('start_addr', pymongo.ASCENDING)
+        hashes = [FunctionHash(x['name'], x['start_addr'], x['block_addrs'],
+                               x['block_hashes'], x['block_shapes'])
+                  for x in cursor.batch_size(1000)]
+        return hashes if len(hashes) > 0 else None
+
+    def get_diff(self, other_dis_name, status=None):
+        """Fetches the diff of this disassembly against another.
+
+        :other_dis_name: Name of the other disassembly of the project
+        :status: One of DIFF_STATUSES to only fetch those functions, or
+                 None for all of them
+        :returns: A list of DiffEntry objects, or None if the two haven't
+                  been diffed
+
+        """
+        other_dis_id = self._get_dis_id(self.proj_id, other_dis_name)
+        rec = self.db.diffs.find_one({'dis_id': self.dis_id,
+                                      'other_dis_id': other_dis_id},
+                                     {'_id': 1})
+        if rec is None:
+            return None
+        query = {'diff_id': rec['_id']}
+        if status is not None:
+            query['status'] = status
+        cursor = self.db.diff_functions.find(query).sort('_id',
+                                                         pymongo.ASCENDING)
+        return [DiffEntry(x['status'], x['via'], x['a_name'], x['a_addr'],
+                          x['b_name'], x['b_addr'], x['similarity'],
+                          x['a_blocks'], x['b_blocks'])
+                for x in cursor.batch_size(1000)]
+
+    def get_entropy_map(self, sec_name):
+        """Fetches the entropy map of a section.
+
+        :sec_name: Name of the section
+        :returns: An EntropyMap object, or None if none has been made
+
+        """
+        rec = self.db.entropy_maps.find_one({'dis_id': self.dis_id,
+                                             'sec_name': sec_name})
+        if rec is None:
+            return None
+        store = BlobStore(self.db)
+        return EntropyMap.from_blobs(rec['block_size'],
+                                     dict((name, store.read(manifest))
+                                          for name, manifest
+                                          in rec['blobs'].iteritems()))
+
+    def has_function_hashes(self):
+        """Checks whether function hashes have been stored for this
+        disassembly.
+
+        :returns: True if there are some
+
+        """
+        return self.db.function_hashes.find_one({'dis_id': self.dis_id},
+                                                {'_id': 1}) is not None
+
+    def has_fingerprints(self):
+        """Checks whether fingerprints have been stored for this disassembly.
+
+        :returns: True if there are some
+
+        """
+        return self.db.fingerprints.find_one({'dis_id': self.dis_id},
+                                             {'_id': 1}) is not None
+
+    def has_call_graph(self):
+        """Checks whether a call graph has been stored for this disassembly.
+
+        :returns: True if there is one
+
+        """
+        return self.db.callgraphs.find_one({'dis_id': self.dis_id},
+                                           {'_id': 1}) is not None
+
+    def get_call_graph(self):
+        """Fetches the call graph of this disassembly.
+
+        :returns: A CallGraph object, or None if none has been built
+
+        """
+        rec = self.db.callgraphs.find_one({'dis_id': self.dis_id})
+        if rec is None:
+            return None
+        store = BlobStore(self.db)
+        return CallGraph.from_blobs(dict((name, store.read(manifest))
+                                         for name, manifest
+                                         in rec['blobs'].iteritems()))
+
+    def get_code_addrs(self, sec_name):
+        """Fetches the address of every instruction in a section.
+
+        :sec_name: Name of the section
+        :returns: A list of absolute addresses in ascending order
+
+        """
+        query = self._get_sec_query(sec_name)
+        query['is_text'] = True
+        cursor = self.db.disassembler.find(query, {'addr': 1, '_id': 0})
+        cursor = cursor.sort('addr', pymongo.ASCENDING).batch_size(10000)
+        return [x['addr'] for x in cursor]
+
+    def _record_to_xref(self, rec):
+        """Turns an xrefs record into an Xref object.
+
+        :rec: The xrefs record
+        :returns: An Xref object
+
+        """
+        to_base = self._get_sec_base_addr(self.dis_id, rec['to_sec_name'])
+        loc = Location('loc_%08x' % rec['to_addr'], rec['to_addr'] - to_base,
+                       rec['to_sec_name'])
+        from_base = self._get_sec_base_addr(self.dis_id, rec['from_sec_name'])
+        return Xref(rec['from_addr'] - from_base, rec['from_sec_name'], loc,
+                    rec['kind'])
 
-    def _get_bytes_for_sec(self, sec_rec):
-        """Returns the raw bytes of the section
+    def _record_to_section(self, sec_rec):
+        """Turns a section label into a Section object.
+
+        The section's data is not fetched - it is read from the blob
+        store the first time the Section's data is used, over this
+        manager's connection.
 
         :sec_rec: The section record
-        :returns: A string of raw bytes
+        :returns: A Section object
 
         """
-        dis_col = self.db.disassembler
-        inst_recs = dis_col.find({'sec_id': sec_rec['_id']}, {'my_bytes': 1})
+        blob = BlobRef(self.host, self.port, sec_rec['blob'],
+                       BlobStore(self.db))
+        return Section(sec_rec['name'], None, Attributes(sec_rec['attribs']),
+                       sec_rec['base_addr'], sec_rec['size'], blob=blob)
+
+    def get_section_bytes(self, sec_name, start=0, end=None):
+        """Reads a range of a section's data from the blob store.
 
-        return ''.join(r['my_bytes'] for r in inst_recs)
+        Only the chunks overlapping the range are fetched.
+
+        :sec_name: Name of the section
+        :start: Relative address of the first byte (inclusive)
+        :end: Relative address of the last byte (exclusive), or None
+              to read to the end of the section
+        :returns: A string of raw bytes
+
+        """
+        rec = self.db.labels.find_one({'dis_id': self.dis_id,
+                                       'type': 'sec',
+                                       'name': sec_name}, {'blob': 1})
+        return BlobStore(self.db).read(rec['blob'], start, end)
 
     def get_functions(self):
         """Get all functions in the project
@@ -632,6 +2007,7 @@ class DBManager():
         return [Function(x['name'],
                          x['r_start_addr'],
                          x['r_end_addr'],
+                         x.get('sec_name'),
                          x['l_vars'])
                 for x in self._get_label_records('func')]
 
@@ -641,9 +2017,19 @@ class DBManager():
         :returns: A list of String objects
 
         """
-        return [String(x['name'], x['r_addr'])
+        return [String(x['name'], x['r_addr'], x.get('sec_name'))
                 for x in self._get_label_records('str')]
 
+    def get_objects(self):
+        """Get all data objects in the project
+
+        :returns: A list of DataObject objects
+
+        """
+        return [DataObject(x['name'], x['r_addr'], x['size'],
+                           x.get('sec_name'))
+                for x in self._get_label_records('obj')]
+
     @memoize
     def get_section_containing_addr(self, addr, executable=None):
         """Returns the section that 'owns' the address `addr`
@@ -687,18 +2073,9 @@ class DBManager():
         labels = self._get_label_records('sec')
 
         for x in labels:
-            att = Attributes(x['attribs'])
-            if executable is None:
-                yield Section(x['name'], x['data'], att,
-                              x['base_addr'], x['size'])
-
-            elif executable and att.executable:
-                yield Section(x['name'], x['data'], att,
-                              x['base_addr'], x['size'])
-
-            elif not executable and not att.executable:
-                yield Section(x['name'], x['data'], att,
-                              x['base_addr'], x['size'])
+            sec = self._record_to_section(x)
+            if executable is None or executable == sec.is_executable():
+                yield sec
 
     def get_section(self, sec_name):
         """Returns a section object for a section with this name.
@@ -707,11 +2084,12 @@ class DBManager():
         :returns: A Section object
 
         """
-        labels = self._get_label_records('sec')
-        for x in labels:
-            if x['name'] == sec_name:
-                return Section(x['name'], self._get_bytes_for_sec(x),
-                               x['attribs'], x['base_addr'], x['size'])
+        rec = self.db.labels.find_one({'project_id': self.proj_id,
+                                       'dis_id': self.dis_id,
+                                       'type': 'sec',
+                                       'name': sec_name})
+        if rec is not None:
+            return self._record_to_section(rec)
 
     def get_locations(self):
         """Returns a list of all location objects in the disassembly
@@ -719,8 +2097,8 @@ class DBManager():
         :returns: A list of location objects
 
         """
-        return [Location(x['name'], x['r_addr'])
-                for x in self.get_labels('loc')]
+        return [Location(x['name'], x['r_addr'], x.get('sec_name'))
+                for x in self._get_label_records('loc')]
 
     def _get_label_records(self, filt):
         """Returns all label records matching the given filter
@@ -737,7 +2115,7 @@ class DBManager():
         if filt == 'sec':
             return lab_col.find({'project_id': self.proj_id,
                                  'dis_id': self.dis_id, 'type': filt}).sort('base_addr', 1)
-        elif filt == 'func' or filt == 'str' or filt == 'loc':
+        elif filt in ('func', 'str', 'loc', 'obj'):
             return lab_col.find({'project_id': self.proj_id,
                                  'dis_id': self.dis_id, 'type': filt})
         else:
@@ -753,21 +2131,14 @@ class DBManager():
         Does a bulk removal for improved query time.
 
         :sec_name: Name of the section addresses belong to
-        :address_ranges: A list of [start, end] address pairs
+        :address_ranges: A list of [start, end] relative address pairs
         :returns: None
 
         """
-        self.log.debug('Removing instructions in address ranges: %s'
-                       % str(address_ranges))
-        dis_col = self.db.disassembler
-        sec_id = self._get_sec_id(self.dis_id, sec_name)
-        query = []
-        for r in address_ranges:
-            d = {'sec_id': sec_id,
-                 'r_addr': {'$gte': r[0],
-                            '$lt': r[1]}}
-            query.append(d)
-        dis_col.remove(query)
+        self.log.debug('Removing instructions in address ranges: %s',
+                       address_ranges)
+        self.replace_ranges(sec_name, [(r[0], r[1], [])
+                                       for r in address_ranges])
 
     def delete_insts_in_addr_range(self, sec_name, start_addr, end_addr):
         """Deletes all instructions in the given range
@@ -778,13 +2149,80 @@ class DBManager():
         :returns: None
 
         """
-        self.log.debug('Removing instructions in address range: %s to %s'
-                       % (str(start_addr), str(end_addr)))
+        self.log.debug('Removing instructions in address range: %s to %s',
+                       start_addr, end_addr)
+        self.replace_range(sec_name, start_addr, end_addr, [])
+
+    def remove_strings_in_addr_range(self, sec_name, start_addr, end_addr):
+        """Removes the string labels that start in an address range.
+
+        :sec_name: Name of the section
+        :start_addr: Starting relative address (inclusive)
+        :end_addr: Ending relative address (exclusive)
+        :returns: The number of labels removed
+
+        """
+        query = {'dis_id': self.dis_id,
+                 'type': 'str',
+                 'sec_name': sec_name,
+                 'r_addr': {'$gte': start_addr, '$lt': end_addr}}
+        count = self.db.labels.find(query).count()
+        if count > 0:
+            self.db.labels.remove(query)
+            self.update_stats(sec_name, {'strings': count}, -1)
+        return count
+
+    def remove_xrefs_in_addr_range(self, sec_name, start_addr, end_addr):
+        """Removes the xrefs made by instructions in an address range.
+
+        :sec_name: Name of the section
+        :start_addr: Starting absolute address (inclusive)
+        :end_addr: Ending absolute address (exclusive)
+        :returns: The number of xrefs removed
+
+        """
+        query = {'dis_id': self.dis_id,
+                 'from_sec_name': sec_name,
+                 'from_addr': {'$gte': start_addr, '$lt': end_addr}}
+        count = self.db.xrefs.find(query).count()
+        if count > 0:
+            self.db.xrefs.remove(query)
+            self.update_stats(sec_name, {'xrefs': count}, -1)
+        return count
+
+    def compact_section(self, sec_name, n=1000):
+        """Rewrites a section's records in address order.
+
+        Records written out of order, as recursive disassembly does, are
+        copied in address order and the originals removed, so a scan in
+        natural order reads them by address. Each chunk of records is
+        copied and removed by one ordered bulk operation, so a crash or a
+        reader part-way through sees at most one chunk twice.
+
+        :sec_name: Name of the section
+        :n: How many records to copy at once
+        :returns: None
+
+        """
         dis_col = self.db.disassembler
-        sec_id = self._get_sec_id(self.dis_id, sec_name)
-        dis_col.remove({'sec_id': sec_id,
-                        'r_addr': {'$gte': start_addr,
-                                   '$lt': end_addr}})
+        last_addr = None
+        while True:
+            # The copies of earlier chunks are all at lower addresses
+            addr_query = None if last_addr is None else {'$gt': last_addr}
+            cursor = dis_col.find(self._get_sec_query(sec_name, addr_query))
+            recs = list(cursor.sort('addr', pymongo.ASCENDING).limit(n))
+            if len(recs) == 0:
+                break
+
+            bulk = dis_col.initialize_ordered_bulk_op()
+            old_ids = []
+            for rec in recs:
+                old_ids.append(rec.pop('_id'))
+                bulk.insert(rec)
+            bulk.find({'_id': {'$in': old_ids}}).remove()
+            bulk.execute()
+            last_addr = recs[-1]['addr']
+        self.invalidate_row_index(sec_name)
 
     ##################################
     # Cleaning up
@@ -0,0 +1,54 @@
+'''
+Demangles C++ symbol names.
+
+Names are demangled with binutils' c++filt. Every name is piped through a
+single c++filt process, so demangling a whole symbol table costs one
+process launch rather than one per name.
+'''
+
+import subprocess
+from disassembler_libs import logger
+
+CXXFILT = 'c++filt'
+
+
+def is_mangled(name):
+    """Returns true if the name looks like an Itanium C++ mangled name.
+
+    :name: A symbol name
+    :returns: True if mangled, otherwise False
+
+    """
+    return name.startswith('_Z')
+
+
+def demangle(names):
+    """Demangles a list of symbol names.
+
+    Names that aren't mangled are passed through untouched, as is every
+    name if c++filt isn't available.
+
+    :names: A list of symbol names
+    :returns: A list of names in the same order
+
+    """
+    mangled = [x for x in names if is_mangled(x)]
+    if len(mangled) == 0:
+        return list(names)
+
+    try:
+        proc = subprocess.Popen([CXXFILT], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        out, _ = proc.communicate('\n'.join(mangled) + '\n')
+    except OSError as e:
+        log = logger.getLogger(__name__)
+        log.error('Could not run %s, leaving names mangled: %s'
+                  % (CXXFILT, str(e)))
+        return list(names)
+
+    demangled = out.splitlines()
+    if proc.returncode != 0 or len(demangled) != len(mangled):
+        return list(names)
+
+    lookup = dict(zip(mangled, demangled))
+    return [lookup.get(x, x) for x in names]
@@ -0,0 +1,63 @@
+'''
+Records surprising states found while disassembling, without stopping.
+
+Places that used to drop into a debugger call report() instead. Each
+report is logged as a warning and, if the 'diagnostics_path' option of the
+[Debugging] config section is set, appended to that file as a line of JSON
+so it can be looked at after a batch run. Anything else that wants to see
+them (a test, or an interactive session) can register a hook.
+'''
+
+import json
+import os
+import time
+from disassembler_libs import logger
+
+# Callables taking (kind, details) that are run for every report
+hooks = []
+
+
+def add_hook(hook):
+    """Registers a function to be called with every report.
+
+    :hook: A callable taking a kind string and a dict of details
+    :returns: None
+
+    """
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Unregisters a function added with add_hook.
+
+    :hook: The callable to remove
+    :returns: None
+
+    """
+    hooks.remove(hook)
+
+
+def report(config, kind, **details):
+    """Reports something unexpected found while disassembling.
+
+    :config: A configuration file to read, or None
+    :kind: A short name for what happened
+    :details: Anything that helps explain it, such as addresses
+    :returns: None
+
+    """
+    log = logger.getLogger(__name__)
+    log.warning('%s: %s' % (kind, ', '.join('%s=%s' % (k, details[k])
+                                            for k in sorted(details))))
+
+    path = ''
+    if config is not None:
+        path = config.get('Debugging', 'diagnostics_path')
+    if path != '':
+        record = {'kind': kind, 'time': time.time(), 'pid': os.getpid(),
+                  'details': details}
+        with open(path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+    for hook in hooks:
+        hook(kind, details)
@@ -0,0 +1,145 @@
+'''
+Entropy maps of sections.
+
+A section is cut into fixed size blocks, and for each block the map keeps
+its Shannon entropy in bits per byte along with the fraction of its bytes
+in each byte class. Code sits around 5 to 6.5 bits per byte and text and
+tables lower still, while compressed or encrypted data is close to 8, so
+the map shows at a glance - and cheaply - where a binary is packed.
+
+The counts of every block are made at once with numpy, a chunk of the
+section at a time so that huge sections don't need huge temporaries.
+'''
+
+import numpy as np
+from bytepattern import as_array
+
+# Default number of bytes in a block
+BLOCK_SIZE = 1024
+
+# Bytes read from the section at a time
+CHUNK_SIZE = 1 << 20
+
+# The classes bytes are counted in
+CLASS_ZERO = 'zero'          # 0x00
+CLASS_ASCII = 'ascii'        # Printable ASCII and whitespace
+CLASS_CONTROL = 'control'    # Other bytes below 0x80
+CLASS_HIGH = 'high'          # 0x80 and above
+
+BYTE_CLASSES = [CLASS_ZERO, CLASS_ASCII, CLASS_CONTROL, CLASS_HIGH]
+
+
+def get_byte_classes():
+    """Works out the class of every byte value.
+
+    :returns: A numpy array of 256 indexes into BYTE_CLASSES
+
+    """
+    classes = np.empty(256, dtype=np.intp)
+    classes[:0x80] = BYTE_CLASSES.index(CLASS_CONTROL)
+    classes[0x20:0x7f] = BYTE_CLASSES.index(CLASS_ASCII)
+    classes[[0x09, 0x0a, 0x0d]] = BYTE_CLASSES.index(CLASS_ASCII)
+    classes[0x80:] = BYTE_CLASSES.index(CLASS_HIGH)
+    classes[0] = BYTE_CLASSES.index(CLASS_ZERO)
+    return classes
+
+# One hot rows, so a block's byte counts times this are its class counts
+CLASS_MATRIX = np.eye(len(BYTE_CLASSES))[get_byte_classes()]
+
+
+class EntropyMap(object):
+    """The entropy and byte classes of each block of a section."""
+
+    def __init__(self, block_size, entropy, classes):
+        """Initializes an EntropyMap.
+
+        :block_size: The number of bytes in each block - the last may be
+                     shorter
+        :entropy: A numpy array of each block's entropy in bits per byte
+        :classes: A numpy array with a row per block of the fraction of
+                  its bytes in each of BYTE_CLASSES
+
+        """
+        self.block_size = block_size
+        self.entropy = entropy
+        self.classes = classes
+
+    def __len__(self):
+        return len(self.entropy)
+
+    def get_fraction_above(self, threshold):
+        """Works out how much of the section is above an entropy.
+
+        :threshold: An entropy in bits per byte
+        :returns: The fraction of blocks above it, or 0 with no blocks
+
+        """
+        if len(self) == 0:
+            return 0.0
+        return float(np.mean(self.entropy > threshold))
+
+    def to_blobs(self):
+        """Returns the contents of this map as raw bytes, for storing.
+
+        :returns: A dict of 'entropy' and 'classes' to strings of raw
+                  bytes of little endian float32s
+
+        """
+        return {'entropy': self.entropy.astype('<f4').tostring(),
+                'classes': self.classes.astype('<f4').tostring()}
+
+    @staticmethod
+    def from_blobs(block_size, blobs):
+        """Makes a map from the raw bytes made by to_blobs.
+
+        :block_size: The number of bytes in each block
+        :blobs: A dict of 'entropy' and 'classes' to strings of raw bytes
+        :returns: An EntropyMap
+
+        """
+        entropy = np.frombuffer(blobs['entropy'], dtype='<f4')
+        classes = np.frombuffer(blobs['classes'], dtype='<f4')
+        return EntropyMap(block_size, entropy.astype(np.float32),
+                          classes.astype(np.float32).reshape(
+                              (-1, len(BYTE_CLASSES))))
+
+
+def count_blocks(data, block_size):
+    """Counts the byte values in each block of some data.
+
+    :data: A numpy array of uint8
+    :block_size: The number of bytes in each block
+    :returns: A numpy array with a row of 256 counts per block
+
+    """
+    blocks = np.arange(len(data)) // block_size
+    counts = np.bincount(blocks * 256 + data,
+                         minlength=(int(blocks[-1]) + 1) * 256)
+    return counts.reshape((-1, 256))
+
+
+def get_entropy_map(data, block_size=BLOCK_SIZE):
+    """Makes the entropy map of some data.
+
+    :data: A byte string or buffer, such as a section's data
+    :block_size: The number of bytes in each block
+    :returns: An EntropyMap
+
+    """
+    arr = as_array(data)
+    # Whole blocks at a time, so no block spans two chunks
+    chunk = max(CHUNK_SIZE // block_size, 1) * block_size
+
+    entropy = [np.zeros(0, dtype=np.float32)]
+    classes = [np.zeros((0, len(BYTE_CLASSES)), dtype=np.float32)]
+    for start in xrange(0, len(arr), chunk):
+        counts = count_blocks(arr[start:start + chunk], block_size)
+        totals = counts.sum(axis=1).astype(np.float64)[:, None]
+        probs = counts / totals
+        # log2(1 / p) rather than -log2(p), so empty terms add 0 and not -0
+        with np.errstate(divide='ignore'):
+            logs = np.where(counts > 0, np.log2(totals / counts), 0.0)
+        entropy.append((probs * logs).sum(axis=1).astype(np.float32))
+        classes.append((counts.dot(CLASS_MATRIX) / totals).astype(np.float32))
+    return EntropyMap(block_size, np.concatenate(entropy),
+                      np.concatenate(classes))
@@ -0,0 +1,511 @@
+'''
+Runs independent tasks one after another, on a pool of threads or on a
+pool of processes, behind one interface.
+
+Which one is used comes from the 'executor' option of the [General] config
+section ('serial', 'thread' or 'process'), and 'num_procs' sets the number
+of workers. Capstone does its decoding in C through ctypes, which releases
+the GIL, so threads are often enough and avoid pickling every task.
+
+A task is a module-level function and its arguments. Keep the arguments
+small - for the process backend they are pickled for every task.
+
+Executors are supervised: a task submitted as idempotent that raises is
+retried up to 'task_retries' times, and a task that runs for longer than
+'task_timeout' seconds (0 for no limit) fails. Either failure stops every
+other task and is raised from wait() with the worker's traceback, so a run
+fails fast rather than hanging or quietly missing data. Only submit a task
+as idempotent if running it again after it failed part-way leaves the same
+result as running it once.
+'''
+
+import multiprocessing
+import Queue
+import sys
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from disassembler_libs import logger, metrics
+from disassembler_libs.profiler import make_profiler
+
+# A unit of work: func(*args)
+Task = namedtuple('Task', 'func args')
+
+EXECUTOR_NAMES = ['serial', 'thread', 'process']
+
+# How long to block on a single task before checking on the others
+POLL_INTERVAL = 0.05
+
+# Where a process pool's workers report when they start a task - set in
+# each worker by the pool's initializer
+_start_queue = None
+
+
+class UnknownExecutor(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+class TaskError(Exception):
+    """A task raised an exception. The message holds its traceback."""
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+class TaskTimeout(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+def describe_task(task):
+    """Returns a short name for a task, for error messages.
+
+    :task: A Task
+    :returns: A string
+
+    """
+    return '%s.%s' % (task.func.__module__, task.func.__name__)
+
+
+def run_task(task):
+    """Runs a task. Module-level so that process pools can pickle it.
+
+    Any exception is turned into a TaskError carrying the traceback from
+    where it happened, which would otherwise be lost on the way back from
+    a worker process.
+
+    :task: The Task to run
+    :returns: Whatever the task's function returns
+
+    """
+    try:
+        with metrics.span(task.func.__name__):
+            return task.func(*task.args)
+    except TaskError:
+        raise
+    except Exception:
+        raise TaskError('%s failed:\n%s' % (describe_task(task),
+                                             traceback.format_exc()))
+
+
+def set_start_queue(queue):
+    """Sets where this worker reports the tasks it starts.
+
+    :queue: A multiprocessing Queue
+    :returns: None
+
+    """
+    global _start_queue
+    _start_queue = queue
+
+
+def run_worker_task(task, key, start_queue, profiler, phase, span_path):
+    """Runs a task on a pool worker, collecting its metrics.
+
+    :task: The Task to run
+    :key: The key the executor knows this run of the task by
+    :start_queue: Where to report the time the task starts, or None for
+                  the queue given to set_start_queue
+    :profiler: The Profiler of the run, or None
+    :phase: The name of the phase the task was submitted in
+    :span_path: The metrics span the task was submitted in
+    :returns: A (result, metrics snapshot) tuple
+
+    """
+    if start_queue is None:
+        start_queue = _start_queue
+    start_queue.put((key, time.time()))
+    collector = metrics.reset(span_path)
+    if profiler is None:
+        result = run_task(task)
+    else:
+        with profiler.task(phase):
+            result = run_task(task)
+    return result, collector.snapshot()
+
+
+class FinishedTask(object):
+    """The outcome of a task that has already been run."""
+
+    def __init__(self, value=None, exc_info=None):
+        """Initializes a FinishedTask.
+
+        :value: What the task returned
+        :exc_info: The sys.exc_info() of the exception it raised, if any
+
+        """
+        self.value = value
+        self.exc_info = exc_info
+
+    def ready(self):
+        return True
+
+    def wait(self, timeout=None):
+        pass
+
+    def get(self):
+        """Returns the result of the task, re-raising its exception.
+
+        :returns: What the task returned
+
+        """
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+class PendingTask(object):
+    """Tracks a submitted task until its result is collected."""
+
+    def __init__(self, task, idempotent):
+        """Initializes a PendingTask.
+
+        :task: The Task
+        :idempotent: True if the task may be retried
+
+        """
+        self.task = task
+        self.idempotent = idempotent
+        self.attempts = 1
+        self.key = None         # Key of the current run of the task
+        self.handle = None      # FinishedTask or AsyncResult of that run
+        self.started = None     # When a worker started that run
+
+
+class Executor(object):
+    """Runs tasks serially. The parent of every executor.
+
+    Tasks run as soon as they are submitted, in this process, so the
+    timeout can't interrupt them.
+
+    """
+
+    def __init__(self, num_workers=1, timeout=0, retries=0, profiler=None):
+        """Initializes an Executor.
+
+        :num_workers: The number of tasks that may run at once
+        :timeout: Seconds a task may run for before it fails, or 0
+        :retries: How many times to rerun an idempotent task that raised
+        :profiler: The Profiler to profile phases and tasks with, if any
+
+        """
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.profiler = profiler
+        self.pending = []
+        self.next_key = 0
+        self.starts = {}
+        self.log = logger.getLogger(__name__)
+
+    @contextmanager
+    def phase(self, name):
+        """Marks a phase of the run, timing it and profiling it if needed.
+
+        :name: The name of the phase
+        :returns: A context manager for the length of the phase
+
+        """
+        with metrics.span(name):
+            if self.profiler is None:
+                yield
+            else:
+                with self.profiler.phase(name):
+                    yield
+
+    def submit(self, func, *args, **kwargs):
+        """Queues func(*args) to be run.
+
+        :func: A module-level function
+        :idempotent: Keyword only. True if the task is safe to run again
+                     after it failed part-way, so that it may be retried
+        :returns: None
+
+        """
+        idempotent = kwargs.pop('idempotent', False)
+        if len(kwargs) > 0:
+            raise TypeError('Unexpected arguments: %s'
+                            % ', '.join(sorted(kwargs)))
+        p = PendingTask(Task(func, args), idempotent)
+        self._start(p)
+        self.pending.append(p)
+
+    def _start(self, p):
+        """Submits a new run of a task, under a new key.
+
+        :p: The PendingTask
+        :returns: None
+
+        """
+        self.next_key += 1
+        p.key = self.next_key
+        p.started = None
+        p.handle = self._submit(p.task, p.key)
+
+    def _submit(self, task, key):
+        """Starts a task. Should be overridden by children.
+
+        :task: The Task to start
+        :key: The key the run reports its start time under
+        :returns: An object with ready(), wait(timeout) and get() methods
+
+        """
+        try:
+            return FinishedTask(run_task(task))
+        except Exception:
+            return FinishedTask(exc_info=sys.exc_info())
+
+    def wait(self):
+        """Waits for every submitted task to finish.
+
+        If a task fails for good, every other task is stopped and its
+        exception is raised.
+
+        :returns: A list of the results of the tasks, in submitted order
+
+        """
+        pending, self.pending = self.pending, []
+        results = [None] * len(pending)
+        unfinished = range(len(pending))
+
+        while len(unfinished) > 0:
+            still_running = []
+            for i in unfinished:
+                if pending[i].handle.ready():
+                    if self._collect(pending[i], results, i):
+                        continue
+                still_running.append(i)
+            unfinished = still_running
+
+            # Tasks are timed from when a worker reports starting them, not
+            # from when they were queued
+            self.read_starts()
+            now = time.time()
+            for i in unfinished:
+                p = pending[i]
+                if p.started is None:
+                    p.started = self.starts.pop(p.key, None)
+                if (self.timeout > 0 and p.started is not None and
+                        now - p.started > self.timeout):
+                    self.abort()
+                    raise TaskTimeout('%s ran for more than %d seconds'
+                                      % (describe_task(p.task),
+                                         self.timeout))
+
+            if len(unfinished) > 0:
+                pending[unfinished[0]].handle.wait(POLL_INTERVAL)
+
+        return results
+
+    def read_starts(self):
+        """Reads the start times workers have reported into self.starts.
+        Should be overridden by children whose tasks run elsewhere.
+
+        :returns: None
+
+        """
+        pass
+
+    def _collect(self, p, results, i):
+        """Collects the result of a finished task, retrying it if it failed.
+
+        :p: The PendingTask that finished
+        :results: The list of results to fill in
+        :i: Where this task's result goes in results
+        :returns: True if the result was collected, False if it was retried
+
+        """
+        try:
+            results[i] = self._unwrap(p.handle.get())
+            return True
+        except TaskError as e:
+            if not p.idempotent or p.attempts > self.retries:
+                self.abort()
+                raise
+            self.log.warning('Retrying (%d of %d) %s'
+                             % (p.attempts, self.retries, str(e)))
+        except Exception:
+            self.abort()
+            raise
+
+        p.attempts += 1
+        self._start(p)
+        return False
+
+    def map(self, func, arg_lists, idempotent=False):
+        """Runs func once for each list of arguments and waits for them.
+
+        :func: A module-level function
+        :arg_lists: An iterable of argument tuples
+        :idempotent: True if the tasks may be retried (see submit)
+        :returns: A list of the results, in the same order
+
+        """
+        for args in arg_lists:
+            self.submit(func, *args, idempotent=idempotent)
+        return self.wait()
+
+    def _unwrap(self, value):
+        """Turns what a started task gives back into the task's result.
+
+        :value: The value from the task's handle
+        :returns: The result
+
+        """
+        return value
+
+    def abort(self):
+        """Stops every task that is still running or waiting to run.
+
+        :returns: None
+
+        """
+        self.pending = []
+
+    def close(self):
+        """Releases any workers. The executor can't be used afterwards.
+
+        :returns: None
+
+        """
+        pass
+
+
+class PoolExecutor(Executor):
+    """Runs tasks on a pool that is started the first time it is needed."""
+
+    def __init__(self, num_workers=1, timeout=0, retries=0, profiler=None):
+        """Initializes a PoolExecutor.
+
+        :num_workers: The number of workers in the pool
+        :timeout: Seconds a task may run for before it fails, or 0
+        :retries: How many times to rerun an idempotent task that raised
+        :profiler: The Profiler to profile phases and tasks with, if any
+
+        """
+        Executor.__init__(self, num_workers, timeout, retries, profiler)
+        self.pool = None
+        self.start_queue = None
+
+    def make_pool(self):
+        """Creates the pool, and the start_queue its workers report the
+        tasks they start on. Should be implemented by children.
+
+        :returns: A multiprocessing pool
+
+        """
+        raise NotImplementedError()
+
+    def get_start_queue_arg(self):
+        """Returns the start queue to hand to each task.
+
+        :returns: A queue, or None if the workers were given it as they
+                  were made
+
+        """
+        return None
+
+    def _submit(self, task, key):
+        if self.pool is None:
+            self.starts = {}
+            self.pool = self.make_pool()
+        phase = None
+        if self.profiler is not None:
+            phase = self.profiler.get_phase()
+        return self.pool.apply_async(run_worker_task,
+                                     (task, key, self.get_start_queue_arg(),
+                                      self.profiler, phase,
+                                      metrics.get_path()))
+
+    def read_starts(self):
+        if self.start_queue is None:
+            return
+        while True:
+            try:
+                key, started = self.start_queue.get_nowait()
+            except Queue.Empty:
+                return
+            self.starts[key] = started
+
+    def _unwrap(self, value):
+        result, snapshot = value
+        metrics.merge(snapshot)
+        return result
+
+    def abort(self):
+        Executor.abort(self)
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class ThreadExecutor(PoolExecutor):
+    """Runs tasks on a pool of threads."""
+
+    def make_pool(self):
+        self.start_queue = Queue.Queue()
+        return ThreadPool(self.num_workers)
+
+    def get_start_queue_arg(self):
+        # Threads would share a queue set by set_start_queue with every
+        # other pool in the process, so each task is handed this one
+        return self.start_queue
+
+    def abort(self):
+        # Threads can't be killed, and joining one that hangs would hang
+        # here too. They are daemons, so leave them to finish on their own.
+        Executor.abort(self)
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+
+class ProcessExecutor(PoolExecutor):
+    """Runs tasks on a pool of processes."""
+
+    def make_pool(self):
+        # Queues can only be handed to processes as they are made
+        self.start_queue = multiprocessing.Queue()
+        return multiprocessing.Pool(self.num_workers, set_start_queue,
+                                    (self.start_queue,))
+
+
+def make_executor(config):
+    """Creates the executor chosen in the configuration.
+
+    Disabling multiprocessing in the [Debugging] section always gives a
+    serial executor, as does having no configuration at all.
+
+    :config: A configuration file to read, or None
+    :returns: An Executor
+
+    """
+    if config is None:
+        return Executor()
+
+    timeout = config.getint('General', 'task_timeout')
+    retries = config.getint('General', 'task_retries')
+    profiler = make_profiler(config)
+    if config.getboolean('Debugging', 'disable_multiprocessing'):
+        return Executor(1, timeout, retries, profiler)
+
+    name = config.get('General', 'executor')
+    num_workers = config.getint('General', 'num_procs')
+
+    if name == 'serial':
+        return Executor(1, timeout, retries, profiler)
+    elif name == 'thread':
+        return ThreadExecutor(num_workers, timeout, retries, profiler)
+    elif name == 'process':
+        return ProcessExecutor(num_workers, timeout, retries, profiler)
+    raise UnknownExecutor('No executor named %s - use one of %s'
+                          % (name, ', '.join(EXECUTOR_NAMES)))
@@ -0,0 +1,30 @@
+'''
+An object representing the fingerprint of a function - the MinHash
+signature of its mnemonic n-grams (see minhash.py).
+'''
+
+
+class Fingerprint(object):
+    """An internal representation of a function's fingerprint"""
+    def __init__(self, name, start_addr, insts, signature):
+        """Initializes a fingerprint object.
+
+        :name: Name of the function
+        :start_addr: Absolute start address of the function
+        :insts: Number of instructions the fingerprint was made from
+        :signature: The MinHash signature, a numpy array of uint32
+
+        """
+        self.name = name
+        self.start_addr = start_addr
+        self.insts = insts
+        self.signature = signature
+
+    def __str__(self):
+        """Returns a string representation of this fingerprint.
+
+        :returns: A string rep
+
+        """
+        return '%s@0x%08x (%d insts)' % (self.name, self.start_addr,
+                                         self.insts)
@@ -0,0 +1,55 @@
+'''
+An object representing a ROP/JOP gadget - a short run of instructions
+ending in a return or an indirect jump or call.
+
+The same instructions often turn up at many addresses, so a gadget is
+identified by its normalized text, e.g. 'pop rdi ; ret', and keeps every
+address it starts at.
+'''
+
+# The kinds of gadget - how the gadget's last instruction hands on control
+GADGET_ROP = 'rop'        # Returns
+GADGET_JOP = 'jop'        # Jumps through a register or memory
+GADGET_COP = 'cop'        # Calls through a register or memory
+
+GADGET_KINDS = [GADGET_ROP, GADGET_JOP, GADGET_COP]
+
+
+def normalize(mnemonic, op_str):
+    """Normalizes the text of one instruction.
+
+    :mnemonic: The instruction's mnemonic
+    :op_str: The instruction's operands as a string
+    :returns: The lower case instruction with single spaces
+
+    """
+    return ' '.join(('%s %s' % (mnemonic, op_str)).lower().split())
+
+
+class Gadget(object):
+    """An internal representation of a gadget"""
+    def __init__(self, text, mnemonics, kind, addrs):
+        """Initializes a gadget object.
+
+        :text: The normalized instructions, joined with ' ; '
+        :mnemonics: The mnemonic of each instruction
+        :kind: One of GADGET_KINDS
+        :addrs: The absolute addresses the gadget starts at
+
+        """
+        self.text = text
+        self.mnemonics = mnemonics
+        self.kind = kind
+        self.addrs = addrs
+
+    def __len__(self):
+        return len(self.mnemonics)
+
+    def __str__(self):
+        """Returns a string representation of this gadget.
+
+        :returns: A string rep
+
+        """
+        return '0x%08x: %s (%d more)' % (self.addrs[0], self.text,
+                                        len(self.addrs) - 1)
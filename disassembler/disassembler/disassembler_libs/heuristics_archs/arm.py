@@ -1,5 +1,35 @@
 import heuristics
+import numpy as np
+
+from disassembler_libs.bytepattern import parse_pattern
+
+# A32 encodings, little endian
+PROLOGUES = [parse_pattern('?? 40 2d e9', '00 40 ff ff'),  # push {..., lr}
+             parse_pattern('04 e0 2d e5')]                 # str lr, [sp, #-4]!
+
+EPILOGUES = [parse_pattern('?? 80 bd e8', '00 80 ff ff'),  # pop {..., pc}
+             parse_pattern('1e ff 2f e1'),                 # bx lr
+             parse_pattern('04 f0 9d e4')]                 # pop {pc}
+
 
 class arm(heuristics.Heuristics):
     """A class that provides heuristics for the arm architecture"""
-    pass
+
+    def get_instruction_alignment(self):
+        return 4
+
+    def get_prologue_signatures(self):
+        return PROLOGUES
+
+    def get_epilogue_signatures(self):
+        return EPILOGUES
+
+    def find_direct_call_targets(self, data):
+        # bl <imm24>: condition 'always', opcode 1011. The target is
+        # relative to the address of the bl plus 8.
+        words = data[:len(data) & ~3].view('<u4')
+        sites = np.flatnonzero((words & 0xff000000) == 0xeb000000)
+        imm = (words[sites] & 0x00ffffff).astype(np.int64)
+        imm = (imm ^ 0x800000) - 0x800000  # sign extend
+        sites = sites * 4
+        return sites, sites + 8 + imm * 4
@@ -1,6 +1,31 @@
 import heuristics
+import numpy as np
+
+from disassembler_libs.bytepattern import parse_pattern
+
+PROLOGUES = [parse_pattern('fd 7b ?? a9', 'ff ff 00 ff'),  # stp x29, x30, [sp, #-n]!
+             parse_pattern('3f 23 03 d5')]                 # paciasp
+
+EPILOGUES = [parse_pattern('c0 03 5f d6')]                 # ret
 
 
 class arm64(heuristics.Heuristics):
     """A class that provides heuristics for the arm64 architecture"""
-    pass
+
+    def get_instruction_alignment(self):
+        return 4
+
+    def get_prologue_signatures(self):
+        return PROLOGUES
+
+    def get_epilogue_signatures(self):
+        return EPILOGUES
+
+    def find_direct_call_targets(self, data):
+        # bl <imm26>: the target is relative to the address of the bl
+        words = data[:len(data) & ~3].view('<u4')
+        sites = np.flatnonzero((words & 0xfc000000) == 0x94000000)
+        imm = (words[sites] & 0x03ffffff).astype(np.int64)
+        imm = (imm ^ 0x2000000) - 0x2000000  # sign extend
+        sites = sites * 4
+        return sites, sites + imm * 4
@@ -3,6 +3,8 @@ This module holds the heuristics class, which provides
 arbitrary abstractions for binary formats.
 """
 
+import numpy as np
+
 
 class Heuristics(object):
 
@@ -88,3 +90,58 @@ class Heuristics(object):
     def op_conditional_jump_option(self, inst):
         raise NotImplementedError()
 
+    def get_instruction_alignment(self):
+        """Returns the alignment that instructions must start on.
+
+        :returns: An alignment in bytes
+
+        """
+        return 1
+
+    def get_prologue_signatures(self):
+        """Returns byte patterns that commonly start a function.
+        Should be implemented by children.
+
+        :returns: A list of (values, mask) tuples (see bytepattern)
+
+        """
+        return []
+
+    def get_epilogue_signatures(self):
+        """Returns byte patterns of instructions that commonly end a function.
+        Should be implemented by children.
+
+        A match should start at the address of the returning instruction.
+
+        :returns: A list of (values, mask) tuples (see bytepattern)
+
+        """
+        return []
+
+    def get_gadget_end_signatures(self):
+        """Returns byte patterns of instructions that can end a gadget -
+        returns and indirect jumps or calls. Should be implemented by
+        children.
+
+        A match should start at the address of the instruction. Matches
+        are only candidates, and are decoded to check them.
+
+        :returns: A list of (values, mask) tuples (see bytepattern)
+
+        """
+        return []
+
+    def find_direct_call_targets(self, data):
+        """Decodes every possible direct call in a blob of raw bytes.
+
+        This works on bytes rather than instructions so that call targets
+        can be gathered without disassembling. Should be implemented by
+        children.
+
+        :data: A uint8 numpy array of section data
+        :returns: A (sites, targets) tuple of numpy arrays of offsets
+                  relative to the start of data
+
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
@@ -1,6 +1,29 @@
 import heuristics
+import numpy as np
 
+import capstone
 from capstone import x86 as cx86
+from disassembler_libs.bytepattern import parse_pattern
+
+PROLOGUES_32 = [parse_pattern('55 89 e5'),           # push ebp; mov ebp, esp
+                parse_pattern('55 8b ec'),           # push ebp; mov ebp, esp
+                parse_pattern('f3 0f 1e fb')]        # endbr32
+
+PROLOGUES_64 = [parse_pattern('55 48 89 e5'),        # push rbp; mov rbp, rsp
+                parse_pattern('55 48 8b ec'),        # push rbp; mov rbp, rsp
+                parse_pattern('f3 0f 1e fa')]        # endbr64
+
+EPILOGUES = [parse_pattern('c3'),                    # ret
+             parse_pattern('c2 ?? 00')]              # ret imm16
+
+GADGET_ENDS_32 = [parse_pattern('c3'),               # ret
+                  parse_pattern('c2 ?? ??'),         # ret imm16
+                  parse_pattern('ff 10', 'ff 38'),   # call r/m
+                  parse_pattern('ff 20', 'ff 38')]   # jmp r/m
+
+GADGET_ENDS_64 = GADGET_ENDS_32 + [
+    parse_pattern('41 ff 10', 'ff ff 38'),           # call r8-r15 / [r8-r15]
+    parse_pattern('41 ff 20', 'ff ff 38')]           # jmp r8-r15 / [r8-r15]
 
 
 class x86(heuristics.Heuristics):
@@ -88,11 +111,10 @@ class x86(heuristics.Heuristics):
                 return None
             elif op.type == cx86.X86_OP_REG:
                 return None
-        print 5
         return None
 
     def is_jump(self, inst):
-        return inst.group(cx86.X86_INS_JMP) or inst.group(cx86.X86_INS_LJMP)
+        return inst.id == cx86.X86_INS_JMP or inst.id == cx86.X86_INS_LJMP
 
     def op_jump_get_addr(self, inst):
         return self.op_call_get_addr(inst)
@@ -109,7 +131,6 @@ class x86(heuristics.Heuristics):
                   cx86.X86_INS_JGE,
                   cx86.X86_INS_JL,
                   cx86.X86_INS_JLE,
-                  cx86.X86_INS_JMP,
                   cx86.X86_INS_JNE,
                   cx86.X86_INS_JNO,
                   cx86.X86_INS_JNP,
@@ -124,3 +145,27 @@ class x86(heuristics.Heuristics):
 
     def op_conditional_jump_option(self, inst):
         return self.op_call_get_addr(inst)
+
+    def get_prologue_signatures(self):
+        if self.mode & capstone.CS_MODE_64:
+            return PROLOGUES_64
+        return PROLOGUES_32
+
+    def get_epilogue_signatures(self):
+        return EPILOGUES
+
+    def get_gadget_end_signatures(self):
+        if self.mode & capstone.CS_MODE_64:
+            return GADGET_ENDS_64
+        return GADGET_ENDS_32
+
+    def find_direct_call_targets(self, data):
+        # call rel32: e8 followed by a little endian displacement from
+        # the end of the 5 byte instruction
+        sites = np.flatnonzero(data[:-4] == 0xe8)
+        disp = (data[sites + 1].astype(np.int64) |
+                data[sites + 2].astype(np.int64) << 8 |
+                data[sites + 3].astype(np.int64) << 16 |
+                data[sites + 4].astype(np.int64) << 24)
+        disp = (disp ^ 0x80000000) - 0x80000000  # sign extend
+        return sites, sites + 5 + disp
@@ -0,0 +1,73 @@
+'''
+Search keys for instructions.
+
+Each instruction record keeps a list of keys - one for its mnemonic, the
+registers it uses, the immediates it holds and the addresses it's known to
+go to or refer to - and the disassembler collection has a multikey index
+over that list. Together they form an inverted index from each key to the
+instructions holding it, which is kept up to date by every write of a
+record, so a query like "call with target 0x401000" never scans operands.
+
+A key is written '<kind>:<value>', e.g. 'mnemonic:call', 'reg:r12' or
+'imm:0xdeadbeef'. Numbers are kept as 64 bit two's complement hex, so -1
+and 0xffffffffffffffff are the same immediate.
+'''
+
+KEY_MNEMONIC = 'mnemonic'    # The instruction's mnemonic
+KEY_REG = 'reg'              # A register read or written, or used to address
+KEY_IMM = 'imm'              # An immediate operand
+KEY_TARGET = 'target'        # An absolute address branched to or referred to
+
+KEY_KINDS = [KEY_MNEMONIC, KEY_REG, KEY_IMM, KEY_TARGET]
+
+
+class UnknownKeyKind(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+def make_key(kind, value):
+    """Builds the search key of a value.
+
+    :kind: One of KEY_KINDS
+    :value: A mnemonic or register name, or a number for KEY_IMM and
+            KEY_TARGET
+    :returns: A search key string
+
+    """
+    if kind not in KEY_KINDS:
+        raise UnknownKeyKind('%s is not one of %s' % (kind, KEY_KINDS))
+    if kind in (KEY_IMM, KEY_TARGET):
+        value = '0x%x' % (int(value) & 0xffffffffffffffff)
+    else:
+        value = str(value).lower()
+    return '%s:%s' % (kind, value)
+
+
+def get_search_keys(mnemonic, operands, target=None):
+    """Works out the search keys of an instruction.
+
+    :mnemonic: The instruction's mnemonic
+    :operands: The instruction's operands, with any xref as an absolute
+               address
+    :target: The absolute address a direct call or jump goes to, if any,
+             which stands in for its immediate
+    :returns: A sorted list of search keys
+
+    """
+    keys = set([make_key(KEY_MNEMONIC, mnemonic)])
+    for op in operands or []:
+        if op.get('type') == 'reg':
+            keys.add(make_key(KEY_REG, op['reg']))
+        elif op.get('type') == 'mem':
+            for reg in (op.get('base'), op.get('index')):
+                if reg:
+                    keys.add(make_key(KEY_REG, reg))
+        # A direct branch's immediate is its target, relative to the section
+        elif op.get('type') == 'imm' and target is None:
+            keys.add(make_key(KEY_IMM, op['imm']['val']))
+        if op.get('xref') is not None:
+            keys.add(make_key(KEY_TARGET, op['xref']))
+    if target is not None:
+        keys.add(make_key(KEY_TARGET, target))
+    return sorted(keys)
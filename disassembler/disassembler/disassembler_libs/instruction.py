@@ -8,7 +8,7 @@ if this instruction is text (executable) or data (non-executable)
 class Instruction:
     """An internal representation of an assembly function"""
     def __init__(self, r_address, is_text, my_bytes, mnemonic,
-                 operands=None, disp=None):
+                 operands=None, disp=None, target=None):
         """Initializes an instruction object
 
         :r_address: Relative address of the start of the instruction
@@ -17,6 +17,7 @@ class Instruction:
         :mnemonic: Mnemonic of the instruction
         :operands: A list of operands and their various fields
         :disp: Method of displaying an instruction's data
+        :target: Relative address a direct call or jump goes to, if any
 
         """
         self.r_addr = r_address
@@ -26,6 +27,7 @@ class Instruction:
         self.mnemonic = 'db' if mnemonic == '.byte' else mnemonic
         if self.is_text:
             self.operands = operands
+            self.target = target
         else:
             self.disp = disp
 
@@ -3,12 +3,12 @@ An object representing various labelled locations in
 a disassembled binary.
 
 Possibilities include - function ('func'), string ('str'),
-section ('sec'), or some arbitrary location ('loc') - all
-of which are implemented in child classes.
+section ('sec'), data object ('obj') or some arbitrary
+location ('loc') - all of which are implemented in child classes.
 '''
 
 
-class Label:
+class Label(object):
     """An internal representation of a labelled location in the disassembly"""
     def __init__(self, name, t):
         """Initializes a label object
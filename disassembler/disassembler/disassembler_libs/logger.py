@@ -2,38 +2,202 @@
 Provides a standard configuration for log files.
 Maintained seperately to allow multiprocessing processes
 to have standardized access to initialize log access.
+
+Every process logs through a QueueHandler on the root logger, which hands
+its records to a single listener process that owns the log file and the
+console. Workers forked after the logger is set up inherit the handler, so
+no two processes ever write the file at once. With multiprocessing disabled
+the handlers are attached directly instead, so nothing runs out of process.
+
+Levels are read from the [Logging] config section:
+    level          The level of the root logger and the log file
+    console_level  The level of messages also shown on the console
+    debug_sample   Hot loops log only one in this many debug messages
+and any module can be given its own level in the [LogLevels] section, e.g.
+    strategies.recursive = DEBUG
+Records below a logger's level are dropped where they are made, before any
+formatting or queueing, so debug logging costs next to nothing when off.
 """
+import atexit
 import logging
+import multiprocessing
+import os
 
 log_created = False
 
+# The queue and process of the listener, in the process that started them
+listener_queue = None
+listener_process = None
+listener_pid = None
+
+
+class QueueHandler(logging.Handler):
+    """A handler that sends records to a queue for another process."""
+
+    def __init__(self, queue):
+        """Initializes a QueueHandler.
+
+        :queue: A multiprocessing.Queue read by the listener
+
+        """
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def prepare(self, record):
+        """Makes a record safe to pickle, formatting it as needed.
+
+        :record: A LogRecord
+        :returns: The LogRecord, with its message and traceback as text
+
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+
+def get_level(name):
+    """Turns a level name from the config into a logging level.
+
+    :name: A level name such as 'DEBUG', or a number
+    :returns: An int
+
+    """
+    name = name.strip().upper()
+    if name.isdigit():
+        return int(name)
+    return logging.getLevelName(name)
+
+
+def get_debug_sample(config):
+    """Returns how many debug messages hot loops skip per one they log.
+
+    :config: Configuration file to read from, or None
+    :returns: An int of at least 1
+
+    """
+    if config is None:
+        return 1
+    return max(1, config.getint('Logging', 'debug_sample'))
+
+
+def make_handlers(config, log_path):
+    """Creates the handlers that write log records out.
+
+    :config: Configuration file to read from, or None
+    :log_path: The file to write the log to
+    :returns: A list of Handlers
+
+    """
+    console_level = logging.INFO
+    if config is not None:
+        console_level = get_level(config.get('Logging', 'console_level'))
+
+    # Everything that gets past the loggers' levels goes in the file
+    log_file = logging.FileHandler(log_path, mode='w')
+    log_file.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        '%m-%d %H:%M:%S'))
+
+    # define a Handler which writes INFO messages or higher to the sys.stderr
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    # set a format which is simpler for console use
+    console.setFormatter(logging.Formatter('%(asctime)s - %(message)s',
+                                           '%m-%d %H:%M:%S'))
+    return [log_file, console]
+
+
+def listen(queue, config, log_path):
+    """Writes the records from a queue until it reads None. The listener.
+
+    :queue: The queue that QueueHandlers put records on
+    :config: Configuration file to read from, or None
+    :log_path: The file to write the log to
+    :returns: None
+
+    """
+    handlers = make_handlers(config, log_path)
+    while True:
+        try:
+            record = queue.get()
+        except (EOFError, IOError):
+            break
+        except KeyboardInterrupt:
+            # Keep going so the parent's last records still get written
+            continue
+        if record is None:
+            break
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+    for handler in handlers:
+        handler.close()
+
+
+def stop_logging():
+    """Writes out any queued records and stops the listener.
+
+    Only does anything in the process that started the listener.
+
+    :returns: None
+
+    """
+    global listener_process
+    if listener_process is None or os.getpid() != listener_pid:
+        return
+    listener_queue.put(None)
+    listener_process.join()
+    listener_process = None
+
+
 def init_logger(config=None):
     """Initializes configuration of the haevn logger.
 
-    :config: Configuration file tor ead from
+    :config: Configuration file to read from
 
     """
+    global listener_queue, listener_process, listener_pid
     if config is not None:
         log_path = config.get('Debugging', 'log_path')
+        level = get_level(config.get('Logging', 'level'))
     else:
         log_path = 'log/haevn.log'
-    # set up logging to file - see previous section for more details
-    logging.basicConfig(level=logging.DEBUG,
-                        format=('%(asctime)s - %(name)s - '
-                                '%(levelname)s - %(message)s'),
-                        datefmt='%m-%d %H:%M:%S',
-                        filename=log_path,
-                        filemode='w')
-    # define a Handler which writes INFO messages or higher to the sys.stderr
-    console = logging.StreamHandler()
-    console.setLevel(logging.INFO)
-    # set a format which is simpler for console use
-    formatter = logging.Formatter('%(asctime)s - %(message)s')
-    formatter.datefmt = '%m-%d %H:%M:%S'
-    # tell the handler to use this format
-    console.setFormatter(formatter)
-    # add the handler to the root logger
-    logging.getLogger('').addHandler(console)
+        level = logging.DEBUG
+
+    root = logging.getLogger('')
+    root.setLevel(level)
+    if config is not None:
+        for name, module_level in config.items('LogLevels'):
+            logging.getLogger(name).setLevel(get_level(module_level))
+
+    if config is not None and config.getboolean('Debugging',
+                                                'disable_multiprocessing'):
+        for handler in make_handlers(config, log_path):
+            root.addHandler(handler)
+        return
+
+    listener_queue = multiprocessing.Queue()
+    listener_process = multiprocessing.Process(target=listen,
+                                               args=(listener_queue, config,
+                                                     log_path))
+    listener_process.daemon = True
+    listener_process.start()
+    listener_pid = os.getpid()
+    root.addHandler(QueueHandler(listener_queue))
+    atexit.register(stop_logging)
+
 
 def getLogger(name, config=None):
     """Returns a logger object and initializes it if hasn't been init'ed yet.
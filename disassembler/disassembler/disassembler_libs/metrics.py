@@ -0,0 +1,238 @@
+'''
+Timed spans, counters and histograms for a disassembly run.
+
+Anything can record into the collector of the thread it runs on:
+
+    with metrics.span('executable'):
+        metrics.incr('bytes_decoded', sec.size)
+        metrics.observe('db/flush_ms', elapsed_ms)
+
+Spans nest, and are recorded under their path, e.g. 'run/executable'.
+Tasks run by a pool worker record into a fresh collector whose spans start
+at the span the task was submitted in; the executor sends the worker's
+snapshot back and merges it into the run's collector. At the end of a run
+the snapshot is written out as JSON (see write_run).
+
+Names must not contain '.', since the snapshot may be stored in mongo.
+Histograms count values in powers of two: bucket 'e' holds the values v
+with 2**(e-1) < v <= 2**e, and bucket 'zero' the values <= 0.
+'''
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+def _add_span(spans, path, count, total, low, high):
+    """Adds timings to the entry for a span path.
+
+    :spans: A dict of span path to timings
+    :path: The span path
+    :count: How many times the span ran
+    :total: Total seconds
+    :low: Shortest seconds
+    :high: Longest seconds
+
+    """
+    if path not in spans:
+        spans[path] = {'count': count, 'total': total,
+                       'min': low, 'max': high}
+    else:
+        s = spans[path]
+        s['count'] += count
+        s['total'] += total
+        s['min'] = min(s['min'], low)
+        s['max'] = max(s['max'], high)
+
+
+def get_bucket(value):
+    """Returns the histogram bucket a value falls in.
+
+    :value: A number
+    :returns: A bucket name
+
+    """
+    if value <= 0:
+        return 'zero'
+    return str(int(math.ceil(math.log(value, 2))))
+
+
+class Collector(object):
+    """Collects the metrics of one thread."""
+
+    def __init__(self, base_path=''):
+        """Initializes a Collector.
+
+        :base_path: The span path that this collector's spans are inside
+
+        """
+        self.stack = [x for x in base_path.split('/') if x != '']
+        self.spans = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def get_path(self):
+        """Returns the path of the innermost open span.
+
+        :returns: A string like 'run/executable'
+
+        """
+        return '/'.join(self.stack)
+
+    @contextmanager
+    def span(self, name):
+        """Times the body of a with block.
+
+        :name: The name of the span
+        :returns: A context manager
+
+        """
+        self.stack.append(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            path = self.get_path()
+            self.stack.pop()
+            _add_span(self.spans, path, 1, elapsed, elapsed, elapsed)
+
+    def incr(self, name, value=1):
+        """Adds to a counter.
+
+        :name: The name of the counter
+        :value: How much to add
+
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Adds a value to a histogram.
+
+        :name: The name of the histogram
+        :value: The value to add
+
+        """
+        if name not in self.histograms:
+            self.histograms[name] = {'count': 0, 'sum': 0, 'min': value,
+                                     'max': value, 'buckets': {}}
+        h = self.histograms[name]
+        h['count'] += 1
+        h['sum'] += value
+        h['min'] = min(h['min'], value)
+        h['max'] = max(h['max'], value)
+        bucket = get_bucket(value)
+        h['buckets'][bucket] = h['buckets'].get(bucket, 0) + 1
+
+    def snapshot(self):
+        """Returns everything collected so far as plain dicts.
+
+        :returns: A dict with 'spans', 'counters' and 'histograms'
+
+        """
+        return {'spans': dict((k, dict(v)) for k, v in self.spans.items()),
+                'counters': dict(self.counters),
+                'histograms': dict((k, dict(v, buckets=dict(v['buckets'])))
+                                   for k, v in self.histograms.items())}
+
+    def merge(self, snapshot):
+        """Adds the metrics in a snapshot from another collector.
+
+        :snapshot: A dict from snapshot()
+
+        """
+        for path, s in snapshot['spans'].iteritems():
+            _add_span(self.spans, path, s['count'], s['total'],
+                      s['min'], s['max'])
+        for name, value in snapshot['counters'].iteritems():
+            self.incr(name, value)
+        for name, h in snapshot['histograms'].iteritems():
+            if name not in self.histograms:
+                self.histograms[name] = {'count': 0, 'sum': 0,
+                                         'min': h['min'], 'max': h['max'],
+                                         'buckets': {}}
+            mine = self.histograms[name]
+            mine['count'] += h['count']
+            mine['sum'] += h['sum']
+            mine['min'] = min(mine['min'], h['min'])
+            mine['max'] = max(mine['max'], h['max'])
+            for bucket, count in h['buckets'].iteritems():
+                mine['buckets'][bucket] = mine['buckets'].get(bucket, 0) + count
+
+
+def get_collector():
+    """Returns the collector of the current thread, making it if needed.
+
+    :returns: A Collector
+
+    """
+    collector = getattr(_local, 'collector', None)
+    if collector is None:
+        collector = Collector()
+        _local.collector = collector
+    return collector
+
+
+def reset(base_path=''):
+    """Gives the current thread a new, empty collector.
+
+    :base_path: The span path that the new collector's spans are inside
+    :returns: The new Collector
+
+    """
+    _local.collector = Collector(base_path)
+    return _local.collector
+
+
+def span(name):
+    """Times the body of a with block. See Collector.span."""
+    return get_collector().span(name)
+
+
+def incr(name, value=1):
+    """Adds to a counter. See Collector.incr."""
+    get_collector().incr(name, value)
+
+
+def observe(name, value):
+    """Adds a value to a histogram. See Collector.observe."""
+    get_collector().observe(name, value)
+
+
+def get_path():
+    """Returns the path of the innermost open span of this thread."""
+    return get_collector().get_path()
+
+
+def merge(snapshot):
+    """Merges a snapshot into the current thread's collector."""
+    get_collector().merge(snapshot)
+
+
+def snapshot():
+    """Returns a snapshot of the current thread's collector."""
+    return get_collector().snapshot()
+
+
+def write_run(metrics_dir, run):
+    """Writes the record of a run as JSON.
+
+    :metrics_dir: The directory to write to
+    :run: A dict describing the run, as made by Disassembler
+    :returns: The path written to
+
+    """
+    if not os.path.isdir(metrics_dir):
+        os.makedirs(metrics_dir)
+    name = '%s-%s-%s.json' % (run['project'], run['disassembly'],
+                              time.strftime('%Y%m%d-%H%M%S',
+                                            time.localtime(run['started'])))
+    path = os.path.join(metrics_dir, name)
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2, sort_keys=True, default=str)
+    return path
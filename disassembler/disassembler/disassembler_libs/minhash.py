@@ -0,0 +1,111 @@
+'''
+MinHash signatures of functions, for finding similar functions quickly.
+
+A function is reduced to the set of n-grams of its mnemonics, which doesn't
+depend on where it was loaded or which registers the compiler picked. The
+MinHash signature of that set is a short list of numbers, and the fraction
+of positions where two signatures agree estimates how much the two sets
+overlap (their Jaccard similarity).
+
+To avoid comparing every pair, signatures are cut into bands and each band
+is hashed to a bucket key (locality sensitive hashing). Similar functions
+are very likely to share at least one bucket, so only functions sharing a
+bucket with the one being looked up need comparing.
+'''
+
+import numpy as np
+import zlib
+
+# A Mersenne prime - universal hashes are taken modulo this
+PRIME = (1 << 31) - 1
+
+# Fixed so signatures made in different runs can be compared
+SEED = 0x4861
+
+
+def get_shingles(mnemonics, n):
+    """Hashes every n-gram of a sequence of mnemonics.
+
+    :mnemonics: A list of mnemonics in address order
+    :n: The length of each n-gram
+    :returns: A numpy array of distinct 32 bit n-gram hashes
+
+    """
+    grams = [' '.join(mnemonics[i:i + n])
+             for i in xrange(max(len(mnemonics) - n + 1, 1))]
+    return np.unique(np.array([zlib.crc32(x) & 0xffffffff for x in grams],
+                              dtype=np.uint64))
+
+
+def get_permutations(num_perm):
+    """Makes the hash functions a signature is built from.
+
+    :num_perm: The number of hash functions
+    :returns: An (a, b) tuple of numpy arrays of their coefficients
+
+    """
+    rand = np.random.RandomState(SEED)
+    a = rand.randint(1, PRIME, size=num_perm).astype(np.uint64)
+    b = rand.randint(0, PRIME, size=num_perm).astype(np.uint64)
+    return a, b
+
+
+def get_signature(shingles, perms):
+    """Makes the MinHash signature of a set of shingles.
+
+    :shingles: A numpy array of shingle hashes, as from get_shingles
+    :perms: The (a, b) coefficients from get_permutations
+    :returns: A numpy array of uint32, one value per hash function
+
+    """
+    a, b = perms
+    # a < 2**31 and shingles < 2**32, so this can't overflow
+    hashes = (a[:, None] * shingles[None, :] + b[:, None]) % PRIME
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def get_bands(signature, bands):
+    """Cuts a signature into bands and names the bucket of each.
+
+    :signature: A numpy array from get_signature
+    :bands: The number of bands, which must divide the signature's length
+    :returns: A list of bucket keys, each '<band>:<hash of the band>'
+
+    """
+    rows = signature.reshape((bands, -1))
+    return ['%d:%08x' % (i, zlib.crc32(row.tostring()) & 0xffffffff)
+            for i, row in enumerate(rows)]
+
+
+def get_similarity(sig1, sig2):
+    """Estimates the Jaccard similarity of the sets behind two signatures.
+
+    :sig1: A numpy array from get_signature
+    :sig2: Another, made with the same hash functions
+    :returns: A float between 0 and 1
+
+    """
+    if len(sig1) != len(sig2):
+        # Made with different settings, so they can't be compared
+        return 0.0
+    return float(np.mean(sig1 == sig2))
+
+
+def to_bytes(signature):
+    """Packs a signature for storing.
+
+    :signature: A numpy array from get_signature
+    :returns: A string of raw bytes
+
+    """
+    return signature.astype('<u4').tostring()
+
+
+def from_bytes(data):
+    """Unpacks a signature packed by to_bytes.
+
+    :data: A string of raw bytes
+    :returns: A numpy array of uint32
+
+    """
+    return np.frombuffer(data, dtype='<u4').astype(np.uint32)
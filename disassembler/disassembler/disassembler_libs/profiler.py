@@ -0,0 +1,408 @@
+'''
+Profiles a disassembly run phase by phase, in every worker.
+
+A run is split into named phases (predisassembly, executable sections,
+each parser and so on). The process running the disassembly profiles each
+phase, and every task an executor hands to a pool worker is profiled in
+that worker under the phase it was submitted in. When the run is done the
+profiles of each phase are merged into <phase>.pstats, for pstats or
+snakeviz, and <phase>.collapsed, one 'a;b;c count' stack per line for
+flamegraph.pl and speedscope.
+
+It is configured in the [Debugging] config section:
+    profiler_on      Whether to profile at all
+    profiler         'cprofile' to trace every call, or 'sampling' to look
+                     at the stacks every sample_interval seconds of CPU
+                     time, which costs far less but only sees the main
+                     thread of worker processes
+    profile_dir      Where to write profiles - each run gets a directory
+    sample_interval  Seconds of CPU time between samples
+'''
+
+import cProfile
+import errno
+import glob
+import multiprocessing.pool
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PROFILER_NAMES = ['cprofile', 'sampling']
+
+# Call paths deeper than this are cut off in collapsed stacks
+MAX_STACK_DEPTH = 100
+
+# Parts of collapsed stacks from cProfile smaller than this are dropped
+MIN_COLLAPSED_WEIGHT = 1
+
+# Where threads sit while they wait - on a Condition (a queue or a pool
+# result) or in the loop a pool uses to watch its workers
+IDLE_CODES = set([threading._Condition.wait.im_func.func_code,
+                  multiprocessing.pool.Pool._handle_workers.func_code])
+
+
+class UnknownProfiler(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+def get_code_name(code):
+    """Names a code object for a collapsed stack.
+
+    :code: A code object from a frame
+    :returns: A string like 'linear.py:iter_executable_section'
+
+    """
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+
+def get_func_name(func):
+    """Names a function from a pstats key for a collapsed stack.
+
+    :func: A (filename, line, name) tuple from pstats
+    :returns: A string like 'linear.py:iter_executable_section'
+
+    """
+    filename, line, name = func
+    if filename == '~':
+        # Built-in functions have no file
+        return name
+    return '%s:%s' % (os.path.basename(filename), name)
+
+
+def pstats_to_collapsed(stats):
+    """Turns the call graph of a pstats.Stats into collapsed stacks.
+
+    cProfile only records who called whom, not whole stacks, so each
+    function's time is split between its callers in proportion to the time
+    spent in it from each one, as flameprof and similar tools do.
+
+    :stats: A pstats.Stats object
+    :returns: A dict of collapsed stack string to microseconds
+
+    """
+    callees = defaultdict(list)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.iteritems():
+        if len(callers) == 0:
+            roots.append(func)
+        for caller, edge in callers.iteritems():
+            callees[caller].append((func, edge[3]))
+
+    collapsed = defaultdict(int)
+
+    def visit(func, stack, scale, depth):
+        cc, nc, tt, ct, callers = stats.stats[func]
+        stack = stack + [get_func_name(func)]
+        weight = int(tt * scale * 1e6)
+        if weight > 0:
+            collapsed[';'.join(stack)] += weight
+        if depth >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_ct in callees[func]:
+            callee_ct = stats.stats[callee][3]
+            if callee_ct <= 0 or get_func_name(callee) in stack:
+                continue
+            sub_scale = scale * edge_ct / callee_ct
+            if sub_scale * callee_ct * 1e6 >= MIN_COLLAPSED_WEIGHT:
+                visit(callee, stack, sub_scale, depth + 1)
+
+    for func in roots:
+        visit(func, [], 1.0, 0)
+    return collapsed
+
+
+def write_collapsed(path, collapsed):
+    """Writes collapsed stacks to a file, one 'stack count' per line.
+
+    :path: The file to write
+    :collapsed: A dict of collapsed stack string to count
+    :returns: None
+
+    """
+    with open(path, 'w') as f:
+        for stack in sorted(collapsed):
+            f.write('%s %d\n' % (stack, collapsed[stack]))
+
+
+def read_collapsed(path, collapsed):
+    """Adds the stacks in a collapsed stack file to a dict.
+
+    :path: The file to read
+    :collapsed: A dict of collapsed stack string to count to add to
+    :returns: None
+
+    """
+    with open(path) as f:
+        for line in f:
+            stack, count = line.rstrip('\n').rsplit(' ', 1)
+            collapsed[stack] += int(count)
+
+
+class Sampler(object):
+    """Samples the stack of every thread on a CPU time interval timer."""
+
+    def __init__(self, interval):
+        """Initializes a Sampler.
+
+        :interval: Seconds of CPU time between samples
+
+        """
+        self.interval = interval
+        self.label = None
+        self.samples = defaultdict(lambda: defaultdict(int))
+
+    def start(self):
+        """Starts sampling. Must be called from the main thread.
+
+        :returns: None
+
+        """
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stops sampling.
+
+        :returns: None
+
+        """
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def sample(self, signum, frame):
+        """Records the stack of every thread. The SIGPROF handler.
+
+        :signum: The signal number
+        :frame: The frame that was interrupted in the main thread
+
+        """
+        me = threading.current_thread().ident
+        counts = self.samples[self.label]
+        for ident, f in sys._current_frames().iteritems():
+            if ident == me:
+                # Don't sample the handler itself
+                f = frame
+            elif f.f_code in IDLE_CODES:
+                # Threads that are waiting, such as idle pool workers
+                continue
+            stack = []
+            while f is not None:
+                stack.append(get_code_name(f.f_code))
+                f = f.f_back
+            stack.reverse()
+            counts[';'.join(stack)] += 1
+
+
+class Profiler(object):
+    """Profiles the phases of a run and the tasks run in them."""
+
+    def __init__(self, kind, profile_dir, interval):
+        """Initializes a Profiler.
+
+        :kind: 'cprofile' or 'sampling'
+        :profile_dir: The directory to make this run's directory in
+        :interval: Seconds of CPU time between samples when sampling
+
+        """
+        if kind not in PROFILER_NAMES:
+            raise UnknownProfiler('No profiler named %s - use one of %s'
+                                  % (kind, ', '.join(PROFILER_NAMES)))
+        self.kind = kind
+        self.interval = interval
+        self.out_dir = os.path.join(profile_dir,
+                                    time.strftime('%Y%m%d-%H%M%S') +
+                                    '-%d' % os.getpid())
+        # (name, cProfile.Profile) for each phase that has been entered
+        self.phases = []
+        self.sampler = None
+        self.count = 0
+
+    def __getstate__(self):
+        # Profiles of the phases this process is in can't be pickled, and
+        # are no use to a worker anyway
+        state = self.__dict__.copy()
+        state['phases'] = []
+        state['sampler'] = None
+        return state
+
+    def get_phase(self):
+        """Returns the name of the innermost phase that has been entered.
+
+        :returns: A phase name
+
+        """
+        if len(self.phases) == 0:
+            return 'main'
+        return self.phases[-1][0]
+
+    @contextmanager
+    def phase(self, name):
+        """Profiles this process for the length of a with block.
+
+        Phases can be nested - time is counted only towards the innermost.
+
+        :name: The name of the phase
+        :returns: A context manager
+
+        """
+        if self.kind == 'cprofile':
+            if len(self.phases) > 0:
+                self.phases[-1][1].disable()
+            prof = cProfile.Profile()
+            self.phases.append((name, prof))
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                self.phases.pop()
+                self.dump_profile(name, prof)
+                if len(self.phases) > 0:
+                    self.phases[-1][1].enable()
+        else:
+            self.phases.append((name, None))
+            started = self.sampler is None
+            if started:
+                self.sampler = Sampler(self.interval)
+                self.sampler.start()
+            self.sampler.label = name
+            try:
+                yield
+            finally:
+                self.phases.pop()
+                if started:
+                    self.sampler.stop()
+                    self.dump_samples(self.sampler)
+                    self.sampler = None
+                else:
+                    self.sampler.label = self.get_phase()
+
+    @contextmanager
+    def task(self, phase):
+        """Profiles a task run by a pool worker.
+
+        When sampling, tasks on threads are already seen by the sampler of
+        the main thread and aren't profiled again.
+
+        :phase: The name of the phase the task was submitted in
+        :returns: A context manager
+
+        """
+        if self.kind == 'cprofile':
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                self.dump_profile(phase, prof)
+        elif not isinstance(threading.current_thread(), threading._MainThread):
+            yield
+        else:
+            sampler = Sampler(self.interval)
+            sampler.label = phase
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                self.dump_samples(sampler)
+
+    def _get_path(self, phase, ext):
+        """Returns a file name for a profile that no other worker will use.
+
+        :phase: The name of the phase the profile is of
+        :ext: The file extension
+        :returns: A path
+
+        """
+        phase_dir = os.path.join(self.out_dir, phase)
+        try:
+            os.makedirs(phase_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.count += 1
+        name = '%d-%d-%d.%s' % (os.getpid(), threading.current_thread().ident,
+                                self.count, ext)
+        return os.path.join(phase_dir, name)
+
+    def dump_profile(self, phase, prof):
+        """Writes a cProfile profile to the phase's directory.
+
+        :phase: The name of the phase
+        :prof: A cProfile.Profile
+        :returns: None
+
+        """
+        prof.dump_stats(self._get_path(phase, 'prof'))
+
+    def dump_samples(self, sampler):
+        """Writes a sampler's stacks to the directory of each phase.
+
+        :sampler: A Sampler
+        :returns: None
+
+        """
+        for phase, counts in sampler.samples.iteritems():
+            write_collapsed(self._get_path(phase, 'samples'), counts)
+
+    def write_report(self):
+        """Merges the profiles of every process by phase.
+
+        Writes <phase>.pstats (cProfile only) and <phase>.collapsed for each
+        phase, and all.pstats and all.collapsed for the whole run.
+
+        :returns: The directory the report was written to
+
+        """
+        if not os.path.isdir(self.out_dir):
+            return self.out_dir
+
+        all_profiles = []
+        all_collapsed = defaultdict(int)
+        for phase in sorted(os.listdir(self.out_dir)):
+            phase_dir = os.path.join(self.out_dir, phase)
+            if not os.path.isdir(phase_dir):
+                continue
+
+            collapsed = defaultdict(int)
+            profiles = glob.glob(os.path.join(phase_dir, '*.prof'))
+            if len(profiles) > 0:
+                stats = pstats.Stats(*profiles)
+                stats.dump_stats(phase_dir + '.pstats')
+                collapsed = pstats_to_collapsed(stats)
+                all_profiles += profiles
+            for path in glob.glob(os.path.join(phase_dir, '*.samples')):
+                read_collapsed(path, collapsed)
+
+            write_collapsed(phase_dir + '.collapsed', collapsed)
+            for stack, count in collapsed.iteritems():
+                all_collapsed[phase + ';' + stack] += count
+
+        if len(all_profiles) > 0:
+            pstats.Stats(*all_profiles).dump_stats(
+                os.path.join(self.out_dir, 'all.pstats'))
+        write_collapsed(os.path.join(self.out_dir, 'all.collapsed'),
+                        all_collapsed)
+        return self.out_dir
+
+
+def make_profiler(config):
+    """Creates the profiler chosen in the configuration.
+
+    :config: A configuration file to read, or None
+    :returns: A Profiler, or None if profiling is off
+
+    """
+    if config is None or not config.getboolean('Debugging', 'profiler_on'):
+        return None
+    return Profiler(config.get('Debugging', 'profiler'),
+                    config.get('Debugging', 'profile_dir'),
+                    config.getfloat('Debugging', 'sample_interval'))
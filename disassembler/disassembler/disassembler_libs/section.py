@@ -8,22 +8,48 @@ from label import Label
 
 class Section(Label):
     """An internal representation of a section"""
-    def __init__(self, name, data, attribs, base_addr, size):
+    def __init__(self, name, data, attribs, base_addr, size, blob=None):
         """Initializes a section object
 
         :name: The name of the section, for labelling purposes (can be renamed)
-        :data: The raw data (bytes) of the section
+        :data: The raw data (bytes) of the section, or None if it should
+               be read from blob the first time it is used
         :attribs: The section's attributes
         :base_addr: The base_address that this section begins at
         :size: The size of the section in bytes
+        :blob: A BlobRef holding the section's data
 
         """
         Label.__init__(self, name, 'sec')
-        self.data = data
+        self._data = data
+        self.blob = blob
         self.attribs = attribs
         self.base_addr = base_addr
         self.size = size
 
+    @property
+    def data(self):
+        """The raw data (bytes) of the section, loaded on first use."""
+        if self._data is None and self.blob is not None:
+            self._data = self.blob.read()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def read(self, start, end):
+        """Reads a range of the section's data without loading all of it.
+
+        :start: Relative address of the first byte (inclusive)
+        :end: Relative address of the last byte (exclusive)
+        :returns: A string of raw bytes
+
+        """
+        if self._data is None and self.blob is not None:
+            return self.blob.read(start, end)
+        return self.data[start:end]
+
     def is_executable(self):
         """Returns true if this section is executable
 
@@ -0,0 +1,64 @@
+'''
+A lookup structure mapping absolute addresses to the sections
+that contain them.
+'''
+
+import bisect
+import numpy as np
+
+
+class SectionMap(object):
+    """Finds the section containing an address with a binary search.
+
+    Sections that don't occupy any address space (a base address of zero,
+    as with unmapped sections, or no data) are left out, since they would
+    otherwise 'share' the addresses at the start of the address space.
+
+    """
+
+    def __init__(self, sections):
+        """Initializes a SectionMap from a list of sections.
+
+        :sections: A list of Section objects
+
+        """
+        mapped = [s for s in sections if s.base_addr != 0 and s.size > 0]
+        self.sections = sorted(mapped, key=lambda s: s.base_addr)
+        self.starts = [s.base_addr for s in self.sections]
+        self.ends = [s.base_addr + s.size for s in self.sections]
+
+    def find(self, addr):
+        """Returns the section that contains the absolute address addr.
+
+        :addr: The absolute address to look up
+        :returns: A Section object or None
+
+        """
+        i = bisect.bisect_right(self.starts, addr) - 1
+        if i >= 0 and addr < self.ends[i]:
+            return self.sections[i]
+        return None
+
+    def find_indices(self, addrs):
+        """Looks up a whole array of addresses at once.
+
+        :addrs: A numpy array of absolute addresses
+        :returns: A numpy array holding, for each address, the index into
+                  self.sections of the section containing it, or -1
+
+        """
+        if len(self.sections) == 0:
+            return np.zeros(len(addrs), dtype=np.int64) - 1
+        starts = np.array(self.starts, dtype=np.int64)
+        ends = np.array(self.ends, dtype=np.int64)
+        idx = np.searchsorted(starts, addrs, side='right') - 1
+        inside = (idx >= 0) & (addrs < ends[np.maximum(idx, 0)])
+        return np.where(inside, idx, -1)
+
+    def contains(self, addr):
+        """Returns true if any section contains the absolute address addr.
+
+        :returns: True if mapped, otherwise False
+
+        """
+        return self.find(addr) is not None
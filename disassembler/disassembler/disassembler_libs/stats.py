@@ -0,0 +1,172 @@
+'''
+Summary statistics of a disassembly, kept up to date as it is written.
+
+Every write of instructions, strings or xrefs adds to a single document
+per disassembly in the stats collection with one $inc, so an overview of
+the disassembly never has to scan it. Per section it holds:
+    size          The size of the section in bytes
+    insts         Records of any kind
+    code_insts    Records that are instructions
+    data_insts    Records that are data
+    code_bytes    Bytes covered by instructions
+    data_bytes    Bytes covered by data
+    data_runs     Runs of data records in a row
+    strings       String labels
+    xrefs         Xrefs from the section
+    mnemonics     Count of each mnemonic
+Section names and mnemonics can hold '.', which mongo keys can't, so keys
+are escaped (see escape_key).
+'''
+
+from collections import defaultdict
+
+FIELDS = ['insts', 'code_insts', 'data_insts', 'code_bytes', 'data_bytes',
+          'data_runs', 'strings', 'xrefs']
+
+
+def escape_key(name):
+    """Makes a name safe to use as a mongo key.
+
+    :name: A section name or mnemonic
+    :returns: The escaped name
+
+    """
+    return name.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def unescape_key(key):
+    """Undoes escape_key.
+
+    :key: An escaped name
+    :returns: The name
+
+    """
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+
+def count_records(records, data_run_end=None):
+    """Counts a batch of disassembler records of one section.
+
+    :records: Dicts with the addr, is_text, my_bytes and mnemonic fields,
+              in address order
+    :data_run_end: The address after the last data record written to the
+                   section before these, if known
+    :returns: A (counts, data_run_end) tuple - a dict of FIELDS and
+              'mnemonics' to add, and the address after the last data
+              record
+
+    """
+    counts = defaultdict(int)
+    mnemonics = defaultdict(int)
+    for rec in records:
+        size = len(rec['my_bytes'])
+        counts['insts'] += 1
+        if rec['is_text']:
+            counts['code_insts'] += 1
+            counts['code_bytes'] += size
+        else:
+            counts['data_insts'] += 1
+            counts['data_bytes'] += size
+            if rec['addr'] != data_run_end:
+                counts['data_runs'] += 1
+            data_run_end = rec['addr'] + size
+        mnemonics[rec['mnemonic']] += 1
+    counts['mnemonics'] = dict(mnemonics)
+    return dict(counts), data_run_end
+
+
+def make_inc(sec_name, counts, sign=1):
+    """Builds the $inc document that adds counts to a section.
+
+    :sec_name: Name of the section
+    :counts: A dict of FIELDS, and optionally 'mnemonics', to add
+    :sign: 1 to add the counts, -1 to take them away
+    :returns: A dict for $inc
+
+    """
+    prefix = 'sections.%s.' % escape_key(sec_name)
+    inc = {}
+    for field in FIELDS:
+        if counts.get(field, 0) != 0:
+            inc[prefix + field] = sign * counts[field]
+    for mnemonic, count in counts.get('mnemonics', {}).iteritems():
+        inc[prefix + 'mnemonics.' + escape_key(mnemonic)] = sign * count
+    return inc
+
+
+def read_stats(doc):
+    """Turns a stats document into plain dicts with the names unescaped.
+
+    :doc: A record from the stats collection, or None
+    :returns: A dict with 'sections', a dict of section name to its stats,
+              and 'totals', the stats of every section added together
+
+    """
+    sections = {}
+    totals = dict((field, 0) for field in FIELDS + ['size'])
+    totals['mnemonics'] = defaultdict(int)
+    if doc is None:
+        doc = {}
+    for key, sec in doc.get('sections', {}).iteritems():
+        stats = dict((field, sec.get(field, 0)) for field in FIELDS + ['size'])
+        stats['mnemonics'] = dict((unescape_key(k), v) for k, v
+                                  in sec.get('mnemonics', {}).iteritems())
+        sections[unescape_key(key)] = stats
+        for field in FIELDS + ['size']:
+            totals[field] += stats[field]
+        for mnemonic, count in stats['mnemonics'].iteritems():
+            totals['mnemonics'][mnemonic] += count
+    totals['mnemonics'] = dict(totals['mnemonics'])
+    return {'sections': sections, 'totals': totals}
+
+
+def diff_counts(old, new):
+    """Works out what to add to turn one set of counts into another.
+
+    :old: A dict of FIELDS and 'mnemonics', as from count_records
+    :new: Another such dict
+    :returns: A dict of the non-zero differences, new minus old
+
+    """
+    diff = {}
+    for field in FIELDS:
+        change = new.get(field, 0) - old.get(field, 0)
+        if change != 0:
+            diff[field] = change
+    mnemonics = defaultdict(int)
+    for mnemonic, count in new.get('mnemonics', {}).iteritems():
+        mnemonics[mnemonic] += count
+    for mnemonic, count in old.get('mnemonics', {}).iteritems():
+        mnemonics[mnemonic] -= count
+    diff['mnemonics'] = dict((k, v) for k, v in mnemonics.iteritems()
+                             if v != 0)
+    return diff
+
+
+def count_replacement(old, new, before, after):
+    """Counts the change made by replacing the records of a range.
+
+    Runs of data are counted as if the section had been written in order,
+    so data that now joins up with, or splits from, the records either side
+    of the range is taken into account.
+
+    :old: The records that were in the range, in address order
+    :new: The records replacing them, in address order
+    :before: A list of the record just before the range, if there is one
+    :after: A list of the record just after the range, if there is one
+    :returns: A dict of counts to add, as for make_inc
+
+    """
+    run_end = None
+    for rec in before:
+        if not rec['is_text']:
+            run_end = rec['addr'] + len(rec['my_bytes'])
+
+    diff = diff_counts(count_records(old, run_end)[0],
+                       count_records(new, run_end)[0])
+    runs = (count_records(new + after, run_end)[0].get('data_runs', 0) -
+            count_records(old + after, run_end)[0].get('data_runs', 0))
+    diff.pop('data_runs', None)
+    if runs != 0:
+        diff['data_runs'] = runs
+    return diff
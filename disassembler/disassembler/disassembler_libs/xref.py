@@ -7,22 +7,33 @@ address of a string. The xref would contain:
     base_addr = <relative address of instruction in section>
     section_sec_name = <section name of instruction>
     ref_loc = <location object being referenced>
+    kind = XREF_STRING
 '''
 
+# The kinds of reference - how the referencing instruction uses the address
+XREF_CALL = 'call'        # Calls it
+XREF_JUMP = 'jump'        # Jumps to it, conditionally or not
+XREF_DATA = 'data'        # Anything else - reads it, stores it, points to it
+XREF_STRING = 'string'    # Data reference to the start of a string
+
+XREF_KINDS = [XREF_CALL, XREF_JUMP, XREF_DATA, XREF_STRING]
+
 
 class Xref(object):
     """An internal representation of an xref in disassembled code"""
-    def __init__(self, base_addr, base_sec_name, ref_loc):
+    def __init__(self, base_addr, base_sec_name, ref_loc, kind=XREF_DATA):
         """Initializes an xref object.
 
         :base_addr: The relative address of the inst doing the referencing
         :base_sec_name: The section name of the inst doing the referencing
         :ref_loc: The location object being referenced to
+        :kind: One of XREF_KINDS
 
         """
         self.base_addr = base_addr
         self.base_sec_name = base_sec_name
         self.ref_loc = ref_loc
+        self.kind = kind
 
     def __str__(self):
         """Returns a string representation of this xref.
@@ -30,8 +41,8 @@ class Xref(object):
         :returns: A string rep
 
         """
-        rep = '%s:0x%08x => %s' % (self.base_sec_name,
-                                   self.base_addr,
-                                   self.ref_loc)
+        rep = '%s:0x%08x =%s=> %s' % (self.base_sec_name,
+                                      self.base_addr,
+                                      self.kind,
+                                      self.ref_loc)
         return rep
-
@@ -0,0 +1,225 @@
+'''
+A library interface to the disassembler that works entirely in memory.
+
+Where Disassembler stores everything it finds in the database, a
+MemoryDisassembler takes raw bytes (or a binary on disk) and hands back
+instructions, labels and xrefs directly, without a database or any other
+I/O. It runs the same Strategy and Heuristics classes as a full
+disassembly, so it is also the way to measure decoding on its own:
+
+    md = MemoryDisassembler.from_bytes(code, capstone.CS_ARCH_X86,
+                                       capstone.CS_MODE_64, 0x400000)
+    for sec_name, inst in md.instructions():
+        print sec_name, inst
+
+Instructions, like everywhere else, have addresses relative to their
+section. columns() gives absolute addresses instead.
+'''
+
+import numpy as np
+from disassembler_libs.attributes import Attributes
+from disassembler_libs.binhandler import BinHandler
+from disassembler_libs.function import Function
+from disassembler_libs.section import Section
+from parsers.functionparser import find_functions
+from parsers.xrefparser import XrefFinder
+from predisassemblers.predisassembler import make_format_predisassembler
+from strategies.auto import Auto
+from strategies.linear import Linear
+from strategies.recursive import Recursive
+
+STRATEGIES = {'linear': Linear,
+              'recursive': Recursive,
+              'auto': Auto}
+
+
+class UnknownStrategy(Exception):
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+
+
+class MemoryDisassembler(object):
+    """Disassembles a list of in-memory sections."""
+
+    def __init__(self, sections, arch, mode, entry_points=None,
+                 strategy='linear', config=None, symbol_labels=None):
+        """Initializes a MemoryDisassembler.
+
+        :sections: A list of Section objects holding their data
+        :arch: The capstone architecture of the code
+        :mode: The capstone mode of the code
+        :entry_points: A list of absolute addresses to start recursive
+                       disassembly from
+        :strategy: 'linear', 'recursive' or 'auto'
+        :config: An optional configuration file passed on to the strategy
+        :symbol_labels: A list of labels already known for the sections
+
+        """
+        if strategy not in STRATEGIES:
+            raise UnknownStrategy('No strategy named %s' % strategy)
+
+        self.sections = sections
+        self.arch = arch
+        self.mode = mode
+        self.entry_points = entry_points if entry_points is not None else []
+        self.symbol_labels = symbol_labels if symbol_labels is not None else []
+        self.strategy = STRATEGIES[strategy](None, None, config, sections,
+                                             arch, mode, self.entry_points)
+        self.heuristics = self.strategy.heuristics
+
+    @classmethod
+    def from_bytes(cls, data, arch, mode, base_addr=0, strategy='linear',
+                   config=None):
+        """Creates a MemoryDisassembler for a single buffer of code.
+
+        The buffer is treated as one executable section, and recursive
+        disassembly starts at its first byte.
+
+        :data: A string of raw bytes
+        :arch: The capstone architecture of the code
+        :mode: The capstone mode of the code
+        :base_addr: The absolute address of the first byte
+        :strategy: 'linear', 'recursive' or 'auto'
+        :config: An optional configuration file passed on to the strategy
+        :returns: A MemoryDisassembler
+
+        """
+        sec = Section('.code', data, Attributes('RX'), base_addr, len(data))
+        return cls([sec], arch, mode, [base_addr], strategy, config)
+
+    @classmethod
+    def from_path(cls, binpath, strategy='linear', config=None):
+        """Creates a MemoryDisassembler for a binary on disk.
+
+        The binary's sections, arch and mode come from its headers. Its
+        entry point, the seeds found by the predisassembler and its symbols
+        are used as well.
+
+        :binpath: A path to the binary to disassemble
+        :strategy: 'linear', 'recursive' or 'auto'
+        :config: An optional configuration file passed on to the strategy
+        :returns: A MemoryDisassembler
+
+        """
+        handler = BinHandler(binpath)
+        predis = make_format_predisassembler(handler.get_format(), config,
+                                             None, None, handler)
+
+        entry_points = [handler.get_entry_point()]
+        labels = predis.get_symbol_labels()
+        try:
+            for x in predis.run():
+                if x not in entry_points:
+                    entry_points.append(x)
+        except NotImplementedError:
+            pass
+
+        return cls(handler.get_sections(), handler.get_arch(),
+                   handler.get_mode(), entry_points, strategy, config,
+                   labels)
+
+    def instructions(self):
+        """Lazily disassembles every section.
+
+        :returns: A generator of (section_name, Instruction) tuples
+
+        """
+        return self.strategy.iter_instructions(self.sections)
+
+    def labels(self, min_call_refs=2):
+        """Finds the labels of the disassembly.
+
+        These are the symbol labels, if there are any, along with the
+        functions found by the FunctionParser heuristics. As in the
+        database, a symbol wins over a heuristic function at the same spot.
+
+        :min_call_refs: Number of calls needed to trust a bare call target
+        :returns: A list of Label objects
+
+        """
+        labels = list(self.symbol_labels)
+        if self.heuristics is None:
+            return labels
+
+        known = set((x.sec_name, x.r_start_addr) for x in labels
+                    if isinstance(x, Function))
+        ex = [s for s in self.sections if s.is_executable()]
+        for func in find_functions(ex, self.heuristics, min_call_refs):
+            if (func.sec_name, func.r_start_addr) not in known:
+                labels.append(func)
+        return labels
+
+    def xrefs(self, instructions=None):
+        """Finds references from instruction operands to the sections.
+
+        :instructions: An iterable of (section_name, Instruction) tuples -
+                       by default the disassembly is run again
+        :returns: A generator of Xref objects
+
+        """
+        if instructions is None:
+            instructions = self.instructions()
+
+        finder = XrefFinder(self.sections, self.arch, self.mode)
+        for sec_name, inst in instructions:
+            for op, xref in finder.find(sec_name, inst):
+                yield xref
+
+    def columns(self):
+        """Disassembles every section into columns of numpy arrays.
+
+        Row i of every column describes the same instruction. 'sec' holds
+        an index into 'sec_names'.
+
+        :returns: A dict with 'sec_names' and the 'sec', 'addr', 'size',
+                  'is_text' and 'mnemonic' columns
+
+        """
+        sec_names = [s.name for s in self.sections]
+        sec_index = dict((s.name, i) for i, s in enumerate(self.sections))
+        bases = dict((s.name, s.base_addr) for s in self.sections)
+
+        sec = []
+        addr = []
+        size = []
+        is_text = []
+        mnemonic = []
+        for sec_name, inst in self.instructions():
+            sec.append(sec_index[sec_name])
+            addr.append(bases[sec_name] + inst.r_addr)
+            size.append(len(inst.my_bytes))
+            is_text.append(inst.is_text)
+            mnemonic.append(inst.mnemonic)
+
+        return {'sec_names': sec_names,
+                'sec': np.array(sec, dtype=np.int32),
+                'addr': np.array(addr, dtype=np.uint64),
+                'size': np.array(size, dtype=np.uint8),
+                'is_text': np.array(is_text, dtype=bool),
+                'mnemonic': np.array(mnemonic, dtype=object)}
+
+
+def disassemble_bytes(data, arch, mode, base_addr=0, strategy='linear'):
+    """Disassembles a buffer of code in memory.
+
+    :data: A string of raw bytes
+    :arch: The capstone architecture of the code
+    :mode: The capstone mode of the code
+    :base_addr: The absolute address of the first byte
+    :strategy: 'linear', 'recursive' or 'auto'
+    :returns: A generator of (section_name, Instruction) tuples
+
+    """
+    md = MemoryDisassembler.from_bytes(data, arch, mode, base_addr, strategy)
+    return md.instructions()
+
+
+def disassemble_path(binpath, strategy='linear'):
+    """Disassembles a binary on disk in memory.
+
+    :binpath: A path to the binary to disassemble
+    :strategy: 'linear', 'recursive' or 'auto'
+    :returns: A generator of (section_name, Instruction) tuples
+
+    """
+    return MemoryDisassembler.from_path(binpath, strategy).instructions()
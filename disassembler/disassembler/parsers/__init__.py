@@ -1 +1,2 @@
-__all__ = ['functionparser', 'stringparser', 'xrefparser']
+__all__ = ['functionparser', 'stringparser', 'xrefparser', 'callgraphparser',
+           'gadgetparser', 'fingerprintparser', 'blockhashparser']
@@ -0,0 +1,262 @@
+'''
+Hashes the basic blocks of every function so the disassembly can be diffed
+against the others in its project (see bindiff.py).
+
+A function's blocks start at the function's start, after every jump and
+return, and at the target of every direct jump inside the function. Which
+instructions are jumps, calls and returns is found by decoding their bytes
+with the architecture's Heuristics - once for each distinct byte string,
+since most instructions turn up many times - and only the calls and jumps
+are decoded again at their own address to find where they go.
+'''
+
+import bisect
+import capstone
+import numpy as np
+from parser import Parser
+from disassembler_libs import logger
+from disassembler_libs.bindiff import (ADDR, FunctionHash, get_hash,
+                                       is_auto_name, normalize)
+from disassembler_libs.dbmanager import generate_db_manager
+from disassembler_libs.heuristics_factory import HeuristicsFactory
+
+# What an instruction does to the flow of control
+FLOW_NONE = 0      # Runs on to the next instruction
+FLOW_CALL = 1      # Calls, then runs on to the next instruction
+FLOW_JUMP = 2      # Jumps, maybe only on some condition
+FLOW_RET = 3       # Returns
+
+
+class BlockHasher(object):
+    """Splits functions into basic blocks and hashes them."""
+
+    def __init__(self, sections, names, heuristics, arch, mode):
+        """Initializes a BlockHasher.
+
+        :sections: A list of all Section objects of the disassembly
+        :names: A dict of the real name of the function at each absolute
+                start address
+        :heuristics: The Heuristics object for the binary's arch, or None
+                     to treat every function as a single block
+        :arch: The machine architecture of the disassembly
+        :mode: The mode of the arch
+
+        """
+        self.bounds = sorted((x.base_addr, x.base_addr + x.size)
+                             for x in sections)
+        self.starts = [x[0] for x in self.bounds]
+        self.names = names
+        self.heuristics = heuristics
+        self.md = capstone.Cs(arch, mode)
+        self.md.detail = True
+        self.kinds = {}
+
+    def is_addr(self, val):
+        """Checks whether a number is an address in the disassembly.
+
+        :val: The number
+        :returns: True if it's inside a section
+
+        """
+        i = bisect.bisect_right(self.starts, val) - 1
+        return i >= 0 and val < self.bounds[i][1]
+
+    def decode(self, inst):
+        """Decodes an instruction record again.
+
+        :inst: An Instruction object read from the db
+        :returns: A capstone CsInsn, or None if the bytes aren't valid
+
+        """
+        insts = list(self.md.disasm(str(inst.my_bytes), inst.r_addr, 1))
+        return insts[0] if len(insts) > 0 else None
+
+    def get_kind(self, inst):
+        """Works out what an instruction does to the flow of control.
+
+        :inst: An Instruction object read from the db
+        :returns: One of the FLOW_ values
+
+        """
+        key = str(inst.my_bytes)
+        if key not in self.kinds:
+            h = self.heuristics
+            cs_inst = None if h is None else self.decode(inst)
+            if cs_inst is None:
+                kind = FLOW_NONE
+            elif h.is_ret(cs_inst):
+                kind = FLOW_RET
+            elif h.is_call(cs_inst):
+                kind = FLOW_CALL
+            elif h.is_jump(cs_inst) or h.is_conditional_jump(cs_inst):
+                kind = FLOW_JUMP
+            else:
+                kind = FLOW_NONE
+            self.kinds[key] = kind
+        return self.kinds[key]
+
+    def get_target(self, inst, kind):
+        """Finds where a direct call or jump goes.
+
+        :inst: An Instruction object read from the db
+        :kind: Its FLOW_ value
+        :returns: The absolute address of the target, or None
+
+        """
+        h = self.heuristics
+        cs_inst = self.decode(inst)
+        if kind == FLOW_CALL:
+            return h.op_call_get_addr(cs_inst)
+        elif h.is_jump(cs_inst):
+            return h.op_jump_get_addr(cs_inst)
+        return h.op_conditional_jump_option(cs_inst)
+
+    def hash_function(self, name, start, end, insts):
+        """Splits a function into basic blocks and hashes them.
+
+        :name: Name of the function
+        :start: Absolute start address of the function
+        :end: Absolute end address of the function (inclusive)
+        :insts: The function's Instruction objects, in address order
+        :returns: A FunctionHash object
+
+        """
+        kinds = [self.get_kind(x) for x in insts]
+        targets = [self.get_target(x, kind)
+                   if kind in (FLOW_CALL, FLOW_JUMP) else None
+                   for x, kind in zip(insts, kinds)]
+
+        leaders = set([insts[0].r_addr])
+        for i in xrange(len(insts)):
+            if kinds[i] in (FLOW_JUMP, FLOW_RET) and i + 1 < len(insts):
+                leaders.add(insts[i + 1].r_addr)
+            if (kinds[i] == FLOW_JUMP and targets[i] is not None and
+                    start <= targets[i] <= end):
+                leaders.add(targets[i])
+
+        blocks = []
+        for inst, kind, target in zip(insts, kinds, targets):
+            if inst.r_addr in leaders:
+                blocks.append((inst.r_addr, [], []))
+            # Calls to named functions keep the name, which says much more
+            # about a block than any address
+            if target is None:
+                token = None
+            elif kind == FLOW_CALL:
+                token = self.names.get(target, ADDR)
+            else:
+                token = ADDR
+            blocks[-1][1].append(normalize(inst.mnemonic, inst.operands,
+                                           self.is_addr, token))
+            blocks[-1][2].append(inst.mnemonic)
+
+        return FunctionHash(name, start, [x[0] for x in blocks],
+                            [get_hash(x[1]) for x in blocks],
+                            [get_hash(x[2]) for x in blocks])
+
+
+def find_function_hashes(config, db_man):
+    """Hashes the basic blocks of the functions of a disassembly.
+
+    :config: A configuration file to read
+    :db_man: The database manager to use
+    :returns: A list of FunctionHash objects
+
+    """
+    sections = list(db_man.get_sections())
+    arch = db_man.get_arch()
+    mode = db_man.get_mode()
+    heuristics = HeuristicsFactory(config, arch, mode).create_heuristics()
+    bases = dict((x.name, x.base_addr) for x in sections)
+
+    # One function per start, preferring a real name to a sub_ one
+    funcs = {}
+    for func in db_man.get_functions():
+        if func.sec_name not in bases:
+            continue
+        start = func.r_start_addr + bases[func.sec_name]
+        end = func.r_end_addr + bases[func.sec_name]
+        found = funcs.setdefault(func.sec_name, {}).get(start)
+        if found is None or (is_auto_name(found[0]) and
+                             not is_auto_name(func.name)):
+            funcs[func.sec_name][start] = (func.name, end)
+    names = dict((start, name) for sec_funcs in funcs.values()
+                 for start, (name, end) in sec_funcs.iteritems()
+                 if not is_auto_name(name))
+
+    hasher = BlockHasher(sections, names, heuristics, arch, mode)
+    hashes = []
+    for sec in db_man.get_exec_sections():
+        if sec.name not in funcs:
+            continue
+        insts = [x for x in db_man.get_disassembler_records(
+                     sec.name, ['mnemonic', 'my_bytes', 'operands'])
+                 if x.is_text]
+        addrs = np.array([x.r_addr for x in insts], dtype=np.int64)
+
+        for start, (name, end) in sorted(funcs[sec.name].iteritems()):
+            lo = np.searchsorted(addrs, start)
+            hi = np.searchsorted(addrs, end, side='right')
+            if hi > lo:
+                hashes.append(hasher.hash_function(name, start, end,
+                                                   insts[lo:hi]))
+    return hashes
+
+
+def load_function_hashes(config, project_name, disassembly_name):
+    """Fetches the function hashes of a disassembly, making them if needed.
+
+    :config: A configuration file to read
+    :project_name: The name of the project
+    :disassembly_name: The name of the disassembly
+    :returns: A list of FunctionHash objects
+
+    """
+    db_man = generate_db_manager(config, project_name, disassembly_name)
+    hashes = db_man.get_function_hashes()
+    if hashes is None:
+        hashes = find_function_hashes(config, db_man)
+        db_man.set_function_hashes(hashes)
+    return hashes
+
+
+class BlockHashParser(Parser):
+    """Hashes the basic blocks of the functions of the disassembly."""
+
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
+        """Initializes a BlockHashParser object.
+
+        :config: A configuration file to read
+        :project_name: The name of the project
+        :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
+
+        """
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
+        self.log = logger.getLogger(__name__, config)
+
+    def run(self):
+        """Run the blockhashparser.
+
+        Any hashes made by an earlier run are replaced.
+
+        :returns: None
+
+        """
+        self.log.info('BlockHashParser is running.')
+
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        hashes = find_function_hashes(self.config, db_man)
+        self.log.info('Hashed %d blocks of %d functions'
+                      % (sum(len(x) for x in hashes), len(hashes)))
+        db_man.set_function_hashes(hashes)
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
+    '''
+    Factory for BlockHashParser
+    '''
+    return BlockHashParser(config, project_name, disassembly_name, executor)
@@ -0,0 +1,118 @@
+'''
+Builds the call graph of a disassembly and stores it.
+
+The nodes are the function labels and the edges come from two places: the
+direct calls in the executable sections, decoded straight from the raw bytes
+with the architecture's Heuristics and kept only where an instruction of the
+disassembly starts, and the xrefs of kind 'call' found by the XrefParser.
+This runs after both the FunctionParser and the XrefParser so every function
+and xref is in place.
+'''
+
+import numpy as np
+from parser import Parser
+from disassembler_libs import logger
+from disassembler_libs.bytepattern import as_array
+from disassembler_libs.callgraph import CallGraph
+from disassembler_libs.dbmanager import generate_db_manager
+from disassembler_libs.heuristics_factory import HeuristicsFactory
+from disassembler_libs.xref import XREF_CALL
+
+
+def find_calls(db_man, sections, heuristics):
+    """Finds every call made from the executable sections.
+
+    :db_man: The database manager to use
+    :sections: A list of all Section objects of the disassembly
+    :heuristics: The Heuristics object for the binary's arch, or None
+    :returns: A (sites, targets) tuple of numpy arrays of absolute
+              addresses
+
+    """
+    sites = [np.zeros(0, dtype=np.int64)]
+    targets = [np.zeros(0, dtype=np.int64)]
+    bases = dict((x.name, x.base_addr) for x in sections)
+    for sec in [x for x in sections if x.is_executable()]:
+        if heuristics is not None:
+            sec_sites, sec_targets = heuristics.find_direct_call_targets(
+                as_array(sec.data))
+            sec_sites = sec_sites + sec.base_addr
+            # Call opcodes turn up inside other instructions and in data,
+            # so only keep the ones that were disassembled as instructions
+            code = np.array(db_man.get_code_addrs(sec.name), dtype=np.int64)
+            keep = np.in1d(sec_sites, code)
+            sites.append(sec_sites[keep])
+            targets.append(sec_targets[keep] + sec.base_addr)
+
+        xrefs = db_man.get_xrefs_from(sec.base_addr, sec.base_addr + sec.size,
+                                      XREF_CALL)
+        sites.append(np.array([x.base_addr + sec.base_addr for x in xrefs],
+                              dtype=np.int64))
+        targets.append(np.array([x.ref_loc.r_addr +
+                                 bases[x.ref_loc.sec_name] for x in xrefs],
+                                dtype=np.int64))
+    return np.concatenate(sites), np.concatenate(targets)
+
+
+def build_call_graph(config, db_man):
+    """Builds the call graph of a disassembly from what's in the db.
+
+    :config: A configuration file to read
+    :db_man: The database manager to use
+    :returns: A CallGraph object
+
+    """
+    sections = list(db_man.get_sections())
+    heuristics = HeuristicsFactory(config, db_man.get_arch(),
+                                   db_man.get_mode()).create_heuristics()
+
+    bases = dict((x.name, x.base_addr) for x in sections)
+    funcs = [(x.name, x.r_start_addr + bases[x.sec_name],
+              x.r_end_addr + bases[x.sec_name])
+             for x in db_man.get_functions() if x.sec_name in bases]
+
+    sites, targets = find_calls(db_man, sections, heuristics)
+    return CallGraph.build(funcs, sites, targets,
+                           config.getint('CallGraphParser', 'closure_limit'))
+
+
+class CallGraphParser(Parser):
+    """Builds the call graph of the disassembly."""
+
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
+        """Initializes a CallGraphParser object.
+
+        :config: A configuration file to read
+        :project_name: The name of the project
+        :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
+
+        """
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
+        self.log = logger.getLogger(__name__, config)
+
+    def run(self):
+        """Run the callgraphparser.
+
+        :returns: None
+
+        """
+        self.log.info('CallGraphParser is running.')
+
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        graph = build_call_graph(self.config, db_man)
+        self.log.info('Found %d calls between %d functions'
+                      % (graph.get_num_calls(), len(graph)))
+        if graph.reach is None:
+            self.log.info('Too many functions to index reachability')
+        db_man.set_call_graph(graph)
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
+    '''
+    Factory for CallGraphParser
+    '''
+    return CallGraphParser(config, project_name, disassembly_name, executor)
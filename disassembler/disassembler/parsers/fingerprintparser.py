@@ -0,0 +1,123 @@
+'''
+Fingerprints every function of a disassembly so similar functions can be
+found across the disassemblies of a project.
+
+A function's fingerprint is the MinHash signature of the n-grams of its
+mnemonics, and its buckets in the project's LSH index are the hashes of the
+bands of that signature (see minhash.py).
+'''
+
+import numpy as np
+from parser import Parser
+from disassembler_libs import logger, minhash
+from disassembler_libs.dbmanager import generate_db_manager
+from disassembler_libs.fingerprint import Fingerprint
+
+
+def find_fingerprints(db_man, n, num_perm, min_insts):
+    """Fingerprints the functions of a disassembly.
+
+    :db_man: The database manager to use
+    :n: The length of the mnemonic n-grams
+    :num_perm: The length of each signature
+    :min_insts: Functions with fewer instructions are left out, since
+                short functions look alike whatever they do
+    :returns: A list of Fingerprint objects
+
+    """
+    perms = minhash.get_permutations(num_perm)
+    funcs = {}
+    for func in db_man.get_functions():
+        funcs.setdefault(func.sec_name, {}).setdefault(func.r_start_addr,
+                                                        func)
+
+    fingerprints = []
+    for sec in db_man.get_exec_sections():
+        if sec.name not in funcs:
+            continue
+        addrs = []
+        mnemonics = []
+        for inst in db_man.get_disassembler_records(sec.name, ['mnemonic']):
+            if inst.is_text:
+                addrs.append(inst.r_addr)
+                mnemonics.append(inst.mnemonic)
+        addrs = np.array(addrs, dtype=np.int64)
+
+        for func in funcs[sec.name].values():
+            start = sec.base_addr + func.r_start_addr
+            end = sec.base_addr + func.r_end_addr
+            lo = np.searchsorted(addrs, start)
+            hi = np.searchsorted(addrs, end, side='right')
+            if hi - lo < min_insts:
+                continue
+            shingles = minhash.get_shingles(mnemonics[lo:hi], n)
+            fingerprints.append(Fingerprint(
+                func.name, start, int(hi - lo),
+                minhash.get_signature(shingles, perms)))
+    return fingerprints
+
+
+def build_fingerprints(config, db_man):
+    """Fingerprints the functions of a disassembly with the configured
+    options.
+
+    :config: A configuration file to read
+    :db_man: The database manager to use
+    :returns: A list of Fingerprint objects
+
+    """
+    return find_fingerprints(db_man,
+                             config.getint('FingerprintParser', 'ngram'),
+                             config.getint('FingerprintParser', 'num_perm'),
+                             config.getint('FingerprintParser', 'min_insts'))
+
+
+class FingerprintParser(Parser):
+    """Fingerprints the functions of the disassembly."""
+
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
+        """Initializes a FingerprintParser object.
+
+        :config: A configuration file to read
+        :project_name: The name of the project
+        :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
+
+        """
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
+        self.log = logger.getLogger(__name__, config)
+
+    def get_option(self, option):
+        """Reads one of the parser's numeric options from the config.
+
+        :option: Name of the option in [FingerprintParser]
+        :returns: Its value
+
+        """
+        return self.config.getint('FingerprintParser', option)
+
+    def run(self):
+        """Run the fingerprintparser.
+
+        Any fingerprints made by an earlier run are replaced.
+
+        :returns: None
+
+        """
+        self.log.info('FingerprintParser is running.')
+
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        fingerprints = build_fingerprints(self.config, db_man)
+        self.log.info('Fingerprinted %d functions' % len(fingerprints))
+        db_man.set_fingerprints(fingerprints, self.get_option('bands'))
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
+    '''
+    Factory for FingerprintParser
+    '''
+    return FingerprintParser(config, project_name, disassembly_name,
+                             executor)
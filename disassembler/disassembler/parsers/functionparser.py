@@ -1,53 +1,143 @@
 '''
 Uses heuristics to identify any missed functions in
 the disassembly and adds them to the database.
+
+Rather than walking every instruction in the database, this works directly
+on the raw bytes of the executable sections: each architecture's Heuristics
+supplies prologue and epilogue byte signatures and a decoder for direct
+calls, all of which are matched across a whole section at once.
 '''
 
+import numpy as np
 from parser import Parser
 from disassembler_libs import logger
+from disassembler_libs.bytepattern import as_array, find_patterns
+from disassembler_libs.dbmanager import generate_db_manager
+from disassembler_libs.function import Function
+from disassembler_libs.heuristics_factory import HeuristicsFactory
+
+
+def find_call_targets(sections, heuristics):
+    """Finds every direct call target in a list of sections.
+
+    :sections: A list of executable Section objects
+    :heuristics: The Heuristics object for the binary's arch
+    :returns: A (targets, counts) tuple of numpy arrays holding each
+              absolute target address and the number of calls to it
+
+    """
+    targets = []
+    for sec in sections:
+        sites, rel_targets = heuristics.find_direct_call_targets(
+            as_array(sec.data))
+        targets.append(rel_targets + sec.base_addr)
+
+    if len(targets) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(targets), return_counts=True)
+
+
+def find_functions(sections, heuristics, min_call_refs=2):
+    """Finds function bounds in a list of executable sections.
+
+    A function starts at a prologue signature or at the target of a direct
+    call. Scanning raw bytes for calls will also decode stray call opcodes
+    inside other instructions, so a call target without a prologue has to
+    be called from at least min_call_refs places to count. A function ends
+    at the last epilogue before the next function starts.
+
+    :sections: A list of executable Section objects
+    :heuristics: The Heuristics object for the binary's arch
+    :min_call_refs: Number of calls needed to trust a bare call target
+    :returns: A list of Function objects
+
+    """
+    align = heuristics.get_instruction_alignment()
+    prologues = heuristics.get_prologue_signatures()
+    epilogues = heuristics.get_epilogue_signatures()
+    targets, counts = find_call_targets(sections, heuristics)
+
+    funcs = []
+    for sec in sections:
+        data = as_array(sec.data)
+
+        in_sec = (targets >= sec.base_addr) & (targets < sec.base_addr +
+                                                len(data))
+        called = targets[in_sec] - sec.base_addr
+        trusted = called[(counts[in_sec] >= min_call_refs) &
+                         (called % align == 0)]
+
+        starts = np.union1d(find_patterns(data, prologues, align), trusted)
+        ends = find_patterns(data, epilogues, align)
+
+        # For each start, find the last epilogue before the next start
+        next_starts = np.append(starts[1:], len(data))
+        last_ends = np.searchsorted(ends, next_starts) - 1
+
+        for start, next_start, i in zip(starts, next_starts, last_ends):
+            if i >= 0 and ends[i] >= start:
+                end = ends[i]
+            else:
+                end = next_start - align
+            funcs.append(Function('sub_%08x' % (sec.base_addr + start),
+                                  int(start), int(end), sec.name))
+    return funcs
 
 
 class FunctionParser(Parser):
     """Uses heuristics to find any missed functions in the disassembly."""
 
-    def __init__(self, config, project_name, disassembly_name):
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
         """Initializes a FunctionParser object.
 
         :config: A configuration file to read
         :project_name: The name of the project
         :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
 
         """
-        Parser.__init__(self, config, project_name, disassembly_name)
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
         self.log = logger.getLogger(__name__)
 
+    def get_min_call_refs(self):
+        """Returns how many calls make a call target a function on its own.
+
+        :returns: Minimum number of call sites
+
+        """
+        return self.config.getint('FunctionParser', 'min_call_refs')
+
     def run(self):
-        '''
-        Some basic thoughts for this parser:
-        I think that both this class and the 'recursive' strategy should
-        have a handle to another class that actually does the heurstics
-        depending on arch and mode types.
-
-        I think this class should work by:
-        1. Retrieve all of the text instructions from the db
-            (that functionality still needs to be added to the dbmanager)
-        2. Iterate through them all and ask the other hueristics class
-           something like:
-            hueristics.looks_like_func_start(instruction)
-           and
-            heuristics.looks_like_func_end(instruction)
-        3. Add a Function label to the db if it doesn't already exist (I think
-           I already wrote that functionality, but you should double check)
-
-        That way, both this and the 'recursive' strategy should be able to use
-        the hueristics class.
-
-        '''
-        pass
-
-
-def make_parser(config, project_name, disassembly_name):
+        """Run the functionparser.
+
+        Functions that already have a label (from symbols, for example)
+        are left alone.
+
+        :returns: None
+
+        """
+        self.log.info('FunctionParser is running.')
+
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        fact = HeuristicsFactory(self.config, db_man.get_arch(),
+                                 db_man.get_mode())
+        heuristics = fact.create_heuristics()
+        if heuristics is None:
+            self.log.error('No heuristics for this architecture. Exiting.')
+            return
+
+        sections = [x for x in db_man.get_exec_sections()]
+        funcs = find_functions(sections, heuristics, self.get_min_call_refs())
+
+        self.log.info('Found %d functions' % len(funcs))
+        db_man.batch_upsert_functions(funcs)
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
     '''
     Factory for FuctionParser
     '''
-    return FunctionParser(config, project_name, disassembly_name)
+    return FunctionParser(config, project_name, disassembly_name, executor)
@@ -0,0 +1,212 @@
+'''
+Finds the ROP/JOP gadgets of a disassembly and adds them to the database.
+
+This works on the raw bytes of the executable sections, as a gadget can
+start in the middle of an instruction of the disassembly. Every return and
+indirect jump or call matching the Heuristics' gadget end signatures is a
+candidate end, and each address a few bytes before it a candidate start. The
+decoded instruction at each offset is kept, so the many candidates sharing a
+suffix only decode it once.
+'''
+
+import capstone
+from parser import Parser
+from disassembler_libs import logger
+from disassembler_libs.bytepattern import as_array, find_patterns
+from disassembler_libs.dbmanager import generate_db_manager
+from disassembler_libs.gadget import (Gadget, GADGET_ROP, GADGET_JOP,
+                                      GADGET_COP, normalize)
+from disassembler_libs.heuristics_factory import HeuristicsFactory
+from strategies.superset import MAX_INST_LEN
+
+
+class GadgetFinder(object):
+    """Finds the gadgets in the bytes of a section."""
+
+    def __init__(self, sec, heuristics, arch, mode):
+        """Initializes a GadgetFinder.
+
+        :sec: An executable Section object
+        :heuristics: The Heuristics object for the binary's arch
+        :arch: The machine architecture of the disassembly
+        :mode: The mode of the arch
+
+        """
+        self.sec = sec
+        self.data = str(sec.data)
+        self.heuristics = heuristics
+        self.md = capstone.Cs(arch, mode)
+        self.md.detail = True
+        self.decoded = {}
+
+    def decode(self, offset):
+        """Decodes the instruction at an offset, once.
+
+        :offset: Offset into the section
+        :returns: A capstone CsInsn, or None if the bytes aren't valid
+
+        """
+        if offset not in self.decoded:
+            window = self.data[offset:offset + MAX_INST_LEN]
+            insts = list(self.md.disasm(window, offset, 1))
+            self.decoded[offset] = insts[0] if len(insts) > 0 else None
+        return self.decoded[offset]
+
+    def get_kind(self, inst):
+        """Works out what kind of gadget an instruction would end.
+
+        :inst: A capstone CsInsn
+        :returns: One of GADGET_KINDS, or None if it can't end a gadget
+
+        """
+        h = self.heuristics
+        if h.is_ret(inst):
+            return GADGET_ROP
+        # Only indirect branches - direct ones go to a fixed address
+        if h.is_call(inst) and h.op_call_get_addr(inst) is None:
+            return GADGET_COP
+        if h.is_jump(inst) and h.op_jump_get_addr(inst) is None:
+            return GADGET_JOP
+        return None
+
+    def is_flow(self, inst):
+        """Checks whether an instruction changes control flow.
+
+        :inst: A capstone CsInsn
+        :returns: True if a gadget can't run through it
+
+        """
+        h = self.heuristics
+        return (h.is_ret(inst) or h.is_branch(inst) or
+                h.is_conditional_jump(inst))
+
+    def find(self, max_bytes, max_insts):
+        """Finds every gadget in the section.
+
+        :max_bytes: How far before its end a gadget may start
+        :max_insts: The most instructions in a gadget, counting its end
+        :returns: A list of Gadget objects with absolute addresses
+
+        """
+        align = self.heuristics.get_instruction_alignment()
+        signatures = self.heuristics.get_gadget_end_signatures()
+        ends = find_patterns(as_array(self.data), signatures, align)
+
+        gadgets = {}
+        for end in ends.tolist():
+            last = self.decode(end)
+            kind = None if last is None else self.get_kind(last)
+            if kind is None:
+                continue
+            for start in xrange(max(end - max_bytes, 0), end + 1, align):
+                insts = self.walk(start, end, max_insts - 1)
+                if insts is None:
+                    continue
+                insts.append(last)
+                text = ' ; '.join(normalize(x.mnemonic, x.op_str)
+                                  for x in insts)
+                if text not in gadgets:
+                    gadgets[text] = Gadget(text, [x.mnemonic for x in insts],
+                                           kind, [])
+                gadgets[text].addrs.append(self.sec.base_addr + start)
+        return gadgets.values()
+
+    def walk(self, start, end, max_insts):
+        """Decodes forwards from a start to see if it runs into an end.
+
+        :start: Offset to start decoding at
+        :end: Offset of the gadget's last instruction
+        :max_insts: The most instructions allowed before the end
+        :returns: The list of CsInsns from start up to the end, or None if
+                  they don't line up with it
+
+        """
+        insts = []
+        offset = start
+        while offset < end and len(insts) < max_insts:
+            inst = self.decode(offset)
+            if inst is None or self.is_flow(inst):
+                return None
+            insts.append(inst)
+            offset += inst.size
+        if offset != end:
+            return None
+        return insts
+
+
+def add_gadgets(config, project_name, disassembly_name, sec):
+    """Finds the gadgets of a section and adds them to the db.
+
+    :config: A configuration file to read
+    :project_name: The name of the project
+    :disassembly_name: The name of the disassembly
+    :sec: The executable Section to look through
+    :returns: None
+
+    """
+    log = logger.getLogger(__name__, config)
+    db_man = generate_db_manager(config, project_name, disassembly_name)
+    arch = db_man.get_arch()
+    mode = db_man.get_mode()
+    heuristics = HeuristicsFactory(config, arch, mode).create_heuristics()
+
+    finder = GadgetFinder(sec, heuristics, arch, mode)
+    gadgets = finder.find(config.getint('GadgetParser', 'max_bytes'),
+                          config.getint('GadgetParser', 'max_insts'))
+    log.debug('Found %d gadgets in %s' % (len(gadgets), sec.name))
+    db_man.batch_add_gadgets(gadgets)
+
+
+class GadgetParser(Parser):
+    """Finds the gadgets of the executable sections."""
+
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
+        """Initializes a GadgetParser object.
+
+        :config: A configuration file to read
+        :project_name: The name of the project
+        :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
+
+        """
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
+        self.log = logger.getLogger(__name__, config)
+
+    def run(self):
+        """Run the gadgetparser.
+
+        Any gadgets found by an earlier run are replaced.
+
+        :returns: None
+
+        """
+        self.log.info('GadgetParser is running.')
+
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        fact = HeuristicsFactory(self.config, db_man.get_arch(),
+                                 db_man.get_mode())
+        heuristics = fact.create_heuristics()
+        if heuristics is None:
+            self.log.error('No heuristics for this architecture. Exiting.')
+            return
+        # Leave any earlier gadgets alone rather than replace them with none
+        if len(heuristics.get_gadget_end_signatures()) == 0:
+            self.log.error('No gadget end signatures for this architecture. '
+                           'Exiting.')
+            return
+
+        db_man.remove_gadgets()
+        for sec in db_man.get_exec_sections():
+            self.executor.submit(add_gadgets, self.config, self.project_name,
+                                 self.disassembly_name, sec)
+        self.executor.wait()
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
+    '''
+    Factory for GadgetParser
+    '''
+    return GadgetParser(config, project_name, disassembly_name, executor)
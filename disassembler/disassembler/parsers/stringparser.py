@@ -27,29 +27,21 @@ def add_strings(config, project_name, disassembly_name, sec_name, strings):
     :returns: None
 
     """
-    #log = logger.getLogger(__name__, config)
     db_man = generate_db_manager(config, project_name, disassembly_name)
 
-    #log.debug('Found strings: %s' % strings)
-
+    # Swap the bytes of each string for a single instruction with
+    # disp='str', all in one go
     # TODO: Make this check for existing multi-byte sequences that
     #      might overlap and fix them appropriately.
     #      This will currently only work correctly if we're
-    #      deleting 1-byte instructions
-    ranges = [[s.addr, s.addr + len(s.contents)] for s in strings]
-
-    # First remove everything taking up these addreses
-    db_man.batch_delete_insts_in_addr_ranges(sec_name, ranges)
-
-    # Add instructions with appropriate length and disp='str'
-    insts = [parse_string_instruction(s) for s in strings]
-    db_man.batch_add_instructions(sec_name, insts)
+    #      replacing 1-byte instructions
+    db_man.replace_ranges(sec_name, [(s.addr, s.addr + len(s.contents),
+                                      [parse_string_instruction(s)])
+                                     for s in strings])
 
     # Add new string labels
-    #TODO: Make this batch as well. It's a lot of labels to add
-    for s in strings:
-        str_label = String(s.name, s.addr, sec_name)
-        db_man.add_string(str_label)
+    db_man.batch_add_labels([String(s.name, s.addr, sec_name)
+                             for s in strings])
 
 
 def parse_string_instruction(string):
@@ -66,17 +58,78 @@ def parse_string_instruction(string):
                        'str')  # disp
 
 
+def find_strings(data, length=5):
+    """Given a blob of data, find all c-strings in it.
+
+    :data: A string of raw bytes
+    :length: The minimum string length to look for
+    :returns: A list of StringFormats
+
+    """
+    pattern = re.compile(r"[\x20-\x7e]{%d,}\x00" % (length-1))
+    # This is inefficient here but allows us
+    # to do multiprocessing separation well
+    result = []
+    for x in pattern.finditer(data):
+        contents = bytearray(x.group())
+        name = x.group()[:-1]  # set name to its contents (minus \x00)
+        addr = x.start()
+        result.append(StringFormat(addr, name, contents))
+    return result
+
+
+def find_record_strings(insts, length=5):
+    """Finds the c-strings in the runs of byte records of some instructions.
+
+    :insts: A list of Instruction objects in address order
+    :length: The minimum string length to look for
+    :returns: A (insts, strings) tuple - the instructions with the bytes
+              of each string replaced by a string instruction, and a list
+              of StringFormats for the strings
+
+    """
+    result = []
+    strings = []
+    run = []
+    for inst in insts + [None]:
+        is_byte = (inst is not None and not inst.is_text and
+                   inst.disp == 'bytes' and len(inst.my_bytes) == 1)
+        if is_byte and (len(run) == 0 or
+                        inst.r_addr == run[-1].r_addr + 1):
+            run.append(inst)
+            continue
+
+        # The run has ended - swap its strings in
+        data = ''.join(str(x.my_bytes) for x in run)
+        pos = 0
+        for s in find_strings(data, length):
+            string = StringFormat(run[0].r_addr + s.addr, s.name, s.contents)
+            result += run[pos:s.addr]
+            result.append(parse_string_instruction(string))
+            strings.append(string)
+            pos = s.addr + len(s.contents)
+        result += run[pos:]
+
+        run = [inst] if is_byte else []
+        if inst is not None and not is_byte:
+            result.append(inst)
+    return result, strings
+
+
 class StringParser(Parser):
     """Finds all c-strings in nx sections of the disassembly. """
-    def __init__(self, config, project_name, disassembly_name):
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
         """Initializes a StringParser object.
 
         :config: A configuration file to read
         :project_name: The name of the project
         :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
 
         """
-        Parser.__init__(self, config, project_name, disassembly_name)
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
         self.log = logger.getLogger(__name__, config)
 
     def get_min_length(self):
@@ -111,12 +164,7 @@ class StringParser(Parser):
 
         for sec in non_exec_sections:
             self.find_and_add_strings(sec)
-
-        multi_disabled = self.config.getboolean('Debugging',
-                                                'disable_multiprocessing')
-        if not multi_disabled:
-            self.m_pool.close()
-            self.m_pool.join()
+        self.executor.wait()
 
     def find_and_add_strings(self, sec):
         """Given a section, finds all strings in it and adds them to the db.
@@ -132,23 +180,12 @@ class StringParser(Parser):
         min_length = self.get_min_length()
         strings = self.find_strings(sec.data, length=min_length)
 
-        multi_disabled = self.config.getboolean('Debugging',
-                                                'disable_multiprocessing')
-
-        # Spawn a new process to add n strings at a time
+        # Hand the executor n strings at a time
         n = 30
         for i in xrange(0, len(strings), n):
-            if multi_disabled:
-                add_strings(self.config, self.project_name,
-                            self.disassembly_name, sec.name,
-                            strings[i:i+n])
-            else:
-                self.m_pool.apply_async(add_strings,
-                                        args=(self.config,
-                                              self.project_name,
-                                              self.disassembly_name,
-                                              sec.name,
-                                              strings[i:i+n]))
+            self.executor.submit(add_strings, self.config, self.project_name,
+                                 self.disassembly_name, sec.name,
+                                 strings[i:i+n])
 
     def find_strings(self, data, length=5):
         """Given a blob of data, find all c-strings in it.
@@ -158,25 +195,17 @@ class StringParser(Parser):
         :returns: A list of StringFormats
 
         """
-        pattern = re.compile(r"[\x20-\x7e]{%d,}\x00" % (length-1))
-        # This is inefficient here but allows us
-        # to do multiprocessing separation well
-        result = []
-        for x in pattern.finditer(data):
-            contents = bytearray(x.group())
-            name = x.group()[:-1]  # set name to its contents (minus \x00)
-            addr = x.start()
-            result.append(StringFormat(addr, name, contents))
-        return result
-
-
-def make_parser(config, project_name, disassembly_name):
+        return find_strings(data, length)
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
     """Create a StringParser object.
 
     :config: A configuration file to read
     :project_name: The name of the project
     :disassembly_name: The name of the disassembly
+    :executor: The Executor to run tasks on
     :returns: A stringparser object
 
     """
-    return StringParser(config, project_name, disassembly_name)
+    return StringParser(config, project_name, disassembly_name, executor)
@@ -7,9 +7,12 @@ references to another part of the disassembly.
 
 '''
 
+import capstone
 from parser import Parser
 from disassembler_libs import logger
-from disassembler_libs.xref import Xref
+from disassembler_libs.heuristics_factory import HeuristicsFactory
+from disassembler_libs.xref import (Xref, XREF_CALL, XREF_JUMP, XREF_DATA,
+                                    XREF_STRING)
 from disassembler_libs.dbmanager import generate_db_manager
 from disassembler_libs.location import Location
 
@@ -63,59 +66,210 @@ def find_xref_loc(op, sections):
     return None
 
 
-def add_xrefs(config, project_name, disassembly_name, sec_name, sections):
+class XrefFinder(object):
+    """Finds the references that instructions' operands make."""
+
+    def __init__(self, sections, arch, mode, strings=None):
+        """Initializes an XrefFinder.
+
+        :sections: A list of section objects (used to check addr ranges)
+        :arch: The machine architecture of the disassembly
+        :mode: The mode of the arch
+        :strings: A list of the String labels of the disassembly, so that
+                  references to them can be told apart
+
+        """
+        self.sections = sections
+        self.heuristics = HeuristicsFactory(None, arch,
+                                            mode).create_heuristics()
+        self.md = capstone.Cs(arch, mode)
+        self.md.detail = True
+        if strings is None:
+            strings = []
+        self.strings = set((x.sec_name, x.r_addr) for x in strings)
+
+    def get_kind(self, inst, loc):
+        """Works out how an instruction uses an address it refers to.
+
+        :inst: The referencing Instruction
+        :loc: The Location it refers to
+        :returns: One of XREF_KINDS
+
+        """
+        if (loc.sec_name, loc.r_addr) in self.strings:
+            return XREF_STRING
+        return XREF_DATA
+
+    def decode(self, inst):
+        """Decodes an instruction again for the heuristics to look at.
+
+        Instructions only keep their bytes and operands. They're decoded
+        at their relative address, as the strategies decode them, so any
+        branch target comes out relative to the section too.
+
+        :inst: An Instruction, addressed relative to its section
+        :returns: A capstone CsInsn, or None if the bytes aren't valid
+
+        """
+        insts = list(self.md.disasm(str(inst.my_bytes), inst.r_addr, 1))
+        return insts[0] if len(insts) > 0 else None
+
+    def get_branch(self, inst):
+        """Works out where a direct call or jump goes.
+
+        :inst: An Instruction, addressed relative to its section
+        :returns: A (kind, target) tuple of XREF_CALL or XREF_JUMP and the
+                  relative address of the target, or (None, None) if the
+                  instruction isn't a direct branch
+
+        """
+        if self.heuristics is None:
+            return None, None
+        cs_inst = self.decode(inst)
+        if cs_inst is None:
+            return None, None
+        h = self.heuristics
+        if h.is_call(cs_inst):
+            kind, target = XREF_CALL, h.op_call_get_addr(cs_inst)
+        elif h.is_jump(cs_inst):
+            kind, target = XREF_JUMP, h.op_jump_get_addr(cs_inst)
+        elif h.is_conditional_jump(cs_inst):
+            kind, target = XREF_JUMP, h.op_conditional_jump_option(cs_inst)
+        else:
+            return None, None
+        # The strategy already worked the target out on the way in
+        if getattr(inst, 'target', None) is not None:
+            target = inst.target
+        return kind, target
+
+    def get_branch_loc(self, sec_name, target):
+        """Makes the Location a branch target refers to.
+
+        :sec_name: Name of the section the branch is in
+        :target: The target, relative to that section
+        :returns: None or a Location object
+
+        """
+        base_addr = [x.base_addr for x in self.sections
+                     if x.name == sec_name][0]
+        addr = target + base_addr
+        for s in self.sections:
+            if s.contains_addr(addr):
+                return Location('loc_%08x' % addr, addr - s.base_addr,
+                                s.name)
+        return None
+
+    def find(self, sec_name, inst):
+        """Finds the references one instruction makes.
+
+        A direct call or jump refers to its target through its immediate,
+        which holds the target relative to the section rather than an
+        address, so that immediate is never looked at as one.
+
+        :sec_name: Name of the section the instruction is in
+        :inst: An Instruction, addressed relative to its section
+        :returns: A list of (operand, Xref) tuples
+
+        """
+        found = []
+        if not inst.is_text:
+            return found
+        imms = [x for x in inst.operands if x['type'] == 'imm']
+        kind, target = None, None
+        if len(imms) > 0:
+            kind, target = self.get_branch(inst)
+        if kind is not None:
+            loc = None
+            if target is not None and 'xref' not in imms[0]:
+                loc = self.get_branch_loc(sec_name, target)
+            if loc is not None:
+                found.append((imms[0], Xref(inst.r_addr, sec_name, loc,
+                                            kind)))
+        for op in inst.operands:
+            if kind is not None and op['type'] == 'imm':
+                continue
+            loc = find_xref_loc(op, self.sections)
+            if loc is not None:
+                found.append((op, Xref(inst.r_addr, sec_name, loc,
+                                       self.get_kind(inst, loc))))
+        return found
+
+
+def add_xrefs(config, project_name, disassembly_name, sec_name, sections,
+              n=1000):
     """Creates xref objects and adds them to the db.
 
+    Each operand with an xref is given an 'xref' field, and the xrefs,
+    the locations they refer to and the changed operands are written n
+    instructions at a time.
+
     :config: A configuration file to read
     :project_name: The name of the project
     :disassembly_name: The name of the disassembly
     :sec_name: Name of the section we're looking through
     :sections: A list of section objects (used to check addr ranges)
+    :n: How many instructions to look through between writes
     :returns: None
 
     """
     log = logger.getLogger(__name__, config)
     db_man = generate_db_manager(config, project_name, disassembly_name)
+    base_addr = [x.base_addr for x in sections if x.name == sec_name][0]
+    finder = XrefFinder(sections, db_man.get_arch(), db_man.get_mode(),
+                        db_man.get_strings())
+
+    log.debug('Finding xrefs for: %s', sec_name)
+    xrefs = []
+    changed = []
+    for i, inst in enumerate(db_man.get_instructions(sec_name)):
+        # Records come back with absolute addresses
+        inst.r_addr -= base_addr
+        found = finder.find(sec_name, inst)
+        for op, xref in found:
+            # If it has a new xref, then edit the op to have it
+            op['xref'] = xref.ref_loc
+            xrefs.append(xref)
+        if len(found) > 0:
+            changed.append(inst)
+
+        if (i + 1) % n == 0 and len(xrefs) > 0:
+            write_xrefs(db_man, sec_name, xrefs, changed)
+            xrefs = []
+            changed = []
+    write_xrefs(db_man, sec_name, xrefs, changed)
+
+
+def write_xrefs(db_man, sec_name, xrefs, insts):
+    """Adds xrefs, their locations and the operands holding them to the db.
+
+    :db_man: The database manager to use
+    :sec_name: Name of the section the instructions are in
+    :xrefs: A list of Xref objects
+    :insts: A list of the Instructions whose operands gained xrefs
+    :returns: None
 
-    log.debug('Finding xrefs for: %s' % sec_name)
-    for inst in db_man.get_instructions(sec_name):
-        if not inst.is_text:
-            # Only look through executable instructions
-            continue
-
-        # A list for (possibly) modifed operands
-        operands = []
-        # For each operand in the instruction
-        for op in inst.operands:
-            loc = find_xref_loc(op, sections)
-            new_op = op
-            if loc is not None:
-                # if it has a new xref, then edit the op to have it
-                xref = Xref(inst.r_addr, sec_name, loc)
-                log.debug('Adding xref: %s' % xref)
-                db_man.add_xref(xref)  # TODO: bulk insert?
-
-                # If the reference isn't alread a loc, insert in db
-                db_man.add_location(loc)
-
-                new_op['xref'] = loc
-            operands.append(new_op)
-        if operands != inst.operands:
-            inst.operands = operands
-            db_man.add_instruction(sec_name, inst, update=True)
+    """
+    if len(xrefs) == 0:
+        return
+    db_man.batch_add_xrefs(xrefs)
+    db_man.batch_upsert_locations([x.ref_loc for x in xrefs])
+    db_man.batch_update_operands(sec_name, insts)
 
 
 class XrefParser(Parser):
     """Finds all c-strings in nx sections of the disassembly. """
-    def __init__(self, config, project_name, disassembly_name):
+    def __init__(self, config, project_name, disassembly_name,
+                 executor=None):
         """Initializes a StringParser object.
 
         :config: A configuration file to read
         :project_name: The name of the project
         :disassembly_name: The name of the disassembly
+        :executor: The Executor to run tasks on
 
         """
-        Parser.__init__(self, config, project_name, disassembly_name)
+        Parser.__init__(self, config, project_name, disassembly_name,
+                        executor)
         self.log = logger.getLogger(__name__, config)
 
     def run(self):
@@ -135,29 +289,14 @@ class XrefParser(Parser):
             self.log.debug('Section ranges: %s - [0x%08x-0x%08x]' %
                            (sec.name, sec.base_addr, sec.base_addr+sec.size))
 
-        multi_disabled = self.config.getboolean('Debugging',
-                                                'disable_multiprocessing')
-
         for sec in [x for x in sections if x.is_executable()]:
-            if multi_disabled:
-                add_xrefs(self.config, self.project_name,
-                          self.disassembly_name, sec.name,
-                          sections)
-            else:
-                self.m_pool.apply_async(add_xrefs,
-                                        args=(self.config,
-                                              self.project_name,
-                                              self.disassembly_name,
-                                              sec.name,
-                                              sections))
-
-        if not multi_disabled:
-            self.m_pool.close()
-            self.m_pool.join()
-
-
-def make_parser(db_man, disassembler, config):
+            self.executor.submit(add_xrefs, self.config, self.project_name,
+                                 self.disassembly_name, sec.name, sections)
+        self.executor.wait()
+
+
+def make_parser(config, project_name, disassembly_name, executor=None):
     '''
     Factory for XrefParser
     '''
-    return XrefParser(db_man, disassembler, config)
+    return XrefParser(config, project_name, disassembly_name, executor)
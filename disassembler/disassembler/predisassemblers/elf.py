@@ -1,13 +1,40 @@
 '''
-Uses heuristics to identify any missed functions in
-the disassembly and adds them to the database.
+Finds places in an ELF to start disassembling from.
+
+Besides the entry point, an ELF records many known code addresses: function
+symbols, constructor and destructor tables, PLT stubs and the ranges covered
+by .eh_frame unwind entries. Handing all of these to the strategy up front
+means a recursive disassembly starts with plenty of independent work.
 '''
 from predisassembler import Predisassembler
 import capstone
+import struct
 from disassembler_libs import logger
+from disassembler_libs.dbmanager import generate_db_manager
+from disassembler_libs.demangler import demangle
+from disassembler_libs.function import Function
+from disassembler_libs.dataobject import DataObject
+from disassembler_libs.location import Location
+from disassembler_libs.sectionmap import SectionMap
+from elftools.dwarf.callframe import FDE
+from elftools.elf.sections import SymbolTableSection
+
+# Sections holding tables of code pointers
+POINTER_TABLE_SECTIONS = ['.preinit_array', '.init_array', '.fini_array',
+                          '.ctors', '.dtors']
+
+# Sections holding PLT stubs
+PLT_SECTIONS = ['.plt', '.plt.got', '.plt.sec', '.iplt']
+
+# Size of the first (resolver) entry in .plt and of each stub after it,
+# used when the section header doesn't give an entry size
+PLT_LAYOUT = {capstone.CS_ARCH_X86: (16, 16),
+              capstone.CS_ARCH_ARM: (20, 12),
+              capstone.CS_ARCH_ARM64: (32, 16)}
+
 
 class ELFPredisassembler(Predisassembler):
-    """Uses heuristicsish techniques to find the address of main."""
+    """Uses heuristicsish techniques and ELF metadata to find code."""
 
     def __init__(self, config, project_name, disassembly_name, handler):
         """Initializes a FunctionParser object.
@@ -21,8 +48,233 @@ class ELFPredisassembler(Predisassembler):
         self.log = logger.getLogger(__name__)
 
     def run(self):
+        """Collects every seed address this ELF gives us.
+
+        :returns: A list of absolute addresses in executable sections
+
+        """
+        self.log.info('Predisassembling the ELF')
+        exe_map = SectionMap(self.handler.get_executable_sections())
+
+        seeds = []
+        for finder in [self.find_main, self.find_symbol_seeds,
+                       self.find_pointer_table_seeds, self.find_plt_seeds,
+                       self.find_eh_frame_seeds,
+                       self.find_code_pointer_seeds]:
+            try:
+                found = finder()
+            except Exception as e:
+                self.log.error('%s failed: %s' % (finder.__name__, str(e)))
+                continue
+            found = [x for x in found if exe_map.contains(x)]
+            self.log.info('%s found %d seeds' % (finder.__name__, len(found)))
+            seeds += found
+
+        # Drop duplicates, keeping the first occurrence so main stays first
+        unique = []
+        seen = set()
+        for x in seeds:
+            if x not in seen:
+                seen.add(x)
+                unique.append(x)
+        return unique
+
+    def persist(self):
+        """Imports the symbol tables as function, object and location labels,
+        names the PLT stubs, and adds the code pointers found in data
+        sections.
+
+        :returns: None
+
+        """
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        labels = self.get_symbol_labels() + self.get_plt_labels()
+        self.log.info('Importing %d symbols as labels' % len(labels))
+        db_man.batch_add_labels(labels)
+
+        pointers = self.find_code_pointers()
+        self.log.info('Adding xrefs for %d code pointers in data'
+                      % len(pointers))
+        self.persist_code_pointers(db_man)
+
+    def get_scan_sections(self):
+        """Returns the data sections that take up space in the file.
+
+        Sections like .bss have no contents to scan.
+
+        :returns: A list of Section objects
+
+        """
+        nobits = set(x.name for x in self.handler.parser.iter_sections()
+                     if x['sh_type'] == 'SHT_NOBITS')
+        return [x for x in self.handler.get_non_executable_sections()
+                if x.name not in nobits]
+
+    def get_symbol_labels(self):
+        """Turns every symbol into a label in the section that holds it.
+
+        Only the first symbol of each kind at an address is kept, so
+        aliases don't turn into duplicate functions.
+
+        :returns: A list of Function, DataObject and Location objects
+
+        """
+        sec_map = SectionMap(self.handler.get_sections())
+        symbols = self.handler.get_symbols()
+        names = demangle([x.name for x in symbols])
+
+        labels = []
+        seen = set()
+        for sym, name in zip(symbols, names):
+            sec = sec_map.find(sym.addr)
+            if sec is None or (sym.kind, sym.addr) in seen:
+                continue
+            seen.add((sym.kind, sym.addr))
+
+            r_addr = sym.addr - sec.base_addr
+            if sym.kind == 'func':
+                r_end_addr = r_addr + max(sym.size, 1) - 1
+                labels.append(Function(name, r_addr, r_end_addr, sec.name))
+            elif sym.kind == 'obj':
+                labels.append(DataObject(name, r_addr, sym.size, sec.name))
+            else:
+                labels.append(Location(name, r_addr, sec.name))
+        return labels
+
+    def get_plt_labels(self):
+        """Names each PLT stub after the import it jumps to, e.g. puts@plt.
+
+        The stubs are laid out in the same order as the relocations in
+        .rela.plt (or .rel.plt), after the resolver stub at the start of
+        .plt. Binaries built with IBT keep the stubs called by code in
+        .plt.sec instead, which has no resolver stub.
+
+        :returns: A list of Function objects
+
+        """
+        header, default_entsize = PLT_LAYOUT.get(self.handler.get_arch(),
+                                                 (0, 0))
+        relocs = (self.handler.parser.get_section_by_name('.rela.plt') or
+                  self.handler.parser.get_section_by_name('.rel.plt'))
+        plt = self.handler.parser.get_section_by_name('.plt.sec')
+        start = 0
+        if plt is None:
+            plt = self.handler.parser.get_section_by_name('.plt')
+            start = header
+        if relocs is None or plt is None or default_entsize == 0:
+            return []
+
+        symbols = self.handler.parser.get_section(relocs['sh_link'])
+        if not isinstance(symbols, SymbolTableSection):
+            return []
+        entsize = self.get_plt_entsize(plt)
+
+        labels = []
+        for i, rel in enumerate(relocs.iter_relocations()):
+            r_addr = start + i * entsize
+            if r_addr + entsize > plt['sh_size']:
+                break
+            name = symbols.get_symbol(rel['r_info_sym']).name
+            if name == '':
+                continue
+            labels.append(Function(name + '@plt', r_addr,
+                                   r_addr + entsize - 1, plt.name))
+        return labels
+
+    def find_symbol_seeds(self):
+        """Returns the address of every function in the symbol tables.
+
+        :returns: A list of absolute addresses
+
+        """
+        return [x.addr for x in self.handler.get_symbols()
+                if x.kind == 'func']
+
+    def find_pointer_table_seeds(self):
+        """Returns the entries of the constructor/destructor tables.
+
+        :returns: A list of absolute addresses
+
+        """
+        ptr_size = self.handler.get_pointer_size()
+        endian = '<' if self.handler.is_little_endian() else '>'
+        fmt = endian + ('Q' if ptr_size == 8 else 'I')
+
+        seeds = []
+        for name in POINTER_TABLE_SECTIONS:
+            sec = self.handler.parser.get_section_by_name(name)
+            if sec is None:
+                continue
+            data = sec.data()
+            for i in xrange(0, len(data) - ptr_size + 1, ptr_size):
+                seeds.append(struct.unpack(fmt, data[i:i + ptr_size])[0])
+        return seeds
+
+    def get_plt_entsize(self, sec):
+        """Works out the size of each stub in a PLT section.
+
+        Only the entry size in .plt.sec's header can be trusted - .plt
+        gives 4 on i386 and ARM, which is less than a stub.
+
+        :sec: The pyelftools section
+        :returns: The size in bytes, or 0 for an unknown architecture
+
+        """
+        default_entsize = PLT_LAYOUT.get(self.handler.get_arch(), (0, 0))[1]
+        if sec.name == '.plt.sec':
+            return sec['sh_entsize'] or default_entsize
+        return default_entsize
+
+    def find_plt_seeds(self):
+        """Returns the address of every PLT stub.
+
+        The stubs named by get_plt_labels are taken from there, so the
+        two always agree, and the other PLT sections are stepped through
+        a stub at a time.
+
+        :returns: A list of absolute addresses
+
+        """
+        header, default_entsize = PLT_LAYOUT.get(self.handler.get_arch(),
+                                                 (0, 0))
+        labels = self.get_plt_labels()
+        labelled = set(x.sec_name for x in labels)
+
+        seeds = []
+        for name in PLT_SECTIONS:
+            sec = self.handler.parser.get_section_by_name(name)
+            if sec is None or default_entsize == 0:
+                continue
+            base = sec['sh_addr']
+            seeds.append(base)
+            if name in labelled:
+                seeds += [base + x.r_start_addr for x in labels
+                          if x.sec_name == name]
+                continue
+            # Only .plt starts with the resolver stub
+            start = header if name == '.plt' else 0
+            seeds += range(base + start, base + sec['sh_size'],
+                           self.get_plt_entsize(sec))
+        return seeds
+
+    def find_eh_frame_seeds(self):
+        """Returns the start of every range covered by an .eh_frame FDE.
+
+        :returns: A list of absolute addresses
+
+        """
+        if self.handler.parser.get_section_by_name('.eh_frame') is None:
+            return []
+        dwarf = self.handler.parser.get_dwarf_info()
+        if not dwarf.has_EH_CFI():
+            return []
+        return [x.header['initial_location'] for x in dwarf.EH_CFI_entries()
+                if isinstance(x, FDE)]
+
+    def find_main(self):
         '''
-        This predisassembler will start disassembling linearly from the
+        This will start disassembling linearly from the
         entry point until the first or second call.
 
         Non-PIE'd _start:
@@ -86,8 +338,9 @@ class ELFPredisassembler(Predisassembler):
          4d1:   f4                      hlt
          4d2:   8b 1c 24                mov    ebx,DWORD PTR [esp]
          4d5:   c3                      ret
+
+        Returns a list holding the address of main if it was found.
         '''
-        self.log.info('Predisassembling the ELF')
         md = capstone.Cs(self.handler.get_arch(), self.handler.get_mode())
         md.detail = True
         # Doesn't work for now
@@ -102,7 +355,7 @@ class ELFPredisassembler(Predisassembler):
             if sec.contains_addr(addr_counter):
                 section = sec
         if not section:
-            return None
+            return []
         del sec
 
         abs_addr = addr_counter
@@ -178,5 +431,5 @@ class ELFPredisassembler(Predisassembler):
             # if we haven't found anything in n instructions, break
             if count == n:
                 break
-        return None
+        return []
 
@@ -0,0 +1,83 @@
+'''
+Finds pointers to code stored in data sections.
+
+Jump tables, vtables, callback arrays and the GOT all hold the addresses of
+code as plain pointer-sized words, which nothing that follows control flow
+will ever reach. Every aligned word of every data section is read at once
+as a numpy array and looked up in the map of executable sections, and the
+words that land in code become seeds, locations and data to code xrefs.
+'''
+
+import numpy as np
+from collections import namedtuple
+from disassembler_libs.sectionmap import SectionMap
+
+# A word in sec at relative address r_addr holding the absolute address
+# target, which is in the executable section target_sec
+CodePointer = namedtuple('CodePointer', 'sec r_addr target target_sec')
+
+
+def get_word_dtype(ptr_size, little_endian):
+    """Returns the numpy type of a pointer.
+
+    :ptr_size: The size of a pointer in bytes, 4 or 8
+    :little_endian: True if the binary is little endian
+    :returns: A numpy dtype
+
+    """
+    return np.dtype('%s%s' % ('<' if little_endian else '>',
+                              'u8' if ptr_size == 8 else 'u4'))
+
+
+def read_words(sec, dtype):
+    """Reads every aligned pointer-sized word of a section.
+
+    Words are aligned to their absolute address, not to the start of the
+    section.
+
+    :sec: The section to read
+    :dtype: The numpy type of a pointer, from get_word_dtype
+    :returns: A (relative addresses, values) tuple of numpy arrays
+
+    """
+    size = dtype.itemsize
+    start = -sec.base_addr % size
+    count = max(0, (sec.size - start) / size)
+    data = str(sec.data)[start:start + count * size]
+    values = np.frombuffer(data, dtype=dtype).astype(np.int64)
+    r_addrs = np.arange(count, dtype=np.int64) * size + start
+    return r_addrs, values
+
+
+def find_code_pointers(data_sections, exec_sections, ptr_size,
+                       little_endian, alignment=1):
+    """Finds the words in data sections that point into executable ones.
+
+    :data_sections: The sections to scan
+    :exec_sections: The executable sections pointers may land in
+    :ptr_size: The size of a pointer in bytes, 4 or 8
+    :little_endian: True if the binary is little endian
+    :alignment: The alignment instructions start on - pointers to code
+                that isn't aligned are ignored
+    :returns: A list of CodePointers, in section and address order
+
+    """
+    dtype = get_word_dtype(ptr_size, little_endian)
+    scanned = [s for s in data_sections if s.base_addr != 0 and s.size > 0]
+    if len(scanned) == 0:
+        return []
+
+    # Every word of every section, looked up in one go
+    words = [read_words(s, dtype) for s in scanned]
+    sec_index = np.concatenate([np.zeros(len(w[0]), dtype=np.int64) + i
+                                for i, w in enumerate(words)])
+    r_addrs = np.concatenate([w[0] for w in words])
+    values = np.concatenate([w[1] for w in words])
+
+    exe_map = SectionMap(exec_sections)
+    target_index = exe_map.find_indices(values)
+    hits = np.flatnonzero((target_index >= 0) & (values % alignment == 0))
+
+    return [CodePointer(scanned[sec_index[i]], int(r_addrs[i]),
+                        int(values[i]), exe_map.sections[target_index[i]])
+            for i in hits]
@@ -9,6 +9,9 @@ from disassembler_libs.dbmanager import generate_db_manager
 from disassembler_libs.heuristics_factory import HeuristicsFactory
 from bson.binary import Binary
 from disassembler_libs.instruction import Instruction
+from disassembler_libs.location import Location
+from disassembler_libs.xref import Xref
+from pointerscan import find_code_pointers
 
 
 class Predisassembler(object):
@@ -31,13 +34,96 @@ class Predisassembler(object):
         fact = HeuristicsFactory(config, self.handler.get_arch(),
                 self.handler.get_mode())
         self.heuristics = fact.create_heuristics()
+        self.code_pointers = None
 
     def run(self):
-        """Run the given parser. This should be implemented by all children.
-        It MUST return a list of addresses to start disassembly with."""
-        #return []
-        raise NotImplementedError
-    
+        """Run the given parser. Children should extend this.
+        It MUST return a list of addresses to start disassembly with.
+
+        By default only code pointers in data sections are found.
+
+        """
+        return self.find_code_pointer_seeds()
+
+    def persist(self):
+        """Adds anything found while predisassembling to the database.
+
+        This runs once the strategy has added the sections to the database,
+        since labels can't be added before the sections they belong to.
+        Children may extend this - by default the code pointers found in
+        data sections are added.
+
+        """
+        db_man = generate_db_manager(self.config, self.project_name,
+                                     self.disassembly_name)
+        self.persist_code_pointers(db_man)
+
+    def get_scan_sections(self):
+        """Returns the sections to look for code pointers in. Children may
+        override this to leave out sections with no data in the binary.
+
+        :returns: A list of Section objects
+
+        """
+        return self.handler.get_non_executable_sections()
+
+    def find_code_pointers(self):
+        """Finds the words in data sections that point to code.
+
+        The scan is only done once, for both run and persist.
+
+        :returns: A list of CodePointers (see pointerscan)
+
+        """
+        if self.code_pointers is None:
+            ptr_size = self.handler.get_pointer_size()
+            if ptr_size is None:
+                self.code_pointers = []
+            else:
+                self.code_pointers = find_code_pointers(
+                    self.get_scan_sections(),
+                    self.handler.get_executable_sections(),
+                    ptr_size, self.handler.is_little_endian(),
+                    self.heuristics.get_instruction_alignment())
+        return self.code_pointers
+
+    def find_code_pointer_seeds(self):
+        """Returns every address of code stored in a data section.
+
+        :returns: A list of absolute addresses
+
+        """
+        return [x.target for x in self.find_code_pointers()]
+
+    def persist_code_pointers(self, db_man):
+        """Adds a location for each code pointer's target and an xref from
+        the pointer to it.
+
+        :db_man: The database manager to use
+        :returns: None
+
+        """
+        xrefs = []
+        locs = {}
+        for ptr in self.find_code_pointers():
+            target_sec = ptr.target_sec
+            loc = Location('loc_%08x' % ptr.target,
+                           ptr.target - target_sec.base_addr,
+                           target_sec.name)
+            xrefs.append(Xref(ptr.r_addr, ptr.sec.name, loc))
+            locs[ptr.target] = loc
+        db_man.batch_upsert_locations([locs[x] for x in sorted(locs)])
+        db_man.batch_add_xrefs(xrefs)
+
+    def get_symbol_labels(self):
+        """Returns labels for the symbols in the binary. Children may
+        override this - by default there are none.
+
+        :returns: A list of Label objects
+
+        """
+        return []
+
     def get_instruction(self, inst):
         """Turns a MyCsInsn into our internal instruction object.
 
@@ -72,13 +158,28 @@ def make_predisassembler(config, project_name, disassembly_name, handler):
     """
     db_man = generate_db_manager(config, project_name, disassembly_name)
     dis = db_man.get_disassembly_record_current()
-    if dis['binary_format'] == "PE":
+    return make_format_predisassembler(dis['binary_format'], config,
+                                       project_name, disassembly_name,
+                                       handler)
+
+
+def make_format_predisassembler(binary_format, config, project_name,
+                                disassembly_name, handler):
+    """Creates the predisassembler for a binary format.
+
+    :binary_format: The format of the binary - 'ELF', 'PE' or 'MACHO'
+    :config: A configuration file to read
+    :project_name: The name of the project
+    :disassembly_name: The name of the disassembly
+    :handler: The BinHandler of the binary
+
+    """
+    if binary_format == "PE":
         return Predisassembler(config, project_name, disassembly_name, handler)
-    elif dis['binary_format'] == "ELF":
+    elif binary_format == "ELF":
         import elf
         return elf.ELFPredisassembler(config, project_name, disassembly_name, handler)
-    elif dis['binary_format'] == "MACHO":
+    elif binary_format == "MACHO":
         return Predisassembler(config, project_name, disassembly_name, handler)
     else:
         return Predisassembler(config, project_name, disassembly_name, handler)
-
@@ -0,0 +1,95 @@
+'''
+A strategy that picks how to disassemble each section from its entropy map.
+
+Normal code is disassembled recursively. An executable section that is
+mostly high entropy blocks - packed, compressed or encrypted - only has
+noise for capstone to decode, so it gets the cheap run non-executable
+sections get instead, and every byte of it is stored as data.
+'''
+
+from disassembler_libs import entropy, logger, metrics
+from disassembler_libs.attributes import Attributes
+from disassembler_libs.section import Section
+from recursive import Recursive
+
+# Used where there's no config to read, as in a MemoryDisassembler
+DEFAULT_HIGH_ENTROPY = 7.2
+DEFAULT_PACKED_FRACTION = 0.8
+
+
+def as_data_section(sec):
+    """Copies a section without its executable attribute.
+
+    Only the strategy sees the copy - the section in the database keeps
+    its attributes.
+
+    :sec: A Section object
+    :returns: A Section object that strategies will treat as data
+
+    """
+    attribs = Attributes(str(sec.attribs).replace('X', ''))
+    return Section(sec.name, sec.data, attribs, sec.base_addr, sec.size,
+                   blob=sec.blob)
+
+
+class Auto(Recursive):
+    """A recursive strategy that leaves packed sections as data. """
+
+    def get_option(self, option, default):
+        """Reads one of the strategy's options from the config.
+
+        :option: Name of the option in [Auto]
+        :default: Its value when there is no config
+        :returns: Its value
+
+        """
+        if self.config is None:
+            return default
+        return self.config.getfloat('Auto', option)
+
+    def is_packed(self, emap):
+        """Checks whether a section's entropy map looks packed.
+
+        :emap: The section's EntropyMap
+        :returns: True if enough of it is high entropy
+
+        """
+        high = self.get_option('high_entropy', DEFAULT_HIGH_ENTROPY)
+        fraction = self.get_option('packed_fraction', DEFAULT_PACKED_FRACTION)
+        return len(emap) > 0 and emap.get_fraction_above(high) >= fraction
+
+    def plan_sections(self, maps):
+        """Hands the packed executable sections over as data.
+
+        :maps: A dict of section name to the section's EntropyMap
+        :returns: The list of sections to disassemble
+
+        """
+        log = logger.getLogger(__name__, self.config)
+        planned = []
+        for sec in self.sections:
+            if sec.is_executable() and self.is_packed(maps[sec.name]):
+                log.info('Section %s looks packed - storing it as data'
+                         % sec.name)
+                metrics.incr('auto/data_sections')
+                sec = as_data_section(sec)
+            planned.append(sec)
+        return planned
+
+    def iter_instructions(self, sections):
+        """Plans the sections from their entropy maps, then recursively
+        disassembles them without touching the database.
+
+        :sections: The list of sections to disassemble
+        :returns: A generator of (section_name, Instruction) tuples
+
+        """
+        block_size = entropy.BLOCK_SIZE
+        if self.config is not None:
+            block_size = self.config.getint('Disassembler',
+                                            'entropy_block_size')
+        maps = dict((x.name, entropy.get_entropy_map(x.data, block_size))
+                    for x in sections)
+        self.sections = sections
+        self.sections = self.plan_sections(maps)
+        return Recursive.iter_instructions(self, self.sections)
@@ -9,20 +9,22 @@ import capstone
 from strategy import Strategy
 from disassembler_libs import logger
 from disassembler_libs.dbmanager import generate_db_manager
-import multiprocessing
 
 
-def dis_ex_sec(strat, config, proj_name, dis_name, sec):
+def dis_ex_sec(strat_cls, config, proj_name, dis_name, arch, mode, sec):
     """Disassemble an executable section.
 
-    :strat: An initialization of the strategy to use
+    :strat_cls: The class of the strategy to use
     :config: A configuration file to read
     :proj_name: The name of the project
     :dis_name: The name of the disassembly
+    :arch: The machine architecture of the disassembly
+    :mode: The mode of the arch
     :sec: The section to disassemble
     :returns: None
 
     """
+    strat = strat_cls(proj_name, dis_name, config, [sec], arch, mode, [])
     db_man = generate_db_manager(config, proj_name, dis_name)
     strat.disassemble_executable_section(db_man, sec)
 
@@ -41,6 +43,17 @@ class Linear(Strategy):
         log = logger.getLogger(__name__, self.config)
         log.info(('Disassembling executable section: '
                   '%s -- Length: %d' % (sec.name, sec.size)))
+
+        self.store_instructions(db_man, sec.name,
+                                self.iter_executable_section(sec))
+
+    def iter_executable_section(self, sec):
+        """Linearly disassembles an executable section.
+
+        :sec: The section to disassemble
+        :returns: A generator of Instruction objects
+
+        """
         md = capstone.Cs(self.arch, self.mode)
         md.detail = True
         # Doesn't work for now
@@ -50,11 +63,6 @@ class Linear(Strategy):
         addr_counter = 0x0000
         dis_gen = md.disasm(sec.data, addr_counter)
 
-        # Batch instruction insertion greatly speeds up our query time
-        # we're using a buffer that gets flushed to the db every n insts
-        inst_buff = []
-        count = 0
-        n = 200
         while True:
             inst = None
             try:
@@ -75,16 +83,7 @@ class Linear(Strategy):
             except StopIteration:
                 break
 
-            instruction = self.get_instruction(inst)  # Parent class method
-            inst_buff.append(instruction)
-            count += 1
-            if count % n == 0:
-                db_man.batch_add_instructions(sec.name, inst_buff)
-                inst_buff = []
-
-        # Flush anything left over
-        if len(inst_buff) > 0:
-            db_man.batch_add_instructions(sec.name, inst_buff)
+            yield self.get_instruction(inst)  # Parent class method
 
     # See parent for _disassemble_non_executable_section
 
@@ -95,26 +94,8 @@ class Linear(Strategy):
         :returns: None
 
         """
-        disable_multi = self.config.getboolean('Debugging',
-                                               'disable_multiprocessing')
-        if disable_multi:
-            for sec in sections:
-                dis_ex_sec(self, self.config, self.proj_name,
-                           self.dis_name, sec)
-        else:
-            p = multiprocessing.Pool(self.config.getint('General',
-                                                        'num_procs'))
-
-            # Setting self.sections is a Hack to prevent us
-            # from pickling every section when
-            # we do apply_async
-            saved = self.sections
-            for sec in sections:
-                self.sections = [sec]
-                p.apply_async(dis_ex_sec,
-                              args=(self, self.config, self.proj_name,
-                                    self.dis_name, sec))
-
-            p.close()
-            p.join()
-            self.sections = saved
+        for sec in sections:
+            self.executor.submit(dis_ex_sec, type(self), self.config,
+                                 self.proj_name, self.dis_name,
+                                 self.arch, self.mode, sec)
+        self.executor.wait()
@@ -4,14 +4,18 @@ Loosely based on the strategy defined in:
 http://techbus.safaribooksonline.com/book/software-engineering-and-development/software-testing/9781593273750/1dot-introduction-to-disassembly/the_how_of_disassembly?bookview=search&query=recursive
 '''
 
+import array
 import capstone
+import heapq
+import logging
+import numpy as np
 from strategy import Strategy
-from disassembler_libs import logger
+from disassembler_libs import diagnostics, logger, metrics
 from disassembler_libs.dbmanager import generate_db_manager
 from bson.binary import Binary
 from strategy import MyCsInsn
+from superset import Superset, MAX_INST_LEN
 import multiprocessing
-import traceback
 from ctypes import c_uint32
 
 
@@ -50,18 +54,49 @@ class SharedBitArray(object):
                        [bin(x).replace('0b', '').zfill(8) for x in arr] +
                        [')'])
 
+    def get_bytes(self, start, stop):
+        """Reads the bytes holding a range of bits in one go.
+
+        A Manager array is a proxy, so this is one round trip to the
+        manager rather than one per bit.
+
+        :start: The first bit
+        :stop: The bit after the last
+        :returns: A (first byte position, list of byte values) tuple
+
+        """
+        byte_start = start/8
+        return byte_start, list(self.array[byte_start:(stop + 7)/8])
+
     def __getitem__(self, key):
         if isinstance(key, slice):
-            indices = key.indices(self.bitlength)
-            return [self.getbit(x) for x in xrange(*indices)]
+            start, stop, step = key.indices(self.bitlength)
+            if step != 1:
+                return [self.getbit(x) for x in xrange(start, stop, step)]
+            byte_start, values = self.get_bytes(start, stop)
+            return [(values[x/8 - byte_start] >> (7 - (x % 8))) & 1
+                    for x in xrange(start, stop)]
         else:
             return self.getbit(key)
 
     def __setitem__(self, key, value):
         if isinstance(key, slice):
-            indices = key.indices(self.bitlength)
-            for x in xrange(*indices):
-                self.setbit(x, 1 if value else 0)
+            start, stop, step = key.indices(self.bitlength)
+            if step != 1:
+                for x in xrange(start, stop, step):
+                    self.setbit(x, 1 if value else 0)
+                return
+            if start >= stop:
+                return
+            byte_start, values = self.get_bytes(start, stop)
+            for x in xrange(start, stop):
+                bit = 1 << (7 - (x % 8))
+                if value:
+                    values[x/8 - byte_start] |= bit
+                else:
+                    values[x/8 - byte_start] &= ~bit
+            self.array[byte_start:byte_start + len(values)] = \
+                array.array('B', values)
         else:
             self.setbit(key, 1 if value else 0)
 
@@ -69,33 +104,123 @@ class SharedBitArray(object):
         return self.bitlength
 
 
-def dis_ex_sec(strat, config, proj_name, dis_name,
-               todo_queue, miss_counter, max_misses):
-    try:
-        strat.recurse(config, proj_name, dis_name,
-                      todo_queue, miss_counter, max_misses)
-    except Exception as e:
-        traceback.print_exc()
-        raise e
+class SectionBuffers(object):
+    """Buffers instructions by section, writing each in address order.
+
+    Recursive disassembly finds instructions in the order control flow
+    reaches them. Buffering per section and sorting before each flush
+    means each batch is at least inserted in address order.
+
+    """
+
+    def __init__(self):
+        self.buffers = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, sec_name, inst):
+        """Buffers an instruction.
+
+        :sec_name: The name of the section the instruction is in
+        :inst: An Instruction
+        :returns: None
+
+        """
+        if sec_name not in self.buffers:
+            self.buffers[sec_name] = []
+        self.buffers[sec_name].append(inst)
+        self.count += 1
+
+    def flush(self, strat, db_man):
+        """Writes every buffered instruction, one section at a time.
+
+        :strat: The strategy writing the instructions
+        :db_man: The database manager to use
+        :returns: None
+
+        """
+        for sec_name in sorted(self.buffers):
+            insts = self.buffers[sec_name]
+            insts.sort(key=lambda x: x.r_addr)
+            strat.flush_instructions(db_man, sec_name, insts)
+        self.buffers = {}
+        self.count = 0
+
+
+def dis_ex_sec(strat_cls, config, proj_name, dis_name, sections, arch, mode,
+               bitmaps, todo_queue, miss_counter, max_misses):
+    """Runs one recursive disassembly worker until it runs out of work.
+
+    :strat_cls: The class of the strategy to use
+    :config: A configuration file to read
+    :proj_name: The name of the project
+    :dis_name: The name of the disassembly
+    :sections: The list of sections being disassembled
+    :arch: The machine architecture of the disassembly
+    :mode: The mode of the arch
+    :bitmaps: A dict of section name to SharedBitArray of visited bytes
+    :todo_queue: The shared queue of addresses to disassemble from
+    :miss_counter: A shared count of empty polls of the queue
+    :max_misses: How many empty polls in a row before giving up
+    :returns: None
+
+    """
+    strat = strat_cls(proj_name, dis_name, config, sections,
+                      arch, mode, [])
+    strat.md = strat.make_md()
+    strat.bitmaps = bitmaps
+    strat.recurse(config, proj_name, dis_name,
+                  todo_queue, miss_counter, max_misses)
 
 
 class Recursive(Strategy):
 
+    def make_md(self):
+        """Creates the capstone disassembler used while recursing.
+
+        :returns: A capstone Cs object
+
+        """
+        md = capstone.Cs(self.arch, self.mode)
+        md.detail = True
+        # md.skipdata_setup = ('db', None, None)
+        md.skipdata = True
+        return md
+
+    def use_superset(self):
+        """Whether to walk superset decodings rather than call capstone
+        from every address reached.
+
+        :returns: True or False
+
+        """
+        return (self.config is not None and
+                self.config.getboolean('Recursive', 'superset'))
+
     def dis_executable_sections(self, sections):
         db_man = generate_db_manager(self.config,
                                      self.proj_name,
                                      self.dis_name)
 
         log = logger.getLogger(__name__, self.config)
+        if self.use_superset():
+            log.info('Recursively disassembling executable sections '
+                     'from their superset decoding.')
+            for sec, offsets, visited in self.superset_walk(sections):
+                self.store_instructions(db_man, sec.name,
+                                        self.iter_superset_section(sec,
+                                                                   offsets,
+                                                                   visited))
+            log.info('Finished recursively disassembling executable '
+                     'sections.')
+            return
+
         m_man = multiprocessing.Manager()
 
         log.info('Recursively disassembling executable sections.')
 
-        self.md = capstone.Cs(self.arch, self.mode)
-        self.md.detail = True
-        # md.skipdata_setup = ('db', None, None)
-        self.md.skipdata = True
-
         # create a bitmap of visited addresses per section
         self.bitmaps = dict()
 
@@ -114,60 +239,262 @@ class Recursive(Strategy):
         for x in self.entry_points:
             todo_queue.put(x)
 
-        enable_multi = not self.config.getboolean('Debugging',
-                                                  'disable_multiprocessing')
+        # TODO: Arbitrary metric, fix
         miss_multiplier = 3
+        num_workers = self.executor.num_workers
+        max_misses = num_workers*miss_multiplier
 
-        if enable_multi:
-            max_procs = self.config.getint('General',
-                                           'num_procs')
-
-            # TODO: Arbitrary metric, fix
-            max_misses = max_procs*miss_multiplier
-
-            procs = []
-            for x in range(max_procs):
-                p = multiprocessing.Process(target=dis_ex_sec,
-                                            args=(self,
-                                                  self.config,
-                                                  self.proj_name,
-                                                  self.dis_name,
-                                                  todo_queue,
-                                                  miss_counter,
-                                                  max_misses))
-                procs.append(p)
-                p.start()
-
-            for x in procs:
-                x.join()
-                x.terminate()
-        else:
-            self.recurse(self.config,
-                         self.proj_name,
-                         self.dis_name,
-                         todo_queue,
-                         miss_counter,
-                         1*miss_multiplier)
+        for x in range(num_workers):
+            self.executor.submit(dis_ex_sec, type(self), self.config,
+                                 self.proj_name, self.dis_name,
+                                 self.sections, self.arch, self.mode,
+                                 self.bitmaps, todo_queue,
+                                 miss_counter, max_misses)
+        self.executor.wait()
 
         # and go through the bitmap, adding everything else as data
-        inst_buff = []
         for sec in sections:
-            s = self.bitmaps[sec.name]
-            for index, byte in enumerate(sec.data):
-                if not s[index]:
-                    # MyCsInsn = namedtuple('MyCsInsn',
-                                            # 'address bytes mnemonic')
-                    tuple_inst = MyCsInsn(sec.base_addr + index,
-                                          Binary(str(byte)),
-                                          '.byte')
-                    instruction = self.get_instruction(tuple_inst)
-                    inst_buff.append(instruction)
-            if len(inst_buff) > 0:
-                db_man.batch_add_instructions(sec.name, inst_buff)
-                inst_buff = []
+            # Read the whole bitmap at once, not a byte at a time
+            visited = self.bitmaps[sec.name][:]
+            self.store_instructions(db_man, sec.name,
+                                    self.iter_unvisited(sec, visited))
 
+        m_man.shutdown()
+
+        if self.config.getboolean('Recursive', 'compact'):
+            for sec in sections:
+                db_man.compact_section(sec.name)
         log.info('Finished recursively disassembling executable sections.')
 
+    def superset_walk(self, sections):
+        """Recursively disassembles sections by walking their superset
+        decodings.
+
+        :sections: The list of executable sections to disassemble
+        :returns: A list of (section, offsets, visited) tuples - the sorted
+                  offsets of the instructions found and a bytearray of the
+                  bytes they cover
+
+        """
+        alignment = self.heuristics.get_instruction_alignment()
+        supersets = {}
+        visited = {}
+        starts = {}
+        found = {}
+        with self.executor.phase('superset_decode'):
+            for sec in sections:
+                supersets[sec.name] = Superset.decode(self.executor,
+                                                      self.arch, self.mode,
+                                                      sec, alignment)
+                visited[sec.name] = bytearray(sec.size)
+                starts[sec.name] = []
+                found[sec.name] = []
+
+        # Branches out of a section are walked in the next round
+        todo = list(self.entry_points)
+        while len(todo) > 0:
+            for addr in todo:
+                sec = self.get_section_by_addr(addr)
+                if sec is None:
+                    diagnostics.report(self.config, 'unmapped_target',
+                                       addr=hex(addr))
+                elif sec.name not in supersets:
+                    diagnostics.report(self.config, 'non_executable_target',
+                                       addr=hex(addr), section=sec.name)
+                else:
+                    starts[sec.name].append(addr - sec.base_addr)
+
+            todo = []
+            for sec in sections:
+                if len(starts[sec.name]) == 0:
+                    continue
+                offsets, targets = supersets[sec.name].walk(
+                    starts[sec.name], visited[sec.name])
+                starts[sec.name] = []
+                found[sec.name] += offsets
+                todo += targets
+
+        return [(sec, sorted(found[sec.name]), visited[sec.name])
+                for sec in sections]
+
+    def iter_superset_section(self, sec, offsets, visited):
+        """Yields a section's instructions and leftover bytes by address.
+
+        Only the instructions that were reached are decoded again, to get
+        their operands.
+
+        :sec: The section
+        :offsets: The sorted offsets of the instructions that were reached
+        :visited: A bytearray of the bytes the instructions cover
+        :returns: A generator of Instruction objects in address order
+
+        """
+        md = self.make_md()
+        data = str(sec.data)
+        unvisited = np.flatnonzero(np.frombuffer(str(visited),
+                                                 dtype=np.uint8) == 0)
+        merged = heapq.merge(((x, True) for x in offsets),
+                             ((x, False) for x in unvisited.tolist()))
+        for offset, is_code in merged:
+            if is_code:
+                window = data[offset:offset + MAX_INST_LEN]
+                for inst in md.disasm(window, offset, 1):
+                    yield self.get_instruction(inst)
+            else:
+                tuple_inst = MyCsInsn(offset, Binary(data[offset]), '.byte')
+                yield self.get_instruction(tuple_inst)
+
+    def iter_unvisited(self, sec, visited):
+        """Yields every byte of a section that wasn't disassembled, as data.
+
+        :sec: The section
+        :visited: A sequence with a true value for each visited byte
+        :returns: A generator of Instructions in address order
+
+        """
+        for index, byte in enumerate(sec.data):
+            if not visited[index]:
+                tuple_inst = MyCsInsn(index, Binary(str(byte)), '.byte')
+                yield self.get_instruction(tuple_inst)
+
+    def iter_range(self, sec, start, end, seeds):
+        """Recursively disassembles part of a section in this process.
+
+        Control flow is only followed while it stays in the range, and
+        every byte of the range that isn't reached comes back as data, so
+        the result can take the place of the range's old records.
+
+        :sec: The section
+        :start: Relative address of the start of the range (inclusive)
+        :end: Relative address of the end of the range (exclusive)
+        :seeds: Relative addresses to disassemble from, in the order to
+                try them - earlier seeds win where code overlaps
+        :returns: A generator of Instruction objects in address order
+
+        """
+        md = self.make_md()
+        data = sec.read(start, end)
+        visited = bytearray(len(data))
+        found = []
+
+        todo = list(reversed(seeds))
+        while len(todo) > 0:
+            rel_addr = todo.pop()
+            if not start <= rel_addr < start + len(data):
+                continue
+            for inst in md.disasm(data[rel_addr - start:], rel_addr):
+                offset = inst.address - start
+                if (inst.mnemonic == '.byte' or
+                        1 in visited[offset:offset + inst.size]):
+                    break
+                visited[offset:offset + inst.size] = '\x01' * inst.size
+                found.append((inst.address, self.get_instruction(inst)))
+
+                targets, falls_through = self.get_branch_targets(inst, sec)
+                todo.extend(reversed([x - sec.base_addr for x in targets]))
+                if not falls_through:
+                    break
+
+        found.sort()
+        unvisited = ((start + i, self.get_instruction(
+                          MyCsInsn(start + i, Binary(data[i]), '.byte')))
+                     for i in xrange(len(data)) if not visited[i])
+        for _, inst in heapq.merge(found, unvisited):
+            yield inst
+
+    def iter_instructions(self, sections):
+        """Recursively disassembles sections in this process without
+        touching the database.
+
+        Code is yielded in the order it is reached from the entry points,
+        followed by every byte of the executable sections that was never
+        reached and then the non-executable sections, all as data. With
+        superset decoding, each executable section is instead yielded in
+        address order, code and data together.
+
+        :sections: The list of sections to disassemble
+        :returns: A generator of (section_name, Instruction) tuples
+
+        """
+        md = self.make_md()
+
+        ex = [s for s in sections if s.is_executable()]
+        nx = [s for s in sections if not s.is_executable()]
+
+        if self.use_superset():
+            for sec, offsets, visited in self.superset_walk(ex):
+                for inst in self.iter_superset_section(sec, offsets, visited):
+                    yield sec.name, inst
+            for sec in nx:
+                for inst in self.iter_non_executable_section(sec):
+                    yield sec.name, inst
+            return
+
+        visited = dict((s.name, bytearray(s.size)) for s in ex)
+
+        todo = list(reversed(self.entry_points))
+        while len(todo) > 0:
+            abs_addr = todo.pop()
+            sec = self.get_exec_section_by_addr(abs_addr)
+            if sec is None:
+                continue
+
+            seen = visited[sec.name]
+            rel_addr = abs_addr - sec.base_addr
+            for inst in md.disasm(sec.data[rel_addr:], rel_addr):
+                # Stop at anything already visited, or at bytes that don't
+                # decode - they're left to be filled in as data below
+                if seen[inst.address] or inst.mnemonic == '.byte':
+                    break
+                seen[inst.address:inst.address + len(inst.bytes)] = \
+                    '\x01' * len(inst.bytes)
+
+                yield sec.name, self.get_instruction(inst)
+
+                targets, falls_through = self.get_branch_targets(inst, sec)
+                todo.extend(reversed(targets))
+                if not falls_through:
+                    break
+
+        for sec in ex:
+            for inst in self.iter_unvisited(sec, visited[sec.name]):
+                yield sec.name, inst
+
+        for sec in nx:
+            for inst in self.iter_non_executable_section(sec):
+                yield sec.name, inst
+
+    def get_branch_targets(self, inst, sec):
+        """Works out where execution can go after an instruction.
+
+        :inst: The capstone instruction, decoded at its relative address
+        :sec: The section the instruction is in
+        :returns: A (targets, falls_through) tuple - a list of absolute
+                  addresses to disassemble from and whether disassembly
+                  should carry on with the next instruction
+
+        """
+        if self.heuristics.is_conditional_jump(inst):
+            target = self.heuristics.op_conditional_jump_option(inst)
+            falls_through = True
+        elif self.heuristics.is_call(inst):
+            target = self.heuristics.op_call_get_addr(inst)
+            falls_through = False
+        elif self.heuristics.is_jump(inst):
+            target = self.heuristics.op_jump_get_addr(inst)
+            falls_through = False
+        elif self.heuristics.is_ret(inst):
+            return [], False
+        else:
+            return [], True
+
+        if target is None:
+            return [], falls_through
+
+        # The instruction was decoded at its address relative to the
+        # section, so its target is too
+        return [sec.base_addr + target], falls_through
+
     def get_section_by_addr(self, addr):
         for x in self.sections:
             if x.contains_addr(addr):
@@ -180,23 +507,6 @@ class Recursive(Strategy):
                 return x
         return None
 
-    def flush_rec_inst_buff(self, rec_inst_buff, db_man):
-        """Flush the Recursive instruction buffer to the database
-        :rec_inst_buff: A tuple of section_name inst
-        :db_man: The database manager to use
-
-        """
-        # Look at the first instruction and filter out
-        #  all belonging to that sec. Rinse, repeat.
-        # import ipdb; ipdb.set_trace()
-        while len(rec_inst_buff) > 0:
-            first_name = rec_inst_buff[0][0]
-            filt = [x[1] for x in rec_inst_buff
-                    if x[0] == first_name]
-            db_man.batch_add_instructions(first_name, filt)
-            rec_inst_buff = [x for x in rec_inst_buff
-                             if x[0] != first_name]
-
     def recurse(self, config, proj_name, dis_name,
                 todo_queue, miss_counter, max_misses):
         """Recursive disassembly
@@ -204,13 +514,17 @@ class Recursive(Strategy):
 
         """
         log = logger.getLogger(__name__, config)
-        # rec_inst_buff is a list of 2-length tuple
-        # containing (section_name, inst)
-        rec_inst_buff = []
+        # Per-instruction messages are only built when debugging, and then
+        # only for one in every debug_sample instructions
+        debug = log.isEnabledFor(logging.DEBUG)
+        debug_sample = logger.get_debug_sample(config)
+        num_insts = 0
+
+        rec_inst_buff = SectionBuffers()
 
         # how many items to insert into the db
         # at a time
-        batch_limit = 300
+        batch_limit = config.getint('Recursive', 'batch_limit')
 
         # shared_counter = self.shared_counter
         bitarray = self.bitmaps
@@ -220,16 +534,16 @@ class Recursive(Strategy):
                                      dis_name)
 
         while True:
-            log.debug('Starting Loop')
             # get the first addr from the queue
             abs_addr = 0
             try:
                 abs_addr = todo_queue.get(True, 1)
                 miss_counter.value = 0
             except:
-                self.flush_rec_inst_buff(rec_inst_buff, db_man)
+                rec_inst_buff.flush(self, db_man)
+                metrics.incr('recursive/queue_misses')
                 miss_counter.value += 1
-                log.debug('miss counter: %d' % miss_counter.value)
+                log.debug('miss counter: %d', miss_counter.value)
                 if miss_counter.value > max_misses:
                     return
                 continue
@@ -239,18 +553,16 @@ class Recursive(Strategy):
 
             if sec is None:
                 # we couldn't find the section with the address
-                log.debug('Did not find section for addr while disassembling!')
-                import ipdb
-                ipdb.set_trace()
+                diagnostics.report(config, 'unmapped_target',
+                                   addr=hex(abs_addr))
                 continue
 
             if not sec.is_executable():
                 # TODO: data section; don't care. But how did we get here?
                 # maybe malware mmaps this section?
                 # or rel jump interpreted wrong?
-                log.debug('Found non-executable section while disassembling!')
-                import ipdb
-                ipdb.set_trace()
+                diagnostics.report(config, 'non_executable_target',
+                                   addr=hex(abs_addr), section=sec.name)
                 continue
 
             # Disassemble things
@@ -260,90 +572,36 @@ class Recursive(Strategy):
             for inst in dis_gen:
                 # Verify we haven't been here
                 if bitarray[sec.name][inst.address]:
-                    log.debug('Already visited: %s' % hex(abs_addr))
+                    if debug:
+                        log.debug('Already visited: %x', abs_addr)
+                    break
+
+                # Bytes that don't decode are left to be filled in as data
+                if inst.mnemonic == '.byte':
                     break
 
                 bitarray[sec.name][inst.address:inst.address
                                    + len(inst.bytes)] = True
 
                 instruction = self.get_instruction(inst)  # Parent class method
-                rec_inst_buff.append([sec.name, instruction])
-
-                log.debug(''.join([
-                          hex(abs_addr), '/', hex(instruction.r_addr),
-                          '(', str(inst.address),
-                          '/', str(len(rec_inst_buff)), '/',
-                          # str(todo_queue.qsize()),')',
-                          instruction.mnemonic, ' ',
-                          ';'.join(str(x['op_str']) for x in
-                                   instruction.operands),
-                          ')']))
-
-                # TODO: check for xrefs to .text section
-                if self.heuristics.is_conditional_jump(inst):
-                    target = self.heuristics.op_conditional_jump_option(inst)
-
-                    if target is not None:
-                        import ipdb; ipdb.set_trace()
-
-                        # Test to see if this is a relative jump
-                        # TODO: Fix this to not just check exec.
-                        test_sec = self.get_exec_section_by_addr(target)
-                        if test_sec is None:
-                            target = sec.base_addr + target
-                            log.debug('Relative jump target: %x' % target)
-                        # print 'jX to '+str(target)
-                        todo_queue.put(target)
-
-                    # don't break,
-                    # continue after the conditional for the other option
-
-                elif self.heuristics.is_call(inst):
-                    import ipdb; ipdb.set_trace()
-                    target = self.heuristics.op_call_get_addr(inst)
-
-                    if target is not None:
-                        # print 'call to '+hex(target)
-
-                        # Test to see if this is a relative jump
-                        # TODO: Fix this to not just check exec.
-                        test_sec = self.get_exec_section_by_addr(target)
-                        if test_sec is None:
-                            target = sec.base_addr + target
-                            log.debug('Relative call target: %x' % target)
-
-                        todo_queue.put(target)
-                        # TODO: should we break? or should we continue
-                        #   after the call?
-                        # break
-                    break
-
-                    # else:
-                    #   # This was probably a 'call eax' type of setup,
-                    #   # it is highly likely that we should continue
-                    #   #   the linear sweep.
-                    #   pass
+                rec_inst_buff.add(sec.name, instruction)
 
-                elif self.heuristics.is_jump(inst):
-                    import ipdb; ipdb.set_trace(False)
-                    target = self.heuristics.op_jump_get_addr(inst)
+                num_insts += 1
+                if debug and num_insts % debug_sample == 0:
+                    log.debug('%x/%x(%d/%d/%s %s)', abs_addr,
+                              instruction.r_addr, inst.address,
+                              len(rec_inst_buff), instruction.mnemonic,
+                              ';'.join(str(x['op_str']) for x in
+                                       instruction.operands))
 
-                    if target is not None:
-                        # print 'jmp to '+hex(target)
-
-                        # Test to see if this is a relative jump
-                        # TODO: Fix this to not just check exec.
-                        test_sec = self.get_exec_section_by_addr(target)
-                        if test_sec is None:
-                            target = sec.base_addr + target
-                            log.debug('Relative jump target: %x' % target)
-
-                        todo_queue.put(target)
-
-                    # we can't continue in a linear fashion
-                    break
+                # TODO: check for xrefs to .text section
+                targets, falls_through = self.get_branch_targets(inst, sec)
+                for target in targets:
+                    if debug:
+                        log.debug('Branch target: %x', target)
+                    todo_queue.put(target)
 
-                elif self.heuristics.is_ret(inst):
+                if not falls_through:
                     break
 
                 abs_addr += len(inst.bytes)
@@ -353,8 +611,8 @@ class Recursive(Strategy):
             l = len(rec_inst_buff)
             if l != 0 and l > batch_limit:
                 log.debug('Inserting %i instructions into DB', l)
-                self.flush_rec_inst_buff(rec_inst_buff, db_man)
-                rec_inst_buff = []
+                metrics.observe('recursive/queue_depth', todo_queue.qsize())
+                rec_inst_buff.flush(self, db_man)
 
         return
 
@@ -7,25 +7,31 @@ from bson.binary import Binary
 from collections import namedtuple
 from disassembler_libs.instruction import Instruction
 from disassembler_libs.dbmanager import generate_db_manager
-from disassembler_libs import logger
-import multiprocessing
+from disassembler_libs import entropy, logger, metrics
+from disassembler_libs.executor import make_executor
 from disassembler_libs.heuristics_factory import HeuristicsFactory
 
 # Used to shovel data among functions internally
 MyCsInsn = namedtuple('MyCsInsn', 'address bytes mnemonic')
 
 
-def dis_nx_sec(strat, config, proj_name, dis_name, sec):
+def dis_nx_sec(strat_cls, config, proj_name, dis_name, arch, mode, sec):
     """Disassemble a non-executable section.
 
-    :strat: An initialization of the strategy to use
+    The strategy is rebuilt here from its parts so that only the section
+    being worked on has to be sent to the worker.
+
+    :strat_cls: The class of the strategy to use
     :config: A configuration file to read
     :proj_name: The name of the project
     :dis_name: The name of the disassembly
+    :arch: The machine architecture of the disassembly
+    :mode: The mode of the arch
     :sec: The section to disassemble
     :returns: None
 
     """
+    strat = strat_cls(proj_name, dis_name, config, [sec], arch, mode, [])
     db_man = generate_db_manager(config, proj_name, dis_name)
     strat.disassemble_non_executable_section(db_man, sec)
 
@@ -34,7 +40,7 @@ class Strategy(object):
     """A disassembly strategy - to be extended by children. """
 
     def __init__(self, project_name, dis_name,
-                 config, sections, arch, mode, entry_points):
+                 config, sections, arch, mode, entry_points, executor=None):
         """ Initializes a strategy object.
 
         :project_name: The name of the project
@@ -44,6 +50,8 @@ class Strategy(object):
         :arch: The machine architecture of the disassembly
         :mode: The mode of the arch
         :entry_point: The address of the original entry point in the bin
+        :executor: The Executor to run tasks on - by default one is made
+                   from the config
 
         """
         self.proj_name = project_name
@@ -53,6 +61,9 @@ class Strategy(object):
         self.arch = arch
         self.mode = mode
         self.entry_points = entry_points
+        self.executor = executor
+        if self.executor is None:
+            self.executor = make_executor(config)
         fact = HeuristicsFactory(config, arch, mode)
         self.heuristics = fact.create_heuristics()
 
@@ -66,14 +77,42 @@ class Strategy(object):
                                      self.proj_name,
                                      self.dis_name)
 
-        for sec in self.sections:
-            db_man.add_section(sec)
+        with self.executor.phase('add_sections'):
+            for sec in self.sections:
+                db_man.add_section(sec)
+        with self.executor.phase('byte_index'):
+            for sec in self.sections:
+                db_man.index_section_bytes(sec)
+        with self.executor.phase('entropy'):
+            block_size = self.config.getint('Disassembler',
+                                            'entropy_block_size')
+            maps = {}
+            for sec in self.sections:
+                maps[sec.name] = entropy.get_entropy_map(sec.data,
+                                                         block_size)
+                db_man.set_entropy_map(sec.name, maps[sec.name])
+        self.sections = self.plan_sections(maps)
 
         ex = [s for s in self.sections if s.is_executable()]
         nx = [s for s in self.sections if not s.is_executable()]
 
-        self.dis_executable_sections(ex)
-        self.dis_non_executable_sections(nx)
+        with self.executor.phase('executable'):
+            self.dis_executable_sections(ex)
+        with self.executor.phase('non_executable'):
+            self.dis_non_executable_sections(nx)
+
+    def plan_sections(self, maps):
+        """Decides how each section should be disassembled.
+
+        Executable sections are decoded and the rest turned into data, as
+        their attributes say. Children may hand some executable sections
+        over as data instead.
+
+        :maps: A dict of section name to the section's EntropyMap
+        :returns: The list of sections to disassemble
+
+        """
+        return self.sections
 
     def get_instruction(self, inst):
         """Turns a MyCsInsn or real CsInsn into our instruction object.
@@ -87,48 +126,131 @@ class Strategy(object):
         disp = None if is_text else 'bytes'
 
         operands = self.heuristics.process_operands(inst) if is_text else None
+        target = self.get_branch_target(inst) if is_text else None
 
         inst_ob = Instruction(inst.address,  # relative address
                               is_text,  # text or data
                               Binary(str(inst.bytes)),  # my_bytes
                               inst.mnemonic,  # mnemonic
                               operands,  # operands
-                              disp)  # how data should be displayed
+                              disp,  # how data should be displayed
+                              target)  # where a direct branch goes
 
         return inst_ob
 
-    def disassemble_non_executable_section(self, db_man, sec):
-        """Disassemble a non-executable section.
+    def get_branch_target(self, inst):
+        """Finds where a direct call or jump goes.
+
+        Instructions are decoded at their relative address, so the target
+        is relative too.
+
+        :inst: A capstone CsInsn
+        :returns: The relative address of the target, or None
+
+        """
+        if self.heuristics.is_call(inst):
+            return self.heuristics.op_call_get_addr(inst)
+        elif self.heuristics.is_jump(inst):
+            return self.heuristics.op_jump_get_addr(inst)
+        elif self.heuristics.is_conditional_jump(inst):
+            return self.heuristics.op_conditional_jump_option(inst)
+        return None
+
+    def iter_instructions(self, sections):
+        """Disassembles a list of sections without touching the database.
+
+        :sections: The list of sections to disassemble
+        :returns: A generator of (section_name, Instruction) tuples
+
+        """
+        for sec in sections:
+            if sec.is_executable():
+                insts = self.iter_executable_section(sec)
+            else:
+                insts = self.iter_non_executable_section(sec)
+            for inst in insts:
+                yield sec.name, inst
+
+    def iter_executable_section(self, sec):
+        """Disassembles an executable section. Should be implemented by
+        children.
 
-        :db_man: The database manager to use
         :sec: The section to disassemble
-        :returns: None
+        :returns: A generator of Instruction objects
 
         """
+        raise NotImplementedError()
 
-        log = logger.getLogger(__name__, self.config)
-        log.info(('Disassembling non_executable section: '
-                  '%s -- Length: %d' % (sec.name, sec.size)))
+    def iter_non_executable_section(self, sec):
+        """Turns every byte of a non-executable section into data.
 
-        # Batch instruction insertion greatly speeds up query time
-        inst_buff = []
-        count = 0
-        n = 200
+        :sec: The section to disassemble
+        :returns: A generator of Instruction objects
+
+        """
         for byte_counter, byte in enumerate(sec.data):
             # XXX: Real CsInsn are hard to make, so we're using a named
             # tuple here. Update as needed.
-            tuple_inst = MyCsInsn(sec.base_addr + byte_counter,
-                                       Binary(str(byte)),
-                                       '.byte')
-            instruction = self.get_instruction(tuple_inst)
+            tuple_inst = MyCsInsn(byte_counter,
+                                  Binary(str(byte)),
+                                  '.byte')
+            yield self.get_instruction(tuple_inst)
+
+    def store_instructions(self, db_man, sec_name, insts, n=200):
+        """Adds instructions to the database n at a time.
+
+        :db_man: The database manager to use
+        :sec_name: The name of the section the instructions belong to
+        :insts: An iterable of Instruction objects
+        :n: How many instructions to insert at once
+        :returns: None
+
+        """
+        # Batch instruction insertion greatly speeds up query time
+        inst_buff = []
+        for instruction in insts:
             inst_buff.append(instruction)
-            count += 1
-            if count % n == 0:
-                db_man.batch_add_instructions(sec.name, inst_buff)
+            if len(inst_buff) == n:
+                self.flush_instructions(db_man, sec_name, inst_buff)
                 inst_buff = []
 
         if len(inst_buff) > 0:
-            db_man.batch_add_instructions(sec.name, inst_buff)
+            self.flush_instructions(db_man, sec_name, inst_buff)
+
+    def flush_instructions(self, db_man, sec_name, insts):
+        """Adds a batch of instructions to the database and counts them.
+
+        :db_man: The database manager to use
+        :sec_name: The name of the section the instructions belong to
+        :insts: A list of Instruction objects
+        :returns: None
+
+        """
+        num_text = 0
+        num_bytes = 0
+        for inst in insts:
+            num_text += inst.is_text
+            num_bytes += len(inst.my_bytes)
+        metrics.incr('decode/bytes', num_bytes)
+        metrics.incr('decode/text_instructions', num_text)
+        metrics.incr('decode/data_instructions', len(insts) - num_text)
+        db_man.batch_add_instructions(sec_name, insts)
+
+    def disassemble_non_executable_section(self, db_man, sec):
+        """Disassemble a non-executable section.
+
+        :db_man: The database manager to use
+        :sec: The section to disassemble
+        :returns: None
+
+        """
+
+        log = logger.getLogger(__name__, self.config)
+        log.info(('Disassembling non_executable section: '
+                  '%s -- Length: %d' % (sec.name, sec.size)))
+
+        self.store_instructions(db_man, sec.name,
+                                self.iter_non_executable_section(sec))
 
     def dis_non_executable_sections(self, sections):
         """Disassemble a list of non-executable sections.
@@ -137,26 +259,8 @@ class Strategy(object):
         :returns: None
 
         """
-        disable_multi = self.config.getboolean('Debugging',
-                                               'disable_multiprocessing')
-        if disable_multi:
-            for sec in sections:
-                dis_nx_sec(self, self.config, self.proj_name,
-                           self.dis_name, sec)
-        else:
-            p = multiprocessing.Pool(self.config.getint('General',
-                                                        'num_procs'))
-
-            # Setting self.sections is a Hack to prevent us
-            # from pickling every section when
-            # we do apply_async
-            saved = self.sections
-            for sec in sections:
-                self.sections = [sec]
-                p.apply_async(dis_nx_sec,
-                              args=(self, self.config, self.proj_name,
-                                    self.dis_name, sec))
-
-            p.close()
-            p.join()
-            self.sections = saved
+        for sec in sections:
+            self.executor.submit(dis_nx_sec, type(self), self.config,
+                                 self.proj_name, self.dis_name,
+                                 self.arch, self.mode, sec)
+        self.executor.wait()
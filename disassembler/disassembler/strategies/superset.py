@@ -0,0 +1,183 @@
+'''
+Superset decoding: every offset of an executable section decoded once.
+
+Instead of calling capstone from every address recursive disassembly
+reaches, each offset of a section (at the architecture's instruction
+alignment) is decoded up front, in chunks spread over the executor's
+workers. What recursion needs to know about each offset is kept in numpy
+arrays:
+    length  The length of the instruction at the offset, 0 if it doesn't
+            decode
+    kind    One of the KIND_ values below
+    target  The absolute address a branch goes to, or -1 if it's unknown
+
+Walking control flow is then only a matter of looking these up.
+'''
+
+import capstone
+import numpy as np
+from disassembler_libs.heuristics_factory import HeuristicsFactory
+
+# No instruction of any architecture capstone knows is longer than this
+MAX_INST_LEN = 16
+
+KIND_INVALID = 0      # Doesn't decode
+KIND_PLAIN = 1        # Falls through to the next instruction
+KIND_COND_JUMP = 2    # Goes to its target or falls through
+KIND_JUMP = 3         # Goes to its target
+KIND_CALL = 4         # Goes to its target (calls are followed, not returned)
+KIND_RET = 5          # Goes nowhere we can tell
+
+# The kinds that carry on to the next instruction
+FALLS_THROUGH = [KIND_PLAIN, KIND_COND_JUMP]
+
+
+def classify(heuristics, inst):
+    """Works out the kind and branch target of an instruction.
+
+    :heuristics: The Heuristics of the architecture
+    :inst: A capstone instruction with details, decoded at its absolute
+           address
+    :returns: A (kind, target) tuple, target being None if unknown
+
+    """
+    if heuristics.is_conditional_jump(inst):
+        return KIND_COND_JUMP, heuristics.op_conditional_jump_option(inst)
+    elif heuristics.is_call(inst):
+        return KIND_CALL, heuristics.op_call_get_addr(inst)
+    elif heuristics.is_jump(inst):
+        return KIND_JUMP, heuristics.op_jump_get_addr(inst)
+    elif heuristics.is_ret(inst):
+        return KIND_RET, None
+    return KIND_PLAIN, None
+
+
+def decode_chunk(arch, mode, data, base_addr, size, alignment):
+    """Decodes every aligned offset of a chunk of a section.
+
+    Module-level so that process pools can pickle it.
+
+    :arch: The machine architecture
+    :mode: The mode of the arch
+    :data: The chunk's bytes, followed by up to MAX_INST_LEN more
+    :base_addr: The absolute address of the start of the chunk
+    :size: How many offsets of data belong to the chunk
+    :alignment: Decode only offsets that are a multiple of this
+    :returns: A (length, kind, target) tuple of numpy arrays of size size
+
+    """
+    md = capstone.Cs(arch, mode)
+    md.detail = True
+    heuristics = HeuristicsFactory(None, arch, mode).create_heuristics()
+
+    length = np.zeros(size, dtype=np.uint8)
+    kind = np.zeros(size, dtype=np.uint8)
+    target = np.full(size, -1, dtype=np.int64)
+
+    for offset in xrange(0, size, alignment):
+        window = data[offset:offset + MAX_INST_LEN]
+        for inst in md.disasm(window, base_addr + offset, 1):
+            length[offset] = inst.size
+            k, t = classify(heuristics, inst)
+            kind[offset] = k
+            if t is not None:
+                target[offset] = t
+    return length, kind, target
+
+
+class Superset(object):
+    """The superset decoding of one executable section."""
+
+    def __init__(self, sec, length, kind, target):
+        """Initializes a Superset.
+
+        :sec: The section that was decoded
+        :length: A uint8 numpy array of the instruction length at each
+                 offset, 0 where nothing decodes
+        :kind: A uint8 numpy array of the KIND_ of each offset
+        :target: An int64 numpy array of the absolute branch target of each
+                 offset, -1 where unknown
+
+        """
+        self.sec = sec
+        self.length = length
+        self.kind = kind
+        self.target = target
+
+    @classmethod
+    def decode(cls, executor, arch, mode, sec, alignment=1,
+               chunk_size=1 << 16):
+        """Decodes a section, a chunk per task on an executor.
+
+        :executor: The Executor to run the chunks on
+        :arch: The machine architecture
+        :mode: The mode of the arch
+        :sec: The section to decode
+        :alignment: The architecture's instruction alignment
+        :chunk_size: How many offsets each task decodes
+        :returns: A Superset
+
+        """
+        data = str(sec.data)
+        args = []
+        for start in xrange(0, sec.size, chunk_size):
+            size = min(chunk_size, sec.size - start)
+            args.append((arch, mode,
+                         data[start:start + size + MAX_INST_LEN],
+                         sec.base_addr + start, size, alignment))
+
+        # Decoding only returns what it found, so a chunk may be retried
+        chunks = executor.map(decode_chunk, args, idempotent=True)
+        if len(chunks) == 0:
+            empty = np.zeros(0, dtype=np.uint8)
+            return cls(sec, empty, empty.copy(), np.zeros(0, dtype=np.int64))
+        return cls(sec,
+                   np.concatenate([c[0] for c in chunks]),
+                   np.concatenate([c[1] for c in chunks]),
+                   np.concatenate([c[2] for c in chunks]))
+
+    def walk(self, starts, visited):
+        """Follows control flow through the section from some addresses.
+
+        Marks each instruction reached in visited, stopping at anything
+        already visited or that doesn't decode, just as recursive
+        disassembly does.
+
+        :starts: Offsets into the section to start from
+        :visited: A bytearray of the bytes already reached, which is
+                  updated
+        :returns: A tuple of a list of the offsets of the instructions
+                  found, in the order they were found, and a list of the
+                  absolute targets of branches that leave the section
+
+        """
+        # Lists are far quicker to index one item at a time than arrays
+        length = self.length.tolist()
+        kind = self.kind.tolist()
+        target = self.target.tolist()
+        size = len(length)
+
+        found = []
+        targets = []
+        todo = list(reversed(starts))
+        while len(todo) > 0:
+            offset = todo.pop()
+            while 0 <= offset < size:
+                n = length[offset]
+                if visited[offset] or n == 0:
+                    break
+                visited[offset:offset + n] = '\x01' * n
+                found.append(offset)
+
+                k = kind[offset]
+                if k != KIND_PLAIN and k != KIND_RET and target[offset] != -1:
+                    t = target[offset]
+                    if self.sec.contains_addr(t):
+                        todo.append(t - self.sec.base_addr)
+                    else:
+                        targets.append(t)
+
+                if k not in FALLS_THROUGH:
+                    break
+                offset += n
+        return found, targets
@@ -2,7 +2,7 @@
 
 import sys
 sys.path.append('../disassembler/')
-from disassembler_libs.dbmanager import DBManager
+from disassembler_libs.dbmanager import DBManager, VIEW_FIELDS
 
 cs_arch = {0: 'ARM',
            1: 'ARM64',
@@ -88,7 +88,66 @@ def get_op_str(op):
     raise TypeError
 
 
-def main(host, port, proj=None, disassembly=None, section=None):
+def get_pages(db_man, sec_name, addr=None, count=None, page_size=500):
+    """Yields the instructions of a section one page at a time.
+
+    :db_man: A DBManager with the disassembly loaded
+    :sec_name: Name of the section to show
+    :addr: Absolute address to start at, or None for the whole section
+    :count: Maximum number of instructions to show, or None for no limit
+    :page_size: Number of instructions to fetch per query
+    :returns: Instruction objects
+
+    """
+    fields = VIEW_FIELDS + ['my_bytes']
+    if addr is None:
+        page = db_man.get_next_page(sec_name, None, page_size, fields)
+    else:
+        row, page = db_man.get_window_at_addr(sec_name, addr, 0,
+                                              page_size, fields)
+    shown = 0
+    while len(page) > 0:
+        for dis in page:
+            if count is not None and shown >= count:
+                return
+            shown += 1
+            yield dis
+        page = db_man.get_next_page(sec_name, page[-1].r_addr,
+                                    page_size, fields)
+
+
+def print_stats(db_man, sections, top=10):
+    """Prints the summary statistics of a disassembly.
+
+    :db_man: A DBManager with the disassembly loaded
+    :sections: The Section objects to show statistics for
+    :top: How many of the most common mnemonics to show
+
+    """
+    stats = db_man.get_stats()
+    print("Statistics:")
+    print("%-20s %10s %8s %10s %8s %8s" % ('section', 'records', 'code',
+                                           'data runs', 'strings', 'xrefs'))
+    for sec in sections:
+        s = stats['sections'].get(sec.name)
+        if s is None:
+            continue
+        coverage = 0.0
+        if s['size'] > 0:
+            coverage = 100.0 * s['code_bytes'] / s['size']
+        print("%-20s %10d %7.2f%% %10d %8d %8d" % (sec.name, s['insts'],
+                                                   coverage, s['data_runs'],
+                                                   s['strings'], s['xrefs']))
+
+    mnemonics = stats['totals']['mnemonics']
+    common = sorted(mnemonics, key=lambda x: -mnemonics[x])[:top]
+    print("Most common mnemonics: %s" % ', '.join('%s (%d)' % (x, mnemonics[x])
+                                                   for x in common))
+    print("")
+
+
+def main(host, port, proj=None, disassembly=None, section=None,
+         addr=None, count=None):
     port = int(port)
     db_man = DBManager(host, port)
 
@@ -126,9 +185,13 @@ def main(host, port, proj=None, disassembly=None, section=None):
 
     # Then section name
     print("Sections:")
-    for sec in db_man.get_sections():
+    all_sections = db_man.get_sections()
+    for sec in all_sections:
         print("0x%08x-0x%08x\t[% 4s]\t%s" % (sec.base_addr,
               (sec.base_addr+sec.size), sec.attribs, sec.name))
+    print("")
+
+    print_stats(db_man, all_sections)
 
     """
     A. type=func
@@ -173,8 +236,15 @@ def main(host, port, proj=None, disassembly=None, section=None):
     mnemonic         : str
     """
 
-    for section in db_man.get_exec_sections():
-        for dis in db_man.get_disassembler_records(section.name):
+    if section is not None:
+        sections = [db_man.get_section(section)]
+        addr = int(addr, 0) if addr is not None else None
+        count = int(count) if count is not None else None
+    else:
+        sections = db_man.get_exec_sections()
+
+    for section in sections:
+        for dis in get_pages(db_man, section.name, addr, count):
             text = ""
             if dis.is_text:
 
@@ -212,9 +282,9 @@ def main(host, port, proj=None, disassembly=None, section=None):
             print(text)
 
 if __name__ == '__main__':
-    if len(sys.argv) > 5 or len(sys.argv) < 3:
-        print("Usage: %s host port project_name disassembly"
-              % (sys.argv[0]))
+    if len(sys.argv) > 8 or len(sys.argv) < 3:
+        print("Usage: %s host port project_name disassembly "
+              "[section [address [count]]]" % (sys.argv[0]))
         print(("If any of the arguments are left out, it will print "
                "the available options for that field."))
         sys.exit(1)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+'''
+Measures how fast a binary decodes, without the database.
+'''
+
+import sys
+import time
+sys.path.append('../disassembler/')
+from memdisassembler import MemoryDisassembler
+
+
+def main(binpath, strategy='linear', repeat=3):
+    md = MemoryDisassembler.from_path(binpath, strategy)
+    num_bytes = sum(len(s.data) for s in md.sections if s.is_executable())
+
+    best = None
+    count = 0
+    for x in xrange(int(repeat)):
+        start = time.time()
+        count = 0
+        text = 0
+        for sec_name, inst in md.instructions():
+            count += 1
+            text += inst.is_text
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print('%s (%s): %d instructions, %d text, %d executable bytes'
+          % (binpath, strategy, count, text, num_bytes))
+    print('best of %s: %.3fs -- %d insts/s, %.2f MB/s of code'
+          % (repeat, best, count / best, num_bytes / best / (1 << 20)))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        print("Usage: %s binary [linear|recursive|auto [repeat]]" % (sys.argv[0]))
+        sys.exit(1)
+    else:
+        main(*sys.argv[1:])